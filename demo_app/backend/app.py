@@ -8,6 +8,10 @@ from datetime import datetime
 import pandas as pd
 from io import BytesIO
 from pdf_process import process_single_pdf
+from template_registry import TemplateRegistry
+from chunk_index import ChunkIndex
+from reextraction import ReextractionManager
+from pdf_probe import probe
 
 app = Flask(__name__)
 CORS(app)
@@ -16,15 +20,27 @@ CORS(app)
 UPLOAD_FOLDER = 'uploads'
 SCHEMAS_FOLDER = 'schemas'
 RESULTS_FOLDER = 'results'
+TEMPLATES_FOLDER = 'templates'
+CHUNK_INDEX_FOLDER = 'chunk_index'
 ALLOWED_EXTENSIONS = {'pdf'}
 
 # Create necessary directories
-for folder in [UPLOAD_FOLDER, SCHEMAS_FOLDER, RESULTS_FOLDER]:
+for folder in [UPLOAD_FOLDER, SCHEMAS_FOLDER, RESULTS_FOLDER, TEMPLATES_FOLDER, CHUNK_INDEX_FOLDER]:
     os.makedirs(folder, exist_ok=True)
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 
+# Known form layouts learned from verified results
+template_registry = TemplateRegistry(TEMPLATES_FOLDER)
+
+# Per-document chunk index: long documents send the model only the chunks relevant to each field group.
+# Opt-in (CHUNK_RETRIEVAL=1) until its accuracy is measured against sending the whole document
+chunk_index = ChunkIndex(CHUNK_INDEX_FOLDER) if os.getenv('CHUNK_RETRIEVAL', '0') == '1' else None
+
+# Background re-extraction of stored results when a schema's fields change
+reextraction_manager = ReextractionManager(RESULTS_FOLDER, UPLOAD_FOLDER, template_registry, chunk_index)
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
@@ -67,6 +83,28 @@ def upload_files():
     except Exception as e:
         return jsonify({'error': f'Upload failed: {str(e)}'}), 500
 
+@app.route('/api/probe', methods=['POST'])
+def probe_pdf():
+    """Metadata-only probe of an uploaded session file or a PDF posted directly (which is not stored)"""
+    try:
+        if 'file' in request.files:
+            file = request.files['file']
+            if not file or not allowed_file(file.filename):
+                return jsonify({'error': 'Only PDF files are allowed'}), 400
+            return jsonify({'probe': probe(file.stream)})
+        
+        data = request.get_json(silent=True) or {}
+        if 'session_id' not in data:
+            return jsonify({'error': 'A file or a session ID is required'}), 400
+        
+        for filename in os.listdir(UPLOAD_FOLDER):
+            if filename.startswith(data['session_id']):
+                return jsonify({'probe': probe(os.path.join(UPLOAD_FOLDER, filename))})
+        return jsonify({'error': 'No file found for this session'}), 404
+    
+    except Exception as e:
+        return jsonify({'error': f'Probe failed: {str(e)}'}), 500
+
 @app.route('/api/schemas', methods=['GET'])
 def get_schemas():
     try:
@@ -97,6 +135,7 @@ def create_schema():
             'name': data['name'],
             'description': data.get('description', ''),
             'fields': data['fields'],
+            'version': 1,
             'created_at': datetime.now().isoformat(),
             'updated_at': datetime.now().isoformat()
         }
@@ -122,17 +161,27 @@ def update_schema(schema_id):
         with open(schema_file, 'r') as f:
             schema = json.load(f)
         
+        old_fields = schema['fields']
         schema.update({
             'name': data.get('name', schema['name']),
             'description': data.get('description', schema['description']),
             'fields': data.get('fields', schema['fields']),
+            'version': schema.get('version', 1) + 1,
             'updated_at': datetime.now().isoformat()
         })
         
         with open(schema_file, 'w') as f:
             json.dump(schema, f, indent=2)
         
-        return jsonify({'schema': schema, 'message': 'Schema updated successfully'})
+        # Stored results only need the added/changed fields re-extracted
+        job = reextraction_manager.start(schema, old_fields)
+        
+        return jsonify({
+            'schema': schema,
+            'reextraction_job': job['id'] if job else None,
+            'field_changes': job['diff'] if job else None,
+            'message': 'Schema updated successfully'
+        })
     
     except Exception as e:
         return jsonify({'error': f'Failed to update schema: {str(e)}'}), 500
@@ -151,6 +200,13 @@ def delete_schema(schema_id):
     except Exception as e:
         return jsonify({'error': f'Failed to delete schema: {str(e)}'}), 500
 
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = reextraction_manager.get_job(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify({'job': job})
+
 @app.route('/api/process', methods=['POST'])
 def process_pdfs():
     try:
@@ -181,13 +237,17 @@ def process_pdfs():
             return jsonify({'error': 'No file found for this session'}), 404
         
         # Process the single PDF using the new single PDF processor
-        result = process_single_pdf(uploaded_file, schema['fields'])
+        result = process_single_pdf(uploaded_file, schema['fields'], schema, template_registry=template_registry,
+                                    chunk_index=chunk_index)
         filename = os.path.basename(result['file_path']).replace(f'{session_id}_', '')
         
         results = [{
             'filename': filename,
             'data': result['data'],
             'status': result['status'],
+            'provenance': result.get('provenance', {}),
+            'template': result.get('template'),
+            'retrieval': result.get('retrieval'),
             'error': result.get('error')
         }]
         
@@ -198,6 +258,8 @@ def process_pdfs():
             'session_id': session_id,
             'schema_id': schema_id,
             'schema_name': schema['name'],
+            'schema_version': schema.get('version', 1),
+            'schema_fields': schema['fields'],
             'results': results,
             'processed_at': datetime.now().isoformat()
         }
@@ -256,6 +318,73 @@ def export_results(result_id):
     except Exception as e:
         return jsonify({'error': f'Export failed: {str(e)}'}), 500
 
+@app.route('/api/templates', methods=['GET'])
+def get_templates():
+    try:
+        return jsonify({
+            'templates': template_registry.list_templates(),
+            'stats': template_registry.summary()
+        })
+    except Exception as e:
+        return jsonify({'error': f'Failed to load templates: {str(e)}'}), 500
+
+@app.route('/api/templates', methods=['POST'])
+def create_template():
+    try:
+        data = request.get_json()
+        
+        if not data or 'result_id' not in data:
+            return jsonify({'error': 'Result ID is required'}), 400
+        
+        result_file = os.path.join(RESULTS_FOLDER, f"{data['result_id']}.json")
+        if not os.path.exists(result_file):
+            return jsonify({'error': 'Results not found'}), 404
+        
+        with open(result_file, 'r') as f:
+            result_data = json.load(f)
+        
+        # The uploaded PDF is still needed to locate the verified values
+        uploaded_file = None
+        for filename in os.listdir(UPLOAD_FOLDER):
+            if filename.startswith(result_data['session_id']):
+                uploaded_file = os.path.join(UPLOAD_FOLDER, filename)
+                break
+        
+        if not uploaded_file:
+            return jsonify({'error': 'No file found for this result'}), 404
+        
+        # Corrected values from the reviewer take precedence over the extracted ones
+        verified_data = dict(result_data['results'][0]['data'])
+        verified_data.update(data.get('data', {}))
+        
+        template = template_registry.learn(
+            uploaded_file,
+            verified_data,
+            name=data.get('name') or result_data['results'][0]['filename'],
+            source_result_id=result_data['id'],
+            field_definitions=result_data.get('schema_fields')
+        )
+        
+        return jsonify({
+            'id': template['id'],
+            'name': template['name'],
+            'fields': sorted(template['fields']),
+            'message': 'Template created successfully'
+        }), 201
+    
+    except Exception as e:
+        return jsonify({'error': f'Failed to create template: {str(e)}'}), 500
+
+@app.route('/api/templates/<template_id>', methods=['DELETE'])
+def delete_template(template_id):
+    try:
+        if not template_registry.delete(template_id):
+            return jsonify({'error': 'Template not found'}), 404
+        return jsonify({'message': 'Template deleted successfully'})
+    
+    except Exception as e:
+        return jsonify({'error': f'Failed to delete template: {str(e)}'}), 500
+
 @app.route('/api/reset/<session_id>', methods=['DELETE'])
 def reset_session(session_id):
     try:
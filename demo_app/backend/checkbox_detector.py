@@ -0,0 +1,199 @@
+import logging
+import time
+
+import fitz  # PyMuPDF
+
+from form_layout import (clean_words, phrase_after, row_question, heading_above, fix_ligatures, overlaps_row,
+                         is_instruction)
+
+logger = logging.getLogger(__name__)
+
+# Glyphs used for option boxes in flattened forms, and whether they denote a selection
+CHECKBOX_GLYPHS = {'☐': False, '□': False, '☑': True, '☒': True, '■': True, '⬛': True, '⊠': True}
+RADIO_GLYPHS = {'○': False, '◯': False, '❍': False, '●': True, '◉': True, '⦿': True}
+# Standalone check marks; they select the box they sit in or, on their own, the label next to them
+MARK_GLYPHS = {'✓', '✔', '✗', '✘', '×'}
+# ZapfDingbats encodes marks as plain letters ('4' is a check mark, 'l' a filled circle, ...)
+DINGBAT_FONTS = ('ZapfDingbats', 'ZaDb', 'Dingbats')
+DINGBAT_GLYPHS = {'4': ('mark', True), '8': ('mark', True), 'l': ('radio', True), 'n': ('checkbox', True),
+                  'o': ('checkbox', False), 'm': ('radio', False), 'q': ('checkbox', False)}
+
+# Size range (pt) and squareness of a vector shape that can be an option box
+MIN_BOX_SIZE = 5
+MAX_BOX_SIZE = 15
+MAX_ASPECT = 1.35
+
+
+def _is_dark(color):
+    return color is not None and sum(color) < 2.4
+
+
+def _square_enough(rect):
+    if not (MIN_BOX_SIZE <= rect.width <= MAX_BOX_SIZE and MIN_BOX_SIZE <= rect.height <= MAX_BOX_SIZE):
+        return False
+    return max(rect.width, rect.height) / min(rect.width, rect.height) <= MAX_ASPECT
+
+
+def _glyph_boxes(page):
+    """Option boxes and marks drawn as text glyphs"""
+    boxes, marks = [], []
+    text = page.get_text('rawdict')
+    for block in text['blocks']:
+        for line in block.get('lines', []):
+            for span in line['spans']:
+                dingbats = span['font'].startswith(DINGBAT_FONTS)
+                for char in span['chars']:
+                    c = char['c']
+                    rect = fitz.Rect(char['bbox'])
+                    if c in CHECKBOX_GLYPHS:
+                        boxes.append({'rect': rect, 'kind': 'checkbox', 'selected': CHECKBOX_GLYPHS[c], 'source': 'glyph'})
+                    elif c in RADIO_GLYPHS:
+                        boxes.append({'rect': rect, 'kind': 'radio', 'selected': RADIO_GLYPHS[c], 'source': 'glyph'})
+                    elif c in MARK_GLYPHS:
+                        marks.append(rect)
+                    elif dingbats and c in DINGBAT_GLYPHS:
+                        kind, selected = DINGBAT_GLYPHS[c]
+                        if kind == 'mark':
+                            marks.append(rect)
+                        else:
+                            boxes.append({'rect': rect, 'kind': kind, 'selected': selected, 'source': 'glyph'})
+    return boxes, marks
+
+
+def _vector_boxes(page):
+    """Option boxes (stroked squares and circles) and fill marks from the page's drawings"""
+    boxes, shapes = [], []
+    for drawing in page.get_drawings():
+        rect = drawing['rect']
+        filled = _is_dark(drawing.get('fill'))
+        stroked = _is_dark(drawing.get('color'))
+        if not (filled or stroked):
+            continue
+        shapes.append({'rect': rect, 'filled': filled})
+        if _square_enough(rect):
+            ops = {item[0] for item in drawing['items']}
+            kind = 'radio' if ops == {'c'} else 'checkbox'
+            # A solid square/disc on its own (⬛/●) is a selected box
+            boxes.append({'rect': rect, 'kind': kind, 'selected': filled and not stroked, 'source': 'vector'})
+    return boxes, shapes
+
+
+def _contains(outer, inner):
+    # Inner shape's centre inside outer box and clearly smaller than it
+    cx, cy = (inner.x0 + inner.x1) / 2, (inner.y0 + inner.y1) / 2
+    return outer.x0 <= cx <= outer.x1 and outer.y0 <= cy <= outer.y1 and \
+        inner.width * inner.height < 0.8 * outer.width * outer.height
+
+
+def _centre_inside(outer, word):
+    cx, cy = (word[0] + word[2]) / 2, (word[1] + word[3]) / 2
+    return outer.x0 <= cx <= outer.x1 and outer.y0 <= cy <= outer.y1
+
+
+def _merge_boxes(boxes, shapes, marks):
+    """Drop boxes nested in other boxes, merge duplicates and mark boxes that contain a fill or check mark"""
+    boxes.sort(key=lambda b: -b['rect'].width * b['rect'].height)
+    merged = []
+    for box in boxes:
+        rect = box['rect']
+        duplicate = next((m for m in merged if abs(m['rect'].x0 - rect.x0) < 3 and abs(m['rect'].y0 - rect.y0) < 3), None)
+        if duplicate is not None:
+            duplicate['selected'] = duplicate['selected'] or box['selected']
+            continue
+        if any(_contains(m['rect'], rect) for m in merged):
+            box = next(m for m in merged if _contains(m['rect'], rect))
+            box['selected'] = True  # nested solid shape is the box's fill mark
+            continue
+        merged.append(box)
+
+    for box in merged:
+        if box['selected']:
+            continue
+        if any(_contains(box['rect'], s['rect']) for s in shapes) or any(_contains(box['rect'], m) for m in marks):
+            box['selected'] = True
+    return merged
+
+
+def detect_page_selections(page, widget_rects=None):
+    """
+    Find checkbox/radio marks on one page and bind them to their label text.
+
+    Returns {'page', 'options', 'groups'}: every option with its label, kind, filled
+    state and source ('glyph' or 'vector'), and the options grouped under their question.
+    Boxes covered by AcroForm widgets are skipped; the widgets hold the real state.
+    """
+    glyph_boxes, marks = _glyph_boxes(page)
+    vector_boxes, shapes = _vector_boxes(page)
+    boxes = _merge_boxes(glyph_boxes + vector_boxes, shapes, marks)
+    if widget_rects:
+        boxes = [b for b in boxes if not any(b['rect'].intersects(r) for r in widget_rects)]
+
+    options = []
+    groups = {}
+    if boxes:
+        words = clean_words(page, [])
+        box_rects = [b['rect'] for b in boxes]
+        for box in sorted(boxes, key=lambda b: (round(b['rect'].y0), b['rect'].x0)):
+            rect = box['rect']
+            if box['source'] == 'vector' and any(_centre_inside(rect, w) for w in words) and \
+                    not any(_contains(rect, m) for m in marks):
+                continue  # framed text such as a numbered section badge, not an option box
+            row_words = [w for w in words if overlaps_row(rect, w)]
+            row_boxes = [r for r in box_rects if min(r.y1, rect.y1) > max(r.y0, rect.y0)]
+            next_x = min((r.x0 for r in row_boxes if r.x0 > rect.x0), default=page.rect.x1)
+            first_x = min(r.x0 for r in row_boxes)
+            label = fix_ligatures(phrase_after(row_words, rect, next_x))
+            if not label or is_instruction(label):
+                continue  # decoration or "please select below", not an option
+            question = row_question(row_words, first_x) or heading_above(words, rect, box_rects)
+            option = {
+                'label': label,
+                'kind': box['kind'],
+                'selected': box['selected'],
+                'source': box['source'],
+                'question': question,
+                'rect': tuple(round(v, 1) for v in rect),
+            }
+            options.append(option)
+            group = groups.setdefault(option['question'], {'question': option['question'], 'kind': box['kind'],
+                                                           'options': [], 'selected': []})
+            group['options'].append(label)
+            if box['selected']:
+                group['selected'].append(label)
+
+    return {'page': page.number + 1, 'options': options, 'groups': list(groups.values())}
+
+
+def detect_selections(doc, skip_pages=()):
+    """Run the detector over the pages of an open document (or a path); returns one map per page"""
+    if not isinstance(doc, fitz.Document):
+        with fitz.open(doc) as opened:
+            return detect_selections(opened, skip_pages)
+
+    start = time.perf_counter()
+    pages = []
+    for page in doc:
+        if page.number + 1 in skip_pages:
+            continue
+        widget_rects = [w.rect for w in page.widgets()] if doc.is_form_pdf else None
+        pages.append(detect_page_selections(page, widget_rects))
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    logger.info(f"Detected {sum(len(p['options']) for p in pages)} option marks on {len(pages)} pages "
+                f"in {elapsed_ms:.1f} ms")
+    return pages
+
+
+if __name__ == '__main__':
+    import sys
+
+    # Print the option-selection map and per-page timing for a PDF
+    logging.basicConfig(level=logging.INFO)
+    with fitz.open(sys.argv[1]) as pdf:
+        for page in pdf:
+            start = time.perf_counter()
+            selection_map = detect_page_selections(page)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            print(f"Page {selection_map['page']}: {len(selection_map['options'])} options in {elapsed_ms:.1f} ms")
+            for group in selection_map['groups']:
+                print(f"  {group['question'] or '(no question)'} [{group['kind']}]: "
+                      f"{group['selected']} of {group['options']}")
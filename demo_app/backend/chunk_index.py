@@ -0,0 +1,286 @@
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+import unicodedata
+import zlib
+from collections import Counter, OrderedDict
+
+import fitz  # PyMuPDF
+import numpy as np
+
+from prompt_compiler import count_tokens, field_key
+
+try:
+    import faiss
+except ImportError:  # optional; exact search with NumPy gives the same results on document-sized indexes
+    faiss = None
+
+logger = logging.getLogger(__name__)
+
+# Characters per chunk, and roughly how much of a chunk's end is repeated at the start of the next
+CHUNK_CHARS = int(os.getenv('CHUNK_CHARS', '800'))
+CHUNK_OVERLAP = int(os.getenv('CHUNK_OVERLAP', '150'))
+# Chunks retrieved per field; a field group is sent the union of its fields' chunks
+RETRIEVAL_TOP_K = int(os.getenv('RETRIEVAL_TOP_K', '3'))
+# Fields per model call, in schema order (neighbouring fields usually sit in the same section)
+RETRIEVAL_GROUP_SIZE = int(os.getenv('RETRIEVAL_GROUP_SIZE', '10'))
+# Smaller documents (approximate tokens of page text) are sent whole; retrieval would not shrink them
+RETRIEVAL_MIN_DOCUMENT_TOKENS = int(os.getenv('RETRIEVAL_MIN_DOCUMENT_TOKENS', '2000'))
+# The document is also sent whole when the chunks for all groups add up to more than this share of it
+RETRIEVAL_MAX_SHARE = float(os.getenv('RETRIEVAL_MAX_SHARE', '0.5'))
+# Embedder used by ChunkIndex: 'hashing' (offline, no model) or 'sentence-transformers:<model name>'
+DEFAULT_EMBEDDER = os.getenv('CHUNK_EMBEDDER', 'hashing')
+HASHING_DIMENSIONS = 1024
+# Documents kept loaded in memory; the rest are read back from disk on use
+LOADED_DOCUMENTS = 32
+
+_WORD = re.compile(r'[a-z0-9]+')
+# Fill-in rules ("______", "......") are cut to three characters; each one would otherwise be a token
+_FILL_RULE = re.compile(r'([_.\-])\1{3,}')
+
+
+class HashingEmbedder:
+    """
+    Offline embedder: words, word pairs and character trigrams hashed into a fixed-size
+    signed vector (log-scaled counts, L2-normalized). Trigrams keep near matches close,
+    e.g. a field name copied without its ligature ("formulaon") and the printed label.
+    """
+
+    def __init__(self, dimensions=HASHING_DIMENSIONS):
+        self.dimensions = dimensions
+        self.name = f'hashing-{dimensions}'
+
+    @staticmethod
+    def _features(text):
+        words = _WORD.findall(unicodedata.normalize('NFKC', text).lower())
+        features = Counter(words)
+        features.update(f'{a} {b}' for a, b in zip(words, words[1:]))
+        for word in words:
+            padded = f'#{word}#'
+            features.update(f'#{padded[i:i + 3]}' for i in range(len(padded) - 2))
+        return features
+
+    def embed(self, texts):
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature, count in self._features(text).items():
+                # crc32 is stable across processes, unlike hash(); its top bit picks the sign
+                digest = zlib.crc32(feature.encode('utf-8'))
+                sign = 1.0 if digest & 0x80000000 else -1.0
+                vectors[row, digest % self.dimensions] += sign * (1.0 + math.log(count))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+
+class SentenceTransformerEmbedder:
+    """Small on-CPU model from sentence-transformers (optional dependency, downloaded on first use)"""
+
+    def __init__(self, model_name='all-MiniLM-L6-v2'):
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(model_name, device='cpu')
+        self.dimensions = self.model.get_sentence_embedding_dimension()
+        self.name = f"st-{model_name.replace('/', '_')}"
+
+    def embed(self, texts):
+        return self.model.encode(list(texts), normalize_embeddings=True, convert_to_numpy=True).astype(np.float32)
+
+
+def get_embedder(spec=DEFAULT_EMBEDDER):
+    """Embedder for a CHUNK_EMBEDDER value"""
+    if spec == 'hashing':
+        return HashingEmbedder()
+    if spec.startswith('sentence-transformers:'):
+        return SentenceTransformerEmbedder(spec.split(':', 1)[1])
+    raise ValueError(f"Unknown embedder '{spec}'")
+
+
+def document_hash(file_path):
+    with open(file_path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _chunk(page_number, lines):
+    text = '\n'.join(lines)
+    return {'page': page_number, 'text': text, 'tokens': count_tokens(text)}
+
+
+def chunk_pages(doc, chunk_chars=CHUNK_CHARS, overlap=CHUNK_OVERLAP):
+    """Split each page's text into chunks of whole lines; chunks never span pages"""
+    chunks = []
+    for page in doc:
+        lines = [_FILL_RULE.sub(r'\1\1\1', line).strip() for line in page.get_text('text').splitlines()]
+        lines = [line for line in lines if line]
+        current, size = [], 0
+        for line in lines:
+            if current and size + len(line) > chunk_chars:
+                chunks.append(_chunk(page.number + 1, current))
+                # Carry the last lines over so a label and its value split at the boundary stay together
+                carried = []
+                while current and sum(len(kept) for kept in carried) + len(current[-1]) <= overlap:
+                    carried.insert(0, current.pop())
+                current, size = carried, sum(len(kept) + 1 for kept in carried)
+            current.append(line)
+            size += len(line) + 1
+        if current:
+            chunks.append(_chunk(page.number + 1, current))
+    return chunks
+
+
+def field_query(field_def):
+    """Retrieval query of a schema field: its name plus the description's location hint"""
+    description = field_def.get('description', '').strip()
+    if 'Location:' in description:
+        description = description.split('Location:')[-1].strip()
+    return f"{field_key(field_def)} {description}".strip()
+
+
+def format_excerpts(chunks):
+    return '\n\n'.join(f"[page {chunk['page']}]\n{chunk['text']}" for chunk in chunks)
+
+
+class ChunkIndex:
+    """
+    Persistent per-document chunk index for retrieval-augmented field extraction.
+
+    Each document's page text is chunked and embedded once; the vectors are stored in a
+    FAISS inner-product index (a NumPy array when faiss is not installed) next to the
+    chunk texts, under the SHA-256 of the PDF and the embedder name, so re-uploads and
+    re-extractions of the same file reuse the index.
+    """
+
+    def __init__(self, folder, embedder=None):
+        self.folder = folder
+        self.embedder = embedder or get_embedder()
+        os.makedirs(folder, exist_ok=True)
+        self._loaded = OrderedDict()
+        # Guards _loaded and _building; each document's build holds only its own lock
+        self._lock = threading.Lock()
+        self._building = {}
+
+    def _path(self, doc_hash, suffix):
+        return os.path.join(self.folder, f'{doc_hash}_{self.embedder.name}{suffix}')
+
+    def _save(self, entry):
+        if faiss is not None:
+            faiss.write_index(entry['index'], self._path(entry['doc_hash'], '.faiss'))
+        else:
+            np.save(self._path(entry['doc_hash'], '.npy'), entry['index'])
+        meta = {k: v for k, v in entry.items() if k != 'index'}
+        with open(self._path(entry['doc_hash'], '.json'), 'w') as f:
+            json.dump(meta, f)
+
+    def _load(self, doc_hash):
+        meta_path = self._path(doc_hash, '.json')
+        vectors_path = self._path(doc_hash, '.faiss' if faiss is not None else '.npy')
+        if not (os.path.exists(meta_path) and os.path.exists(vectors_path)):
+            return None
+        with open(meta_path, 'r') as f:
+            entry = json.load(f)
+        entry['index'] = faiss.read_index(vectors_path) if faiss is not None else np.load(vectors_path)
+        return entry
+
+    def _build(self, file_path, doc_hash):
+        with fitz.open(file_path) as doc:
+            chunks = chunk_pages(doc)
+            page_count = len(doc)
+        vectors = self.embedder.embed([chunk['text'] for chunk in chunks]) if chunks else None
+        if faiss is not None:
+            index = faiss.IndexFlatIP(self.embedder.dimensions)
+            if vectors is not None:
+                index.add(vectors)
+        else:
+            index = vectors if vectors is not None else np.zeros((0, self.embedder.dimensions), dtype=np.float32)
+        return {
+            'doc_hash': doc_hash,
+            'embedder': self.embedder.name,
+            'pages': page_count,
+            'chunks': chunks,
+            'document_tokens': sum(chunk['tokens'] for chunk in chunks),
+            'index': index,
+        }
+
+    def get(self, file_path):
+        """Index entry of a PDF, loaded from memory or disk, or built and stored; returns (entry, built)"""
+        doc_hash = document_hash(file_path)
+        with self._lock:
+            entry = self._cached(doc_hash)
+            if entry is not None:
+                return entry, False
+            document_lock = self._building.setdefault(doc_hash, threading.Lock())
+        # Other documents are indexed in parallel; a second request for this one waits for its build
+        with document_lock:
+            with self._lock:
+                entry = self._cached(doc_hash)
+            if entry is not None:
+                return entry, False
+            entry = self._load(doc_hash)
+            built = entry is None
+            if built:
+                entry = self._build(file_path, doc_hash)
+                self._save(entry)
+            with self._lock:
+                self._loaded[doc_hash] = entry
+                if len(self._loaded) > LOADED_DOCUMENTS:
+                    self._loaded.popitem(last=False)
+                self._building.pop(doc_hash, None)
+        return entry, built
+
+    def _cached(self, doc_hash):
+        # Caller holds self._lock
+        entry = self._loaded.get(doc_hash)
+        if entry is not None:
+            self._loaded.move_to_end(doc_hash)
+        return entry
+
+    def search(self, entry, queries, top_k=RETRIEVAL_TOP_K):
+        """Ids of the top_k chunks for each query, best first"""
+        count = len(entry['chunks'])
+        if not count or not queries:
+            return [[] for _ in queries]
+        top_k = min(top_k, count)
+        query_vectors = self.embedder.embed(queries)
+        if faiss is not None:
+            _, ids = entry['index'].search(query_vectors, top_k)
+            return [[int(i) for i in row if i >= 0] for row in ids]
+        scores = query_vectors @ entry['index'].T
+        best = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+        return [[int(i) for i in row[np.argsort(-scores[n, row])]] for n, row in enumerate(best)]
+
+    def retrieve(self, file_path, field_definitions, top_k=RETRIEVAL_TOP_K, group_size=RETRIEVAL_GROUP_SIZE):
+        """
+        Field groups with the chunks to send for each.
+
+        Returns {'groups': [{'fields', 'chunks'}], 'doc_hash', 'document_tokens', 'chunks_total',
+        'index_built', 'index_ms'} with each group's chunks in document order, or None when
+        the document should be sent whole: it has too little text (small or scanned), or the
+        groups' chunks together would not be much smaller than it.
+        """
+        start = time.perf_counter()
+        entry, built = self.get(file_path)
+        if entry['document_tokens'] < RETRIEVAL_MIN_DOCUMENT_TOKENS:
+            return None
+        ids = self.search(entry, [field_query(field_def) for field_def in field_definitions], top_k)
+        groups = []
+        for offset in range(0, len(field_definitions), max(1, group_size)):
+            chunk_ids = sorted({i for row in ids[offset:offset + group_size] for i in row})
+            groups.append({
+                'fields': field_definitions[offset:offset + group_size],
+                'chunks': [entry['chunks'][i] for i in chunk_ids],
+            })
+        sent_tokens = sum(chunk['tokens'] for group in groups for chunk in group['chunks'])
+        if sent_tokens > RETRIEVAL_MAX_SHARE * entry['document_tokens']:
+            return None
+        return {
+            'groups': groups,
+            'doc_hash': entry['doc_hash'],
+            'document_tokens': entry['document_tokens'],
+            'chunks_total': len(entry['chunks']),
+            'index_built': built,
+            'index_ms': round((time.perf_counter() - start) * 1000, 2),
+        }
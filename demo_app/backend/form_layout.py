@@ -0,0 +1,146 @@
+import re
+import unicodedata
+
+# Glyphs some form fonts emit in place of ligatures ("installaƟon", "PelleŸzer", "LeŌ side")
+LIGATURES = {'Ɵ': 'ti', 'Ÿ': 'ti', 'ƞ': 'tf', 'Ō': 'ft', 'Ʃ': 'tt',
+             'ﬁ': 'fi', 'ﬂ': 'fl', 'ﬀ': 'ff', 'ﬃ': 'ffi', 'ﬄ': 'ffl'}
+
+# Characters that decorate labels but carry no meaning for matching
+LABEL_NOISE = re.compile(r'[_☐☑☒□■●○◯◉⬛]+')
+_NON_WORD = re.compile(r'[^a-z0-9]+')
+
+# Max gap (pt) between words that belong to the same label phrase
+LABEL_GAP = 30
+# Max distance (pt) to look above a selection widget for its question heading
+HEADING_DISTANCE = 60
+# Min outdent (pt) of a heading that opens a section around the headings below it
+SECTION_INDENT = 5
+
+# Text next to a box that tells the reader what to tick rather than naming an option
+INSTRUCTION_LABEL = re.compile(r'\b(please|kindly)\s+(select|tick|choose|mark|check)\b'
+                               r'|\b(select|tick|choose|mark)\s+(below|above|one|all|any|the following)\b',
+                               re.IGNORECASE)
+
+
+def fix_ligatures(text, replacement=None):
+    """Replace ligature glyphs with their letters, or with replacement if given"""
+    for glyph, letters in LIGATURES.items():
+        text = text.replace(glyph, letters if replacement is None else replacement)
+    return text
+
+
+def normalize_label(text):
+    """Lowercase label text and reduce it to space separated alphanumeric tokens"""
+    text = unicodedata.normalize('NFKD', LABEL_NOISE.sub(' ', text)).lower()
+    return _NON_WORD.sub(' ', text).strip()
+
+
+def overlaps_row(rect, word):
+    """True if most of the word's height overlaps the rect's row"""
+    overlap = min(rect.y1, word[3]) - max(rect.y0, word[1])
+    return overlap >= 0.5 * (word[3] - word[1])
+
+
+def clean_words(page, text_rects):
+    """Words on the page with widget values and decoration removed"""
+    words = []
+    for word in page.get_text('words'):
+        width = (word[2] - word[0]) or 1
+        cy = (word[1] + word[3]) / 2
+        if any(r.y0 <= cy <= r.y1 and (min(r.x1, word[2]) - max(r.x0, word[0])) / width > 0.8 for r in text_rects):
+            continue  # filled-in value drawn inside a text widget
+        text = LABEL_NOISE.sub('', word[4]).strip()
+        if text:
+            words.append((word[0], word[1], word[2], word[3], text))
+    return words
+
+
+def phrase_before(row_words, x_limit):
+    """Contiguous words ending left of x_limit, read right to left"""
+    phrase = []
+    right_edge = x_limit
+    for word in sorted((w for w in row_words if w[0] < x_limit), key=lambda w: -w[2]):
+        if right_edge - word[2] > LABEL_GAP:
+            break
+        phrase.insert(0, word[4])
+        right_edge = word[0]
+    return ' '.join(phrase)
+
+
+def phrase_after(row_words, rect, x_limit):
+    """Contiguous words right of a widget and before x_limit (glyph boxes like "☐Yes" start under the widget)"""
+    phrase = []
+    left_edge = rect.x1
+    for word in sorted((w for w in row_words if w[2] > rect.x1 and w[0] >= rect.x0 - 2
+                        and (w[0] + w[2]) / 2 < x_limit), key=lambda w: w[0]):
+        if word[0] - left_edge > LABEL_GAP:
+            break
+        phrase.append(word[4])
+        left_edge = word[2]
+    return ' '.join(phrase)
+
+
+def row_question(row_words, x_limit):
+    """First phrase on the row, which is the question for forms laid out as 'Label: - [ ] Yes [ ] No'"""
+    phrase = []
+    left_edge = None
+    for word in sorted((w for w in row_words if (w[0] + w[2]) / 2 < x_limit), key=lambda w: w[0]):
+        if left_edge is not None and word[0] - left_edge > LABEL_GAP:
+            break
+        phrase.append(word[4])
+        left_edge = word[2]
+    return ' '.join(phrase)
+
+
+def is_instruction(label):
+    """True for box text such as "Any addition please select below," that is not an answer"""
+    return bool(INSTRUCTION_LABEL.search(label))
+
+
+def heading_lines(words, selection_rects):
+    """Text lines that are not rows of options, as (x0, y0, y1, text) from top to bottom"""
+    lines = []
+    for word in sorted(words, key=lambda w: (w[1], w[0])):
+        if any(min(r.y1, word[3]) - max(r.y0, word[1]) > 0 for r in selection_rects):
+            continue
+        line = lines[-1] if lines else None
+        if line and abs(word[1] - line[1]) < 2 and abs(word[3] - line[2]) < 2:
+            line[0] = min(line[0], word[0])
+            line[3].append(word)
+        else:
+            lines.append([word[0], word[1], word[3], [word]])
+    return [(x0, y0, y1, ' '.join(w[4] for w in sorted(line, key=lambda w: w[0]))) for x0, y0, y1, line in lines]
+
+
+def section_headings(lines, rect):
+    """
+    Headings over a selection widget, innermost first: the nearest line above it (its
+    question), then every line further up that is outdented from the last one found,
+    such as "Scope of supply" over "Extruder supplier scope:" and its options.
+    """
+    headings = []
+    left = rect.x0 + SECTION_INDENT
+    for x0, y0, y1, text in reversed(lines):
+        if y1 > rect.y0 + 1 or x0 > left:
+            continue
+        if not headings and rect.y0 - y1 > HEADING_DISTANCE:
+            break
+        headings.append(text)
+        left = x0 - SECTION_INDENT
+    return headings
+
+
+def heading_above(words, rect, selection_rects):
+    """Nearest text line above a selection widget that is not itself a row of options"""
+    nearest = None
+    for word in words:
+        if word[3] > rect.y0 + 1 or rect.y0 - word[3] > HEADING_DISTANCE or word[0] > rect.x0 + 5:
+            continue
+        if any(min(r.y1, word[3]) - max(r.y0, word[1]) > 0 for r in selection_rects):
+            continue
+        if nearest is None or word[1] > nearest[1]:
+            nearest = word
+    if nearest is None:
+        return ''
+    line = [w for w in words if abs(w[1] - nearest[1]) < 2 and abs(w[3] - nearest[3]) < 2]
+    return ' '.join(w[4] for w in sorted(line, key=lambda w: w[0]))
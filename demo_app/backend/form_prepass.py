@@ -0,0 +1,262 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left
+from collections import OrderedDict
+from difflib import SequenceMatcher
+
+import fitz  # PyMuPDF
+
+from form_layout import (fix_ligatures, normalize_label, overlaps_row, clean_words, phrase_before,
+                         phrase_after, row_question, heading_lines, section_headings, is_instruction)
+from checkbox_detector import detect_selections
+from prompt_compiler import field_key
+
+logger = logging.getLogger(__name__)
+
+# Minimum label similarity for a schema field to be answered from a widget
+MATCH_THRESHOLD = 0.85
+# Documents whose candidates and field matches are kept in memory, so a form processed again
+# skips PyMuPDF and the label scoring
+CANDIDATE_CACHE_SIZE = int(os.getenv('FORM_PREPASS_CACHE_SIZE', '64'))
+
+OFF_VALUES = {None, '', 'Off', 'off', False, 'No', 'no', '0'}
+
+SELECTION_TYPES = {fitz.PDF_WIDGET_TYPE_CHECKBOX, fitz.PDF_WIDGET_TYPE_RADIOBUTTON}
+
+_candidate_cache = OrderedDict()
+_candidate_cache_lock = threading.Lock()
+
+
+def label_forms(text):
+    """Normalized variants of a label; schema names are often copied with the ligature glyph dropped"""
+    forms = {normalize_label(fix_ligatures(text)), normalize_label(fix_ligatures(text, ''))}
+    return [form for form in forms if form]
+
+
+def label_similarity(target, candidate, matcher=None):
+    """Score how well a normalized field name matches a normalized label (0..1)"""
+    if candidate == target or candidate.replace(' ', '') == target.replace(' ', ''):
+        return 1.0
+    target_tokens = target.split()
+    candidate_tokens = candidate.split()
+    extra = len(candidate_tokens) - len(target_tokens)
+    if set(target_tokens) <= set(candidate_tokens) and extra <= 3:
+        # Field name contained in a longer label ("city" in "City/Town")
+        return 0.9 - 0.01 * extra
+    # Upper bound of SequenceMatcher.ratio() from the lengths alone
+    if 2 * min(len(target), len(candidate)) / (len(target) + len(candidate)) < MATCH_THRESHOLD:
+        return 0.0
+    if matcher is None:
+        matcher = SequenceMatcher(None, b=target)
+    matcher.set_seq1(candidate)
+    if matcher.quick_ratio() < MATCH_THRESHOLD:
+        return 0.0
+    return matcher.ratio()
+
+
+def _is_on(value):
+    return value not in OFF_VALUES
+
+
+def _candidate(kind, labels, name, value, page_number, options=None, source='widget'):
+    candidate = {
+        'kind': kind,
+        'labels': [label for label in labels if label],
+        'name': name or '',
+        'value': value,
+        'page': page_number,
+        'source': source,
+    }
+    if options is not None:
+        candidate['options'] = options
+    # Normalized label forms with their weight; generated widget names ("undefined_2",
+    # "toggle_1") are less trustworthy than printed labels, so labels win ties
+    candidate['forms'] = [(form, 1.0) for label in candidate['labels'] for form in label_forms(label)]
+    candidate['forms'] += [(form, 0.9) for form in label_forms(candidate['name'])]
+    return candidate
+
+
+def collect_widget_candidates(doc):
+    """Build matchable candidates (text widgets, checkboxes, radio and checkbox groups) from a PDF"""
+    candidates = []
+    for page in doc:
+        widgets = [(w.field_type, w.field_name, w.field_value, fitz.Rect(w.rect), w.on_state()
+                    if w.field_type in SELECTION_TYPES else None) for w in page.widgets()]
+        if not widgets:
+            continue
+        text_rects = [w[3] for w in widgets if w[0] not in SELECTION_TYPES]
+        selection_rects = [w[3] for w in widgets if w[0] in SELECTION_TYPES]
+        words = sorted(clean_words(page, text_rects), key=lambda w: w[1])
+        lines = heading_lines(words, selection_rects)
+        page_number = page.number + 1
+        radio_groups = {}
+        checkbox_groups = {}
+        # Widgets on one row share its words, found among those starting less than a word height above it
+        tops = [w[1] for w in words]
+        tallest = max((w[3] - w[1] for w in words), default=0)
+        rows = {}
+
+        for field_type, field_name, value, rect, on_state in widgets:
+            if (rect.y0, rect.y1) not in rows:
+                nearby = words[bisect_left(tops, rect.y0 - tallest):bisect_left(tops, rect.y1)]
+                rows[rect.y0, rect.y1] = [w for w in nearby if overlaps_row(rect, w)]
+            row_words = rows[rect.y0, rect.y1]
+            next_x = min((r.x0 for _, _, _, r, _ in widgets
+                          if r.x0 > rect.x0 and min(r.y1, rect.y1) > max(r.y0, rect.y0)), default=page.rect.x1)
+            if isinstance(value, str):
+                value = unicodedata.normalize('NFKC', value)
+
+            if field_type in SELECTION_TYPES:
+                option = fix_ligatures(phrase_after(row_words, rect, next_x))
+                if not option:
+                    # Fall back to the export value, dropping generated suffixes like "Yes_6"
+                    option = re.sub(r'_\d+$', '', str(on_state or field_name or ''))
+                if is_instruction(option):
+                    continue  # "Any addition please select below," is not an answer
+                # The question sits left of the first option on the row, or on the line above; an option
+                # under a heading also belongs to the sections that heading is nested in
+                first_x = min(r.x0 for r in selection_rects if min(r.y1, rect.y1) > max(r.y0, rect.y0))
+                question = row_question(row_words, first_x)
+                sections = [] if question else section_headings(lines, rect)
+                question = question or (sections[0] if sections else '')
+                entry = {'option': option, 'selected': _is_on(value)}
+                if field_type == fitz.PDF_WIDGET_TYPE_RADIOBUTTON:
+                    group = radio_groups.setdefault(field_name, {'question': question, 'options': []})
+                    group['options'].append(entry)
+                else:
+                    candidates.append(_candidate('checkbox', [option], fix_ligatures(field_name or ''),
+                                                 entry['selected'], page_number))
+                    for heading in [question] + sections[1:]:
+                        checkbox_groups.setdefault(heading, []).append(entry)
+            else:
+                near_label = phrase_before(row_words, rect.x0)
+                question = row_question(row_words, rect.x0)
+                labels = [near_label]
+                if question and question != near_label:
+                    labels.append(f"{question} {near_label}")
+                if isinstance(value, str):
+                    value = value.strip() or None
+                candidates.append(_candidate('text', labels, field_name, value, page_number))
+
+        for name, group in radio_groups.items():
+            selected = [o['option'] for o in group['options'] if o['selected']]
+            candidates.append(_candidate('radio_group', [group['question']], name,
+                                         selected[0] if selected else None, page_number,
+                                         options=[o['option'] for o in group['options']]))
+        for question, options in checkbox_groups.items():
+            if not question or len(options) < 2:
+                continue
+            candidates.append(_candidate('checkbox_group', [question], '',
+                                         [o['option'] for o in options if o['selected']], page_number,
+                                         options=[o['option'] for o in options]))
+    return candidates
+
+
+def collect_mark_candidates(doc, skip_pages=()):
+    """Build candidates from checkbox/radio marks drawn on flattened pages (glyphs or vector shapes)"""
+    candidates = []
+    for page_map in detect_selections(doc, skip_pages):
+        for option in page_map['options']:
+            if option['kind'] == 'checkbox':
+                candidates.append(_candidate('checkbox', [option['label']], '', option['selected'],
+                                             page_map['page'], source='mark'))
+        for group in page_map['groups']:
+            if not group['question']:
+                continue
+            if group['kind'] == 'radio' or (len(group['options']) == 2 and 'Yes' in group['options']):
+                value = group['selected'][0] if group['selected'] else None
+                kind = 'radio_group'
+            else:
+                value = group['selected']
+                kind = 'checkbox_group'
+            candidates.append(_candidate(kind, [group['question']], '', value, page_map['page'],
+                                         options=group['options'], source='mark'))
+    return candidates
+
+
+def match_field(field_def, candidates):
+    """Return (candidate, score) for the widget that best answers a schema field"""
+    # SequenceMatcher caches its analysis of the second sequence, so keep the field name there
+    targets = [(target, SequenceMatcher(None, b=target)) for target in label_forms(field_def.get('name', ''))]
+    # Labels repeat across candidates (option text, widget names); score each form once
+    similarities = {}
+    best, best_score = None, 0.0
+    for candidate in candidates:
+        for form, weight in candidate['forms']:
+            if form not in similarities:
+                similarities[form] = max(label_similarity(target, form, matcher) for target, matcher in targets)
+            score = weight * similarities[form]
+            if score > best_score:
+                best, best_score = candidate, score
+    return best, best_score
+
+
+def _document_candidates(pdf_bytes):
+    """
+    {'candidates', 'matches'} of a PDF: its widget and mark candidates and the field name ->
+    (candidate, score) matches made against them, from memory when the same file was read before
+    """
+    digest = hashlib.sha1(pdf_bytes).hexdigest()
+    with _candidate_cache_lock:
+        if digest in _candidate_cache:
+            _candidate_cache.move_to_end(digest)
+            return _candidate_cache[digest]
+    with fitz.open(stream=pdf_bytes, filetype='pdf') as doc:
+        candidates = collect_widget_candidates(doc) if doc.is_form_pdf else []
+        # Pages with widgets keep their state in the widgets; only scan the others for marks
+        candidates += collect_mark_candidates(doc, skip_pages={c['page'] for c in candidates})
+    document = {'candidates': candidates, 'matches': {}}
+    with _candidate_cache_lock:
+        _candidate_cache[digest] = document
+        while len(_candidate_cache) > CANDIDATE_CACHE_SIZE:
+            _candidate_cache.popitem(last=False)
+    return document
+
+
+def resolve_form_fields(file_path, field_definitions):
+    """
+    Answer schema fields directly from AcroForm widgets and, on flattened pages,
+    from checkbox/radio marks found by the checkbox detector.
+
+    Returns a dict with 'values' (field key -> value) for every field matched to a
+    widget or mark, 'matches' describing what answered each one, and the time taken.
+    Fields without a confident match are left for the model.
+    """
+    start = time.perf_counter()
+    prepass = {'values': {}, 'matches': {}, 'elapsed_ms': 0.0}
+    try:
+        with open(file_path, 'rb') as f:
+            document = _document_candidates(f.read())
+
+        for field_def in field_definitions if document['candidates'] else []:
+            name = field_def.get('name', '')
+            if not label_forms(name):
+                continue
+            if name not in document['matches']:
+                document['matches'][name] = match_field(field_def, document['candidates'])
+            candidate, score = document['matches'][name]
+            if candidate is None or score < MATCH_THRESHOLD:
+                continue
+            key = field_key(field_def)
+            prepass['values'][key] = candidate['value']
+            prepass['matches'][key] = {
+                'kind': candidate['kind'],
+                'source': candidate['source'],
+                'widget': candidate['name'],
+                'label': candidate['labels'][0] if candidate['labels'] else '',
+                'page': candidate['page'],
+                'score': round(score, 3),
+            }
+    except Exception as e:
+        logger.warning(f"Form pre-pass failed for {file_path}: {e}")
+        prepass['values'], prepass['matches'] = {}, {}
+
+    prepass['elapsed_ms'] = round((time.perf_counter() - start) * 1000, 2)
+    logger.info(f"Form pre-pass resolved {len(prepass['values'])}/{len(field_definitions)} fields "
+                f"in {prepass['elapsed_ms']} ms")
+    return prepass
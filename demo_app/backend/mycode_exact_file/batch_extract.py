@@ -0,0 +1,288 @@
+"""
+Batch extraction over many PDFs.
+
+    python batch_extract.py INPUT [INPUT ...] [--output-dir DIR] [--workers N] [--format json|ndjson]
+
+INPUT is a PDF, a directory (searched recursively) or a glob. Documents are processed
+by a pool of --workers processes, which is the global concurrency limit: inside a
+worker each document runs its methods one at a time, each in its own process under
+its timeout, with one page worker and one OCR worker. Every document gets its own output in --output-dir, and a line in the
+manifest (manifest.jsonl there) once it is finished, so an interrupted run started
+again with the same arguments skips what is already done. Progress (docs/s, pages/s)
+is shown while running; the final summary with per-method timing percentiles is
+printed and written to batch_summary.json.
+"""
+import argparse
+import glob
+import hashlib
+import json
+import logging
+import math
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_WORKERS = int(os.getenv('PDF_BATCH_WORKERS', str(os.cpu_count() or 1)))
+MANIFEST_NAME = 'manifest.jsonl'
+SUMMARY_NAME = 'batch_summary.json'
+# Documents queued per worker; keeps a 10k-file run from holding 10k pending futures
+QUEUE_DEPTH = 2
+# Seconds between progress lines when stderr is not a terminal
+PROGRESS_INTERVAL = float(os.getenv('PDF_BATCH_PROGRESS_INTERVAL', '10'))
+PERCENTILES = (50, 90, 99)
+
+
+def collect_pdfs(inputs: Iterable[str]) -> List[Path]:
+    """PDFs named by files, directories (recursive) and globs, deduplicated, in input order"""
+    found = {}
+    for entry in inputs:
+        path = Path(entry)
+        if path.is_dir():
+            matches = sorted(p for p in path.rglob('*') if p.suffix.lower() == '.pdf')
+        elif path.is_file():
+            matches = [path]
+        else:
+            matches = sorted(Path(p) for p in glob.glob(entry, recursive=True) if p.lower().endswith('.pdf'))
+            if not matches:
+                logger.warning(f"No PDFs match {entry}")
+        for match in matches:
+            found.setdefault(match.resolve(), None)
+    return list(found)
+
+
+def _fingerprint(path: Path) -> Dict[str, Any]:
+    stat = path.stat()
+    return {'path': str(path), 'size': stat.st_size, 'mtime': stat.st_mtime}
+
+
+def output_prefix(output_dir: Path, path: Path) -> Path:
+    """Output prefix of a document: its name plus a hash of its full path, so equal names do not collide"""
+    return output_dir / f"{path.stem}_{hashlib.sha1(str(path).encode()).hexdigest()[:8]}"
+
+
+def load_manifest(manifest_path: Path) -> Dict[str, Dict[str, Any]]:
+    """Finished documents by path; a later line for the same path wins"""
+    done = {}
+    if manifest_path.exists():
+        with open(manifest_path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # a line cut off by the interruption
+                done[entry['path']] = entry
+    return done
+
+
+def _is_done(entry: Optional[Dict[str, Any]], fingerprint: Dict[str, Any], retry_failed: bool) -> bool:
+    if entry is None or entry['size'] != fingerprint['size'] or entry['mtime'] != fingerprint['mtime']:
+        return False
+    return entry['status'] == 'ok' or not retry_failed
+
+
+def _extract_document(path: str, prefix: str, options: Dict[str, Any], output_format: str) -> Dict[str, Any]:
+    """Worker: extract one document and write its output; returns the manifest fields"""
+    from test_new import EnhancedPDFExtractor
+
+    start = time.perf_counter()
+    entry = {'status': 'error', 'pages': 0, 'method_timings': {}, 'output': None}
+    try:
+        extractor = EnhancedPDFExtractor(path, **options)
+        results = extractor.extract_all_data()
+        if 'error' in results:
+            entry['error'] = results['error']
+        else:
+            if output_format == 'ndjson':
+                entry['output'] = extractor.save_results_ndjson(results, prefix)['main_results']
+            else:
+                entry['output'] = extractor.save_results(results, prefix)
+            # Methods that failed on this document would skew the per-method percentiles
+            failed = set(results.get('failed_methods', []))
+            entry.update(status='ok', pages=results.get('total_pages', 0),
+                         method_timings={method: seconds for method, seconds in results.get('method_timings', {}).items()
+                                         if method not in failed},
+                         cache_hits=list(results.get('method_cache', {}).get('hits', {})))
+    except Exception as e:
+        entry['error'] = str(e)
+    entry['seconds'] = round(time.perf_counter() - start, 3)
+    return entry
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile of values (0 for none)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+class Progress:
+    """Live docs/s and pages/s on stderr: rewritten in place on a terminal, periodic lines otherwise"""
+
+    def __init__(self, total: int, skipped: int):
+        self.total = total
+        self.skipped = skipped
+        self.done = self.failed = self.pages = 0
+        self.start = time.perf_counter()
+        self._last = 0.0
+        self._tty = sys.stderr.isatty()
+
+    def update(self, entry: Dict[str, Any]):
+        self.done += 1
+        self.pages += entry['pages']
+        self.failed += entry['status'] != 'ok'
+        now = time.perf_counter()
+        if self._tty or now - self._last >= PROGRESS_INTERVAL or self.done == self.total:
+            self._last = now
+            elapsed = max(now - self.start, 1e-9)
+            line = (f"[{self.done}/{self.total}] {self.done / elapsed:.2f} docs/s, {self.pages / elapsed:.1f} pages/s, "
+                    f"{self.failed} failed, {self.skipped} skipped")
+            sys.stderr.write(f"\r{line}" if self._tty else f"{line}\n")
+            sys.stderr.flush()
+
+    def finish(self):
+        if self._tty:
+            sys.stderr.write('\n')
+
+
+def summarize(entries: List[Dict[str, Any]], skipped: int, elapsed: float) -> Dict[str, Any]:
+    """Run totals, throughput and per-method timing percentiles of the documents processed in this run"""
+    ok = [entry for entry in entries if entry['status'] == 'ok']
+    pages = sum(entry['pages'] for entry in ok)
+    method_seconds = {}
+    for entry in ok:
+        for method, seconds in entry['method_timings'].items():
+            method_seconds.setdefault(method, []).append(seconds)
+    return {
+        'documents': len(entries),
+        'succeeded': len(ok),
+        'failed': len(entries) - len(ok),
+        'skipped': skipped,
+        'pages': pages,
+        'elapsed_s': round(elapsed, 2),
+        'docs_per_s': round(len(entries) / elapsed, 3) if elapsed else 0.0,
+        'pages_per_s': round(pages / elapsed, 2) if elapsed else 0.0,
+        'document_seconds': {f'p{q}': percentile([entry['seconds'] for entry in ok], q) for q in PERCENTILES},
+        'method_seconds': {
+            method: {**{f'p{q}': percentile(values, q) for q in PERCENTILES}, 'max': max(values), 'count': len(values)}
+            for method, values in method_seconds.items()
+        },
+        'failures': {entry['path']: entry.get('error') for entry in entries if entry['status'] != 'ok'},
+    }
+
+
+def run_batch(pdfs: List[Path], output_dir: Path, workers: int = DEFAULT_BATCH_WORKERS, output_format: str = 'json',
+              options: Optional[Dict[str, Any]] = None, retry_failed: bool = False) -> Dict[str, Any]:
+    """Extract pdfs into output_dir with a pool of workers, resuming from the manifest there"""
+    output_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = output_dir / MANIFEST_NAME
+    done = load_manifest(manifest_path)
+    # One document per worker: its methods run one at a time on one page worker, but each in a
+    # child process so a method stuck on a hostile PDF is killed at its timeout, not the whole batch
+    options = {'concurrent_methods': True, 'method_processes': 1, 'workers': 1, 'ocr_workers': 1, **(options or {})}
+
+    todo = []
+    for path in pdfs:
+        fingerprint = _fingerprint(path)
+        if not _is_done(done.get(str(path)), fingerprint, retry_failed):
+            todo.append(fingerprint)
+    skipped = len(pdfs) - len(todo)
+    logger.info(f"{len(pdfs)} documents, {skipped} already in the manifest, {len(todo)} to extract with {workers} workers")
+
+    progress = Progress(len(todo), skipped)
+    entries = []
+    queue = iter(todo)
+    with open(manifest_path, 'a', encoding='utf-8') as manifest, ProcessPoolExecutor(max_workers=workers) as pool:
+        running = {}
+
+        def submit(count: int):
+            for fingerprint in queue:
+                prefix = output_prefix(output_dir, Path(fingerprint['path']))
+                future = pool.submit(_extract_document, fingerprint['path'], str(prefix), options, output_format)
+                running[future] = fingerprint
+                count -= 1
+                if not count:
+                    break
+
+        try:
+            submit(workers * QUEUE_DEPTH)
+            while running:
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    entry = running.pop(future)
+                    try:
+                        entry.update(future.result())
+                    except Exception as e:  # the worker process died
+                        entry.update(status='error', error=str(e), pages=0, seconds=0.0, method_timings={})
+                    manifest.write(json.dumps(entry) + '\n')
+                    manifest.flush()
+                    entries.append(entry)
+                    progress.update(entry)
+                submit(len(finished))
+        except KeyboardInterrupt:
+            for future in running:
+                future.cancel()
+            progress.finish()
+            logger.warning(f"Interrupted; {len(entries)} documents recorded in {manifest_path}, rerun to resume")
+            raise
+    progress.finish()
+
+    summary = summarize(entries, skipped, time.perf_counter() - progress.start)
+    with open(output_dir / SUMMARY_NAME, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+
+def print_summary(summary: Dict[str, Any]):
+    print(f"\nDocuments: {summary['succeeded']} ok, {summary['failed']} failed, {summary['skipped']} skipped")
+    print(f"Pages: {summary['pages']} in {summary['elapsed_s']}s "
+          f"({summary['docs_per_s']} docs/s, {summary['pages_per_s']} pages/s)")
+    if summary['method_seconds']:
+        header = ''.join(f"{f'p{q}':>9}" for q in PERCENTILES)
+        print(f"\n{'method':<12}{header}{'max':>9}{'docs':>7}")
+    for method, seconds in summary['method_seconds'].items():
+        cells = ''.join(f"{seconds[f'p{q}']:8.2f}s" for q in PERCENTILES)
+        print(f"{method:<12}{cells}{seconds['max']:8.2f}s{seconds['count']:>7}")
+    for path, error in summary['failures'].items():
+        print(f"FAILED {path}: {error}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    from test_new import PLANNER_MODES, DEFAULT_PLANNER_MODE
+    from profiling import PROFILE_DUMP_FORMATS
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('inputs', nargs='+', help='PDF files, directories or globs')
+    parser.add_argument('--output-dir', default='results', help='where outputs and the manifest go (default: results)')
+    parser.add_argument('--workers', type=int, default=DEFAULT_BATCH_WORKERS, help='documents extracted at once')
+    parser.add_argument('--format', choices=('json', 'ndjson'), default='json', dest='output_format')
+    parser.add_argument('--mode', choices=PLANNER_MODES, default=DEFAULT_PLANNER_MODE)
+    parser.add_argument('--no-ocr', action='store_true', help='skip OCR of scanned pages')
+    parser.add_argument('--retry-failed', action='store_true', help='extract documents that failed in an earlier run again')
+    parser.add_argument('--profile', action='store_true', help='record per-method/page time and memory in the statistics')
+    parser.add_argument('--profile-dump', choices=PROFILE_DUMP_FORMATS,
+                        help='also write a profile file per document to OUTPUT_DIR/profiles')
+    args = parser.parse_args(argv)
+
+    # test_new configures INFO logging on import; per-document logs would drown the progress line
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger('pdfminer').setLevel(logging.ERROR)
+    pdfs = collect_pdfs(args.inputs)
+    if not pdfs:
+        parser.error('no PDFs found')
+    summary = run_batch(pdfs, Path(args.output_dir), workers=max(1, args.workers), output_format=args.output_format,
+                        options={'mode': args.mode, 'enable_ocr': not args.no_ocr, 'profile': args.profile,
+                                 'profile_dump': args.profile_dump,
+                                 'profile_dir': str(Path(args.output_dir) / 'profiles')},
+                        retry_failed=args.retry_failed)
+    print_summary(summary)
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
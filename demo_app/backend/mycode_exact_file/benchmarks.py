@@ -0,0 +1,898 @@
+"""
+Benchmarks for EnhancedPDFExtractor.
+
+Run from this folder:
+    python benchmarks.py shared-document
+    python benchmarks.py page-parallel
+    python benchmarks.py planner
+    python benchmarks.py tabula
+    python benchmarks.py char-storage
+    python benchmarks.py ocr
+    python benchmarks.py text-dedup
+    python benchmarks.py formula-tagging
+    python benchmarks.py tables
+    python benchmarks.py streaming-memory
+    python benchmarks.py serialization
+    python benchmarks.py result-model
+    python benchmarks.py method-cache
+    python benchmarks.py profiling
+    python benchmarks.py retrieval
+
+Suite with JSON baselines (every method, the full pipeline and the Gemini path against a
+local fake backend, on the sample docs and 100/500-page synthetic variants):
+    python benchmarks.py suite --output baseline.json
+    python benchmarks.py suite --baseline baseline.json [--threshold 0.2]
+    python benchmarks.py compare --baseline baseline.json --current new.json
+"""
+import argparse
+import gc
+import io
+import json
+import logging
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import warnings
+from pathlib import Path
+
+import fitz  # PyMuPDF
+
+from test_new import EXTRACTION_METHODS, EnhancedPDFExtractor
+
+SAMPLE_DOCS_DIR = Path(__file__).resolve().parents[3] / 'sample_docs'
+
+# Methods that open the PDF themselves (tables and OCR need Java/Tesseract and are timed elsewhere)
+DOCUMENT_METHODS = ['_get_pdf_info', '_extract_with_pymupdf', '_is_scanned_pdf',
+                    '_extract_with_pdfplumber', '_extract_with_pypdf2']
+
+
+def sample_pdfs():
+    return sorted(SAMPLE_DOCS_DIR.glob('*.pdf'))
+
+
+def build_synthetic_pdf(page_count, output_path=None, sources=None):
+    """Concatenate pages of the sample docs (cycling through them) into a PDF of page_count pages"""
+    if output_path is None:
+        output_path = Path(tempfile.gettempdir()) / f'synthetic_{page_count}_pages.pdf'
+    if Path(output_path).exists():
+        return Path(output_path)
+    sources = [fitz.open(p) for p in (sources or sample_pdfs())]
+    with fitz.open() as out:
+        index = 0
+        while len(out) < page_count:
+            src = sources[index % len(sources)]
+            last = min(len(src), page_count - len(out)) - 1
+            out.insert_pdf(src, to_page=last, widgets=False)
+            index += 1
+        out.save(str(output_path), garbage=3, deflate=True)
+    for src in sources:
+        src.close()
+    return Path(output_path)
+
+
+def _time_methods(pdf_path, shared):
+    """Run the document methods once; unshared closes the document between methods like the old code did"""
+    extractor = EnhancedPDFExtractor(str(pdf_path), enable_ocr=False)
+    start = time.perf_counter()
+    for method in DOCUMENT_METHODS:
+        getattr(extractor, method)()
+        if not shared:
+            extractor.close()
+    elapsed = time.perf_counter() - start
+    extractor.close()
+    return elapsed
+
+
+def _time_open(pdf_path, shared):
+    """Read and parse cost alone: one PyMuPDF open (shared) vs one per method that used to open it"""
+    start = time.perf_counter()
+    opens = 1 if shared else 3
+    for _ in range(opens):
+        extractor = EnhancedPDFExtractor(str(pdf_path), enable_ocr=False)
+        doc = extractor._document()
+        for page in doc:
+            page.get_text('blocks')  # force the page tree and content streams to be parsed
+        extractor.close()
+    return time.perf_counter() - start
+
+
+def bench_shared_document(pdf_paths, repeat=5):
+    """Compare reading/parsing each PDF once per extraction against once per method"""
+    rows = []
+    for pdf_path in pdf_paths:
+        _time_methods(pdf_path, True)  # warm the OS page cache and library imports
+        row = {'file': pdf_path.name}
+        for label, func in (('open', _time_open), ('methods', _time_methods)):
+            unshared = statistics.median(func(pdf_path, False) for _ in range(repeat))
+            shared = statistics.median(func(pdf_path, True) for _ in range(repeat))
+            row[f'{label}_unshared_ms'] = round(unshared * 1000, 1)
+            row[f'{label}_shared_ms'] = round(shared * 1000, 1)
+            row[f'{label}_saved_ms'] = round((unshared - shared) * 1000, 1)
+        rows.append(row)
+
+    print(f"{'file':<55} {'open x3':>9} {'open x1':>9} {'methods':>10} {'shared':>10} {'saved':>8}")
+    for row in rows:
+        print(f"{row['file'][:55]:<55} {row['open_unshared_ms']:>7.1f}ms {row['open_shared_ms']:>7.1f}ms "
+              f"{row['methods_unshared_ms']:>8.1f}ms {row['methods_shared_ms']:>8.1f}ms {row['methods_saved_ms']:>6.1f}ms")
+    return rows
+
+
+def _page_methods(extractor):
+    return {'pymupdf': extractor._extract_with_pymupdf(), 'pdfplumber': extractor._extract_with_pdfplumber()}
+
+
+def bench_page_parallel(pdf_paths, page_count=200, chunk_size=8, worker_counts=None):
+    """Scaling of page-parallel PyMuPDF + PDFPlumber extraction with the worker count"""
+    pdf_path = pdf_paths[0] if len(pdf_paths) == 1 else build_synthetic_pdf(page_count, sources=pdf_paths)
+    cores = os.cpu_count() or 1
+    worker_counts = worker_counts or sorted({1, 2, 4, cores, 2 * cores} - {0})
+    print(f"{pdf_path} ({page_count} pages, chunk size {chunk_size}, {cores} cores)")
+
+    serial_output = None
+    serial_time = None
+    for workers in worker_counts:
+        extractor = EnhancedPDFExtractor(str(pdf_path), enable_ocr=False, workers=workers, page_chunk_size=chunk_size)
+        start = time.perf_counter()
+        output = extractor._clean_for_json(_page_methods(extractor))
+        elapsed = time.perf_counter() - start
+        extractor.close()
+        if serial_output is None:
+            serial_output, serial_time = output, elapsed
+        identical = output == serial_output
+        print(f"  workers={workers:<3} {elapsed:8.2f}s  speedup x{serial_time / elapsed:5.2f}  "
+              f"identical to serial: {identical}")
+
+
+def _table_pages(results):
+    """Pages on which any method found a table (Tabula reports no page and counts as page 0)"""
+    pages = set()
+    for table in results.get('tables', []):
+        pages.add(int(table.get('page_number') or table.get('page') or 0))
+    return pages
+
+
+def bench_planner(pdf_paths, repeat=3):
+    """Latency per planner mode and table-page recall against exhaustive mode"""
+    print(f"{'file':<45} {'mode':<11} {'median':>8} {'estimated':>10} {'tables':>7} {'recall':>7}  methods")
+    for pdf_path in pdf_paths:
+        reference = None
+        for mode in ('exhaustive', 'balanced', 'fast'):
+            runs = []
+            for _ in range(repeat):
+                extractor = EnhancedPDFExtractor(str(pdf_path), enable_ocr=True, mode=mode)
+                start = time.perf_counter()
+                results = extractor.extract_all_data()
+                runs.append(time.perf_counter() - start)
+            pages = _table_pages(results)
+            if reference is None:
+                reference = pages
+            recall = len(pages & reference) / len(reference) if reference else 1.0
+            planner = results['statistics']['planner']
+            print(f"{pdf_path.name[:45]:<45} {mode:<11} {statistics.median(runs) * 1000:6.0f}ms "
+                  f"{planner['estimated_ms']:8d}ms {results['statistics']['total_tables']:>7} {recall:>7.0%}  "
+                  f"{', '.join(planner['methods_run'])}")
+
+
+def bench_tabula(pdf_paths, repeat=3):
+    """Per-document Tabula latency with a JVM per call (cold) against the resident sidecar (warm)"""
+    import tabula
+    from tabula_sidecar import TabulaSidecar
+
+    sidecar = TabulaSidecar()
+    start = time.perf_counter()
+    health = sidecar.ensure_running()
+    print(f"sidecar start {(time.perf_counter() - start) * 1000:.0f} ms, backend: {health.get('backend')}")
+
+    print(f"{'file':<55} {'cold':>9} {'warm':>9} {'tables':>7}")
+    try:
+        for pdf_path in pdf_paths:
+            cold, warm, tables, error = [], [], 0, None
+            for _ in range(repeat):
+                start = time.perf_counter()
+                try:
+                    tabula.read_pdf(str(pdf_path), pages='all', multiple_tables=True, silent=True,
+                                    force_subprocess=True)
+                except Exception as e:
+                    error = e
+                cold.append(time.perf_counter() - start)
+                start = time.perf_counter()
+                try:
+                    tables = len(sidecar.read_pdf(str(pdf_path), pages='all', multiple_tables=True, silent=True))
+                except Exception as e:
+                    error = e
+                warm.append(time.perf_counter() - start)
+            print(f"{pdf_path.name[:55]:<55} {statistics.median(cold) * 1000:7.0f}ms "
+                  f"{statistics.median(warm) * 1000:7.0f}ms {tables:>7}" + (f"  (error: {error})" if error else ''))
+        print(f"sidecar health: {sidecar.health_check()}")
+    finally:
+        sidecar.stop()
+
+
+def bench_char_storage(pdf_paths):
+    """Memory held by PDFPlumber character data per storage mode, measured with tracemalloc"""
+    print(f"{'file':<45} {'chars':>7} {'dicts':>10} {'columnar':>10} {'baseline':>10} {'ratio':>6}  same output")
+    for pdf_path in pdf_paths:
+        retained = {}
+        outputs = {}
+        for storage in ('dicts', 'columnar', 'none'):
+            extractor = EnhancedPDFExtractor(str(pdf_path), enable_ocr=False, char_storage=storage)
+            extractor._document()
+            tracemalloc.start()
+            results = extractor._extract_with_pdfplumber()
+            extractor.close()
+            current, _ = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            retained[storage] = current
+            outputs[storage] = extractor._clean_for_json(results['characters'])
+        chars = sum(len(page['characters']) for page in outputs['dicts'])
+        char_bytes = {k: max(v - retained['none'], 0) for k, v in retained.items()}
+        ratio = char_bytes['dicts'] / char_bytes['columnar'] if char_bytes['columnar'] else float('inf')
+        print(f"{pdf_path.name[:45]:<45} {chars:>7} {char_bytes['dicts'] / 1024:8.0f}KB "
+              f"{char_bytes['columnar'] / 1024:8.0f}KB {retained['none'] / 1024:8.0f}KB {ratio:5.1f}x  "
+              f"{outputs['dicts'] == outputs['columnar']}")
+
+
+def build_scanned_pdf(pdf_paths, dpi=150, output_path=None):
+    """Image-only copy of the given PDFs (every page rasterised), to exercise the OCR path"""
+    if output_path is None:
+        output_path = Path(tempfile.gettempdir()) / f'scanned_{dpi}dpi.pdf'
+    if Path(output_path).exists():
+        return Path(output_path)
+    with fitz.open() as out:
+        for pdf_path in pdf_paths:
+            with fitz.open(pdf_path) as src:
+                for page in src:
+                    image_page = out.new_page(width=page.rect.width, height=page.rect.height)
+                    image_page.insert_image(image_page.rect, pixmap=page.get_pixmap(dpi=dpi))
+        out.save(str(output_path), garbage=3, deflate=True)
+    return Path(output_path)
+
+
+def bench_ocr(pdf_paths, dpi=300):
+    """OCR pages/s and cache hit rate on a scanned copy of the PDFs, cold cache then warm"""
+    from ocr_engine import OCREngine
+
+    scanned = build_scanned_pdf(pdf_paths)
+    pdf_bytes = scanned.read_bytes()
+    with fitz.open(scanned) as doc:
+        print(f"{scanned} ({len(doc)} pages, {dpi} dpi)")
+        for workers in sorted({1, os.cpu_count() or 1}):
+            # Same cache directory for both runs: the first fills it, the second is answered from it
+            cache_dir = tempfile.mkdtemp(prefix='ocr_cache_')
+            for run in ('cold', 'warm'):
+                engine = OCREngine(dpi=dpi, workers=workers, cache_dir=cache_dir)
+                try:
+                    stats = engine.ocr_pages(doc, pdf_bytes, list(range(len(doc))))['stats']
+                except Exception as e:
+                    print(f"  workers={workers} {run}: OCR unavailable ({e})")
+                    break
+                print(f"  workers={workers} {run:<5} {stats['pages_per_second']:8.2f} pages/s  "
+                      f"hit rate {stats['hit_rate']:.0%}  ({stats['elapsed_s']:.2f}s)")
+
+
+def bench_text_dedup(pdf_paths, repeat=5):
+    """Consolidation + post-processing time and text output size with and without cross-method dedup"""
+    text_keys = ('all_text_content', 'structured_text', 'roman_numerals', 'formulas_and_equations',
+                 'special_characters')
+    print(f"{'file':<45} {'dedup':<6} {'items':>6} {'chars':>8} {'median':>9} {'output':>9}")
+    for pdf_path in pdf_paths:
+        extractor = EnhancedPDFExtractor(str(pdf_path), enable_ocr=False, concurrent_methods=False, mode='exhaustive')
+        extractor._plan_extraction()
+        methods_results, _, _ = extractor._run_methods(['pymupdf', 'pdfplumber', 'pypdf2'])
+        extractor.close()
+        for dedup in (False, True):
+            extractor.dedup_text = dedup
+            runs = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                results = extractor._post_process_content(extractor._consolidate_results({}, methods_results))
+                runs.append(time.perf_counter() - start)
+            size = len(json.dumps(extractor._clean_for_json({k: results[k] for k in text_keys})))
+            print(f"{pdf_path.name[:45]:<45} {str(dedup):<6} {len(results['all_text_content']):>6} "
+                  f"{results['text_dedup']['chars_after']:>8} {statistics.median(runs) * 1000:7.1f}ms "
+                  f"{size / 1024:7.0f}KB")
+
+
+def _synthetic_formula_items(line_count):
+    """Text items of a formula-heavy technical quotation: every line carries a few distinct formulas"""
+    items = []
+    for i in range(line_count):
+        items.append({
+            'page': i // 50 + 1,
+            'text': f"Item {i}: C{i}H{2 * i + 2} + O{i % 9 + 2} = {i % 97}.{i % 10} kg, "
+                    f"ratio f(x{i}) at {i % 13}.{i % 7}% raw material grade G{i}",
+            'method': 'pymupdf'
+        })
+    return items
+
+
+def bench_formula_tagging(pdf_paths, line_counts=(500, 2000, 5000)):
+    """Formula classification by substring test per formula against the multi-pattern automaton"""
+    from pattern_matcher import MultiPatternMatcher
+
+    extractor = EnhancedPDFExtractor(str(pdf_paths[0]), enable_ocr=False)
+    print(f"{'lines':>6} {'formulas':>9} {'substring':>10} {'automaton':>10} {'backend':>14}  same labels")
+    for line_count in line_counts:
+        items = _synthetic_formula_items(line_count)
+        results = extractor._post_process_content({'all_text_content': items})
+        formulas = results['formulas_and_equations']
+
+        start = time.perf_counter()
+        naive = [any(formula in item['text'] for formula in formulas) for item in items]
+        naive_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        matcher = MultiPatternMatcher([(formula, 'formula') for formula in formulas])
+        tagged = [bool(matcher.find_all(item['text'])) for item in items]
+        automaton_time = time.perf_counter() - start
+
+        print(f"{line_count:>6} {len(formulas):>9} {naive_time * 1000:8.0f}ms {automaton_time * 1000:8.0f}ms "
+              f"{matcher.backend:>14}  {naive == tagged}")
+
+
+def bench_tables(pdf_paths):
+    """Table count, table output size and reconciliation time with every table reader on every page"""
+    print(f"{'file':<45} {'tables':>7} {'kept':>5} {'before':>9} {'after':>9} {'time':>8}  confidence")
+    for pdf_path in pdf_paths:
+        extractor = EnhancedPDFExtractor(str(pdf_path), enable_ocr=False, mode='exhaustive')
+        results = extractor.extract_all_data()
+        stats = results['table_reconciliation']
+        confidences = ', '.join(f"{table['confidence']:.2f}" for table in results['tables'])
+        print(f"{pdf_path.name[:45]:<45} {stats['tables_before']:>7} {stats['tables_after']:>5} "
+              f"{stats['output_bytes_before'] / 1024:7.1f}KB {stats['output_bytes_after'] / 1024:7.1f}KB "
+              f"{stats['reconcile_ms']:6.1f}ms  {confidences}")
+
+
+# Peak RSS growth allowed while streaming the 500-page document
+STREAM_MEMORY_CEILING_MB = float(os.getenv('STREAM_MEMORY_CEILING_MB', '256'))
+
+
+def _rss_bytes():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+class PeakRSS:
+    """Samples this process's RSS every 5 ms while active; growth_mb is the peak above the RSS at entry"""
+
+    def __enter__(self):
+        self.baseline = self.peak = _rss_bytes()
+        self._done = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+        self._sampler.start()
+        return self
+
+    def _sample(self):
+        while not self._done.wait(0.005):
+            self.peak = max(self.peak, _rss_bytes())
+
+    def __exit__(self, exc_type, exc, tb):
+        self._done.set()
+        self._sampler.join()
+        self.peak = max(self.peak, _rss_bytes())
+        self.growth_mb = (self.peak - self.baseline) / 2 ** 20
+        return False
+
+
+def _child_target(queue, func, args):
+    queue.put(func(*args))
+
+
+def in_child_process(func, *args):
+    """Run func(*args) in a fresh process and return its result, so memory and imports do not carry over"""
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_child_target, args=(queue, func, args))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def _measure_peak_rss(pdf_path, streaming, mode):
+    """Child process: peak RSS growth while extracting pdf_path"""
+    from streaming import stream_extraction
+
+    logging.disable(logging.CRITICAL)
+    extractor = EnhancedPDFExtractor(str(pdf_path), enable_ocr=False, mode=mode, concurrent_methods=False, cache_dir=None)
+    start = time.perf_counter()
+    with PeakRSS() as rss:
+        if streaming:
+            with tempfile.NamedTemporaryFile(suffix='.json') as output:
+                stream_extraction(extractor, output.name)
+        else:
+            extractor.extract_all_data()
+    return rss.growth_mb, time.perf_counter() - start
+
+
+def _peak_rss(pdf_path, streaming, mode='fast'):
+    return in_child_process(_measure_peak_rss, pdf_path, streaming, mode)
+
+
+def bench_streaming_memory(pdf_paths, page_counts=(50, 500), mode='fast'):
+    """
+    Memory-ceiling check: peak RSS growth of iter_pages() streaming must stay under
+    STREAM_MEMORY_CEILING_MB on a generated 500-page PDF and must not grow with page count.
+    Exits non-zero when it fails.
+    """
+    print(f"{'pages':>6} {'path':<10} {'peak growth':>12} {'time':>8}")
+    peaks = {}
+    for page_count in page_counts:
+        pdf_path = build_synthetic_pdf(page_count, sources=pdf_paths)
+        for streaming in (True, False):
+            growth, elapsed = _peak_rss(pdf_path, streaming, mode)
+            peaks[(page_count, streaming)] = growth
+            print(f"{page_count:>6} {'streaming' if streaming else 'in-memory':<10} {growth:9.1f} MB {elapsed:7.1f}s")
+
+    small, large = peaks[(page_counts[0], True)], peaks[(page_counts[-1], True)]
+    # 10x the pages may only add noise, not memory per page
+    flat = large <= small + 32
+    passed = large <= STREAM_MEMORY_CEILING_MB and flat
+    print(f"streaming peak {large:.1f} MB at {page_counts[-1]} pages (ceiling {STREAM_MEMORY_CEILING_MB:.0f} MB, "
+          f"{small:.1f} MB at {page_counts[0]} pages): {'PASS' if passed else 'FAIL'}")
+    if not passed:
+        sys.exit(1)
+
+
+def _output_bytes(prefix):
+    return sum(p.stat().st_size for p in prefix.parent.glob(prefix.name + '*'))
+
+
+def bench_serialization(pdf_paths, repeat=3):
+    """Time and size of save_results (JSON + Excel + text report) against save_results_ndjson (NDJSON + tables file)"""
+    print(f"{'file':<45} {'json':>9} {'size':>9} {'ndjson':>9} {'size':>9} {'speedup':>8}")
+    for pdf_path in pdf_paths:
+        extractor = EnhancedPDFExtractor(str(pdf_path), enable_ocr=False, mode='exhaustive')
+        results = extractor.extract_all_data()
+        timings, sizes = {}, {}
+        with tempfile.TemporaryDirectory() as tmp:
+            for name, save in (('json', extractor.save_results), ('ndjson', extractor.save_results_ndjson)):
+                prefix = Path(tmp) / name
+                runs = []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    save(results, str(prefix))
+                    runs.append(time.perf_counter() - start)
+                timings[name] = min(runs)
+                sizes[name] = _output_bytes(prefix)
+        print(f"{pdf_path.name[:45]:<45} {timings['json'] * 1000:7.1f}ms {sizes['json'] / 1024:7.1f}KB "
+              f"{timings['ndjson'] * 1000:7.1f}ms {sizes['ndjson'] / 1024:7.1f}KB "
+              f"{timings['json'] / timings['ndjson']:7.1f}x")
+
+
+def _object_graph(root):
+    """Distinct objects reachable from root and their total sys.getsizeof, each object counted once"""
+    seen, stack, size = set(), [root], 0
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        elif hasattr(obj, '__slots__'):
+            stack.extend(getattr(obj, name) for name in obj.__slots__ if hasattr(obj, name))
+        elif hasattr(obj, '__dict__') and not isinstance(obj, type):
+            stack.append(obj.__dict__)
+    return len(seen), size
+
+
+def _measure_result_model(pdf_path):
+    """Child process: objects and memory held by one extract_all_data() result once the extractor is closed"""
+    logging.disable(logging.CRITICAL)
+    extractor = EnhancedPDFExtractor(str(pdf_path), enable_ocr=False, mode='exhaustive', concurrent_methods=False)
+    gc.collect()
+    rss = _rss_bytes()
+    tracemalloc.start()
+    results = extractor.extract_all_data()
+    extractor.close()
+    gc.collect()
+    traced = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    objects, size = _object_graph(results)
+    return {'text_items': len(results['structured_text']), 'objects': objects, 'graph_kb': size / 1024,
+            'traced_kb': traced / 1024, 'rss_mb': (_rss_bytes() - rss) / 2 ** 20}
+
+
+def bench_result_model(pdf_paths):
+    """
+    Objects and bytes held by the result of the largest document: the result's object graph
+    (distinct objects, summed sys.getsizeof), Python allocations still traced after the
+    extractor is closed, and RSS growth (mostly library imports and caches).
+    """
+    pdf_path = max(pdf_paths, key=lambda p: p.stat().st_size)
+    measured = in_child_process(_measure_result_model, pdf_path)
+    print(f"{pdf_path.name}: {measured['text_items']} text items, {measured['objects']} objects "
+          f"({measured['graph_kb']:.0f} KB), {measured['traced_kb']:.0f} KB traced, "
+          f"{measured['rss_mb']:.1f} MB RSS growth")
+
+
+def bench_method_cache(pdf_paths, repeat=2):
+    """Cold (empty cache) vs warm extract_all_data() time with the on-disk method cache"""
+    print(f"{'file':<45} {'cold':>8} {'warm':>8} {'speedup':>8} {'cached':>9}  hits")
+    for pdf_path in pdf_paths:
+        with tempfile.TemporaryDirectory() as cache_dir:
+            runs = []
+            for _ in range(1 + repeat):
+                extractor = EnhancedPDFExtractor(str(pdf_path), enable_ocr=False, mode='exhaustive', cache_dir=cache_dir)
+                start = time.perf_counter()
+                results = extractor.extract_all_data()
+                runs.append(time.perf_counter() - start)
+            cold, warm = runs[0], min(runs[1:])
+            cached_kb = sum(p.stat().st_size for p in Path(cache_dir).iterdir()) / 1024
+        print(f"{pdf_path.name[:45]:<45} {cold:7.2f}s {warm:7.2f}s {cold / warm:7.1f}x {cached_kb:7.1f}KB  "
+              f"{', '.join(results['method_cache']['hits'])}")
+
+
+def bench_profiling(pdf_paths, repeat=3, calls=100_000):
+    """
+    extract_all_data() time with profiling off, with the statistics figures only and with a
+    pstats / collapsed-stack dump (serial methods, so all work is in this process), plus the
+    cost of one section with profiling off. Profiled runs pay for tracemalloc.
+    """
+    configs = [('off', {}), ('figures', {'profile': True}), ('pstats', {'profile_dump': 'pstats'}),
+               ('collapsed', {'profile_dump': 'collapsed'})]
+    print(f"{'file':<45}" + ''.join(f"{name:>11}" for name, _ in configs))
+    with tempfile.TemporaryDirectory() as profile_dir:
+        for pdf_path in pdf_paths:
+            cells = []
+            for _, options in configs:
+                runs = []
+                for _ in range(repeat):
+                    extractor = EnhancedPDFExtractor(str(pdf_path), enable_ocr=False, concurrent_methods=False,
+                                                     cache_dir=None, profile_dir=profile_dir, **options)
+                    start = time.perf_counter()
+                    extractor.extract_all_data()
+                    runs.append(time.perf_counter() - start)
+                cells.append(min(runs))
+            print(f"{pdf_path.name[:45]:<45}" + ''.join(f"{seconds:10.2f}s" for seconds in cells)
+                  + f"  ({cells[1] / cells[0]:.1f}x with figures)")
+
+    extractor = EnhancedPDFExtractor(str(pdf_paths[0]))
+    start = time.perf_counter()
+    for _ in range(calls):
+        with extractor._section('phases', 'bench'):
+            pass
+    per_section = (time.perf_counter() - start) / calls
+    print(f"\nDisabled section: {per_section * 1e9:.0f} ns each")
+
+
+# Suite: every method on every document, stored as JSON and compared against a baseline
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+SUITE_SCALES = (100, 500)
+SUITE_SCHEMA = BACKEND_DIR / 'schemas' / 'ba5e903c-22f1-4f8d-a139-97a4c6ab3c12.json'
+# Relative growth of a metric over the baseline that counts as a regression
+REGRESSION_THRESHOLD = float(os.getenv('BENCH_REGRESSION_THRESHOLD', '0.2'))
+# Absolute changes below these are noise and never flagged
+NOISE_FLOOR = {'wall_s': 0.05, 'cpu_s': 0.05, 'peak_rss_mb': 8.0, 'output_bytes': 1024}
+# Simulated model round trip of the fake Gemini backend (0 measures only the local work), plus
+# time per 1000 input tokens (prompt and attached document text)
+FAKE_GEMINI_LATENCY_MS = float(os.getenv('FAKE_GEMINI_LATENCY_MS', '0'))
+FAKE_GEMINI_MS_PER_KTOKEN = float(os.getenv('FAKE_GEMINI_MS_PER_KTOKEN', '0'))
+
+
+class FakeGemini:
+    """
+    Local stand-in for the google.generativeai module as pdf_process uses it: uploads read
+    the file, files are ACTIVE at once, and every chat message is answered after
+    FAKE_GEMINI_LATENCY_MS (plus FAKE_GEMINI_MS_PER_KTOKEN per 1000 input tokens) with a
+    JSON object holding null for each requested field. Attached PDFs count as the tokens
+    of their text, which is only extracted when the per-token latency is set.
+    """
+
+    def __init__(self, field_keys, latency_ms=FAKE_GEMINI_LATENCY_MS, ms_per_ktoken=FAKE_GEMINI_MS_PER_KTOKEN):
+        self.response_text = json.dumps({key: None for key in field_keys})
+        self.latency_s = latency_ms / 1000
+        self.ms_per_ktoken = ms_per_ktoken
+        self.uploaded_bytes = 0
+        self.prompt_chars = 0
+        self.input_tokens = 0
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def configure(self, **kwargs):
+        pass
+
+    def upload_file(self, path, mime_type=None):
+        self.uploaded_bytes += len(Path(path).read_bytes())
+        file = self.get_file(Path(path).name)
+        if self.ms_per_ktoken:
+            from prompt_compiler import count_tokens
+
+            with fitz.open(path) as doc:
+                file.tokens = count_tokens(''.join(page.get_text() for page in doc))
+        return file
+
+    def get_file(self, name):
+        state = type('State', (), {'name': 'ACTIVE'})()
+        return type('File', (), {'name': name, 'display_name': name, 'uri': f'fake://{name}', 'state': state})()
+
+    def GenerativeModel(self, **kwargs):
+        return self
+
+    def start_chat(self, history=None):
+        attached = sum(getattr(part, 'tokens', 0) for message in history or [] for part in message['parts'])
+        return type('Chat', (), {'send_message': lambda chat, prompt: self.answer(prompt, attached)})()
+
+    def answer(self, prompt, attached_tokens=0):
+        latency_s = self.latency_s
+        if self.ms_per_ktoken:
+            from prompt_compiler import count_tokens
+
+            tokens = attached_tokens + count_tokens(prompt)
+            latency_s += self.ms_per_ktoken * tokens / 1e6
+            with self._lock:
+                self.input_tokens += tokens
+        with self._lock:
+            self.prompt_chars += len(prompt)
+            self.calls += 1
+        time.sleep(latency_s)
+        return type('Response', (), {'text': self.response_text})()
+
+
+def _usage_seconds():
+    """CPU seconds of this process and its finished children (Java, Ghostscript, tesseract)"""
+    import resource
+    own, children = resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def _run_suite_method(pdf_path, method):
+    """Child process: one method on one document; wall, CPU, peak RSS and output size"""
+    import contextlib
+    import serializers
+
+    logging.disable(logging.CRITICAL)
+    if method == 'gemini':
+        sys.path.insert(0, str(BACKEND_DIR))
+        warnings.filterwarnings('ignore', category=FutureWarning)  # google.generativeai deprecation notice
+        import pdf_process
+        from prompt_compiler import field_key
+
+        schema = json.loads(SUITE_SCHEMA.read_text())
+        fake = FakeGemini([field_key(field) for field in schema['fields']])
+        pdf_process.genai = fake
+
+        def run():
+            return pdf_process.process_single_pdf(str(pdf_path), schema['fields'], schema)
+    else:
+        extractor = EnhancedPDFExtractor(str(pdf_path), enable_ocr=True, concurrent_methods=False, cache_dir=None)
+        if method == 'pipeline':
+            run = extractor.extract_all_data
+        else:
+            run = getattr(extractor, next(name for key, name, _ in EXTRACTION_METHODS if key == method))
+        extractor._read_bytes()
+
+    cpu, start = _usage_seconds(), time.perf_counter()
+    with PeakRSS() as rss, contextlib.redirect_stdout(io.StringIO()):
+        result = run()
+    measured = {
+        'wall_s': round(time.perf_counter() - start, 4),
+        'cpu_s': round(_usage_seconds() - cpu, 4),
+        'peak_rss_mb': round(rss.growth_mb, 2),
+        'output_bytes': len(serializers.dumps(result)),
+        'status': 'ok',
+    }
+    error = result.get('error') if isinstance(result, dict) else None
+    if error:
+        measured.update(status='error', error=str(error)[:200])
+    if method == 'gemini':
+        measured.update(prompt_chars=fake.prompt_chars, uploaded_bytes=fake.uploaded_bytes)
+    return measured
+
+
+def run_suite(pdf_paths, scales=SUITE_SCALES, methods=None, repeat=1):
+    """Measure every method (plus the full pipeline and the Gemini path) on each document and scaled-up variant"""
+    from extraction_cache import library_versions
+    from test_new import METHOD_LIBRARIES
+
+    methods = methods or [key for key, _, _ in EXTRACTION_METHODS] + ['pipeline', 'gemini']
+    documents = list(pdf_paths) + [build_synthetic_pdf(pages, sources=pdf_paths) for pages in scales]
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': sys.version.split()[0],
+        'cpu_count': os.cpu_count(),
+        'versions': library_versions(sorted({d for names in METHOD_LIBRARIES.values() for d in names})),
+        'methods': methods,
+        'documents': {},
+    }
+    print(f"{'document':<45} {'method':<11} {'wall':>8} {'cpu':>8} {'rss':>8} {'output':>9} {'per page':>9}")
+    for pdf_path in documents:
+        with fitz.open(pdf_path) as doc:
+            pages = len(doc)
+        entry = report['documents'][pdf_path.name] = {'pages': pages, 'methods': {}}
+        for method in methods:
+            runs = [in_child_process(_run_suite_method, pdf_path, method) for _ in range(repeat)]
+            # The fastest run is the least disturbed by the rest of the machine
+            measured = min(runs, key=lambda run: run['wall_s'])
+            measured['per_page'] = {
+                'wall_ms': round(measured['wall_s'] * 1000 / pages, 3),
+                'cpu_ms': round(measured['cpu_s'] * 1000 / pages, 3),
+                'output_bytes': round(measured['output_bytes'] / pages, 1),
+            }
+            entry['methods'][method] = measured
+            status = '' if measured['status'] == 'ok' else f"  {measured['status']}: {measured.get('error', '')[:40]}"
+            print(f"{pdf_path.name[:45]:<45} {method:<11} {measured['wall_s']:7.2f}s {measured['cpu_s']:7.2f}s "
+                  f"{measured['peak_rss_mb']:6.1f}MB {measured['output_bytes'] / 1024:7.1f}KB "
+                  f"{measured['per_page']['wall_ms']:7.1f}ms{status}", flush=True)
+    return report
+
+
+def compare_reports(baseline, current, threshold=REGRESSION_THRESHOLD):
+    """
+    Regressions of current against baseline, on the documents both measured: methods that
+    succeeded in the baseline and now fail or are missing (metric 'status'), and metrics of
+    methods that succeeded in both and grew by more than threshold (and the noise floor).
+    A method left out of the current run on purpose (not in its 'methods') is not missing.
+    """
+    regressions = []
+    selected = current.get('methods')
+    for name, document in current['documents'].items():
+        base_document = baseline['documents'].get(name)
+        if base_document is None:
+            continue
+        for method, base in base_document['methods'].items():
+            measured = document['methods'].get(method)
+            if base['status'] != 'ok' or (measured is None and selected is not None and method not in selected):
+                continue
+            status = 'missing' if measured is None else measured['status']
+            if status != 'ok':
+                regressions.append({'document': name, 'method': method, 'metric': 'status',
+                                    'baseline': 'ok', 'current': status, 'change': None,
+                                    'error': (measured or {}).get('error')})
+                continue
+            for metric, floor in NOISE_FLOOR.items():
+                before, after = base[metric], measured[metric]
+                if after - before > floor and after > before * (1 + threshold):
+                    regressions.append({'document': name, 'method': method, 'metric': metric,
+                                        'baseline': before, 'current': after,
+                                        'change': round(after / before - 1, 3) if before else None})
+    return regressions
+
+
+def print_regressions(regressions, threshold):
+    if not regressions:
+        print(f"No regressions beyond {threshold:.0%}")
+        return
+    print(f"{len(regressions)} regressions beyond {threshold:.0%}:")
+    for r in regressions:
+        if r['metric'] == 'status':
+            error = f"  {r['error'][:60]}" if r.get('error') else ''
+            print(f"  {r['document'][:45]:<45} {r['method']:<11} {'status':<13} {'ok':>10} -> {r['current']}{error}")
+            continue
+        change = f"+{r['change']:.0%}" if r['change'] is not None else 'new'
+        print(f"  {r['document'][:45]:<45} {r['method']:<11} {r['metric']:<13} {r['baseline']:>10} -> {r['current']:<10} {change}")
+
+
+def suite_command(pdf_paths, output=None, baseline=None, threshold=REGRESSION_THRESHOLD, scales=SUITE_SCALES,
+                  methods=None, repeat=1):
+    """Run the suite, write it to output and, given a baseline, exit non-zero on regressions"""
+    report = run_suite(pdf_paths, scales, methods, repeat)
+    output = Path(output or f"benchmark_{report['created'].replace(':', '')}.json")
+    output.write_text(json.dumps(report, indent=2))
+    print(f"Wrote {output}")
+    if baseline:
+        regressions = compare_reports(json.loads(Path(baseline).read_text()), report, threshold)
+        print_regressions(regressions, threshold)
+        if regressions:
+            sys.exit(1)
+
+
+def compare_command(baseline, current, threshold=REGRESSION_THRESHOLD):
+    """Compare two stored suite reports; exit non-zero on regressions"""
+    regressions = compare_reports(json.loads(Path(baseline).read_text()), json.loads(Path(current).read_text()),
+                                  threshold)
+    print_regressions(regressions, threshold)
+    if regressions:
+        sys.exit(1)
+
+
+# Fake model timing in the retrieval benchmark: round trip plus time per 1000 input tokens
+RETRIEVAL_BENCH_LATENCY_MS = 500
+RETRIEVAL_BENCH_MS_PER_KTOKEN = 20
+
+
+def _measure_retrieval(pdf_path, index_dir):
+    """Child process: Gemini path with the whole PDF attached, then with a cold and a warm chunk index"""
+    import contextlib
+
+    logging.disable(logging.CRITICAL)
+    sys.path.insert(0, str(BACKEND_DIR))
+    warnings.filterwarnings('ignore', category=FutureWarning)  # google.generativeai deprecation notice
+    import pdf_process
+    from chunk_index import ChunkIndex
+    from prompt_compiler import field_key, is_selection_field
+
+    schema = json.loads(SUITE_SCHEMA.read_text())
+    # Checkbox/radio fields always get the whole PDF, so only the text fields can use retrieval
+    fields = [field for field in schema['fields'] if not is_selection_field(field)]
+    measured = {}
+    for mode in ('whole', 'cold', 'warm'):
+        fake = FakeGemini([field_key(field) for field in fields], RETRIEVAL_BENCH_LATENCY_MS,
+                          RETRIEVAL_BENCH_MS_PER_KTOKEN)
+        pdf_process.genai = fake
+        # A new ChunkIndex per run, so the warm run reads the stored index back from disk
+        chunk_index = None if mode == 'whole' else ChunkIndex(index_dir)
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = pdf_process.process_single_pdf(str(pdf_path), fields, schema, use_form_prepass=False,
+                                                    chunk_index=chunk_index)
+        measured[mode] = {'seconds': time.perf_counter() - start, 'input_tokens': fake.input_tokens,
+                          'calls': fake.calls, 'retrieval': result.get('retrieval')}
+    return measured
+
+
+def bench_retrieval(pdf_paths, scales=SUITE_SCALES):
+    """
+    Gemini path against the fake backend with latency growing with input tokens
+    (RETRIEVAL_BENCH_*): the whole PDF attached vs only the chunks retrieved per field
+    group, with the chunk index built (cold) and read from disk (warm), for the suite
+    schema's text fields. Documents below RETRIEVAL_MIN_DOCUMENT_TOKENS are still sent whole.
+    """
+    documents = list(pdf_paths) + [build_synthetic_pdf(pages, sources=pdf_paths) for pages in scales]
+    print(f"{'file':<45} {'tokens':>8} {'chunked':>8} {'saved':>7} {'whole':>8} {'cold':>8} {'warm':>8}  sent")
+    with tempfile.TemporaryDirectory() as index_dir:
+        for pdf_path in documents:
+            measured = in_child_process(_measure_retrieval, pdf_path, index_dir)
+            whole, cold, warm = measured['whole'], measured['cold'], measured['warm']
+            retrieval = warm['retrieval']
+            sent = (f"{retrieval['chunks_sent']}/{retrieval['chunks_total']} chunks in {retrieval['groups']} calls"
+                    if retrieval else 'whole document')
+            print(f"{pdf_path.name[:45]:<45} {whole['input_tokens']:8d} {warm['input_tokens']:8d} "
+                  f"{1 - warm['input_tokens'] / whole['input_tokens']:6.0%} {whole['seconds']:7.2f}s "
+                  f"{cold['seconds']:7.2f}s {warm['seconds']:7.2f}s  {sent}", flush=True)
+
+
+BENCHMARKS = {
+    'shared-document': bench_shared_document,
+    'page-parallel': bench_page_parallel,
+    'planner': bench_planner,
+    'tabula': bench_tabula,
+    'char-storage': bench_char_storage,
+    'ocr': bench_ocr,
+    'text-dedup': bench_text_dedup,
+    'formula-tagging': bench_formula_tagging,
+    'tables': bench_tables,
+    'streaming-memory': bench_streaming_memory,
+    'serialization': bench_serialization,
+    'result-model': bench_result_model,
+    'method-cache': bench_method_cache,
+    'profiling': bench_profiling,
+    'retrieval': bench_retrieval,
+}
+
+
+if __name__ == '__main__':
+    logging.disable(logging.CRITICAL)
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS) + ['suite', 'compare'])
+    parser.add_argument('pdfs', nargs='*', help='PDFs to benchmark (default: sample_docs)')
+    parser.add_argument('--output', help='suite: JSON report to write')
+    parser.add_argument('--baseline', help='suite/compare: JSON report to compare against')
+    parser.add_argument('--current', help='compare: JSON report checked against the baseline')
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                        help='suite/compare: relative growth flagged as a regression (default: %(default)s)')
+    parser.add_argument('--scales', default=','.join(map(str, SUITE_SCALES)),
+                        help='suite: page counts of the synthetic documents, comma-separated (empty for none)')
+    parser.add_argument('--methods', help='suite: methods to run, comma-separated (default: all, pipeline, gemini)')
+    parser.add_argument('--repeat', type=int, default=1, help='suite: runs per measurement, the fastest is kept')
+    args = parser.parse_args()
+    pdfs = [Path(p) for p in args.pdfs] or sample_pdfs()
+    if args.benchmark == 'suite':
+        suite_command(pdfs, args.output, args.baseline, args.threshold,
+                      [int(n) for n in args.scales.split(',') if n], args.methods and args.methods.split(','),
+                      args.repeat)
+    elif args.benchmark == 'compare':
+        if not (args.baseline and args.current):
+            parser.error('compare needs --baseline and --current')
+        compare_command(args.baseline, args.current, args.threshold)
+    else:
+        BENCHMARKS[args.benchmark](pdfs)
@@ -0,0 +1,129 @@
+"""
+Persistent per-method cache of raw extraction output.
+
+Each entry is one extraction method's result for one document, keyed by the SHA-256
+of the PDF bytes, the method name, the method's configuration (pages, storage mode,
+DPI, ...) and the versions of the libraries it runs on, so a result is reused only
+when recomputing it would give the same output. Entries are pickled and
+zlib-compressed, one file each; the directory is kept under a byte budget by
+evicting the least recently used entries (a hit refreshes the file's mtime). Its size
+is scanned once at startup and then tracked as entries are written; the directory is
+only listed again when the tracked size goes over the budget (other processes sharing
+the directory are counted at that point).
+
+Entries are unpickled, so the cache directory must only be writable by trusted users.
+"""
+import hashlib
+import json
+import logging
+import os
+import pickle
+import zlib
+from functools import lru_cache
+from importlib import metadata
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_METHOD_CACHE_DIR = os.getenv('PDF_METHOD_CACHE_DIR', str(Path.home() / '.cache' / 'pdf_extractor' / 'methods'))
+DEFAULT_METHOD_CACHE_MAX_MB = float(os.getenv('PDF_METHOD_CACHE_MAX_MB', '512'))
+# zlib level 6 is within a few percent of level 9 on pickled results at a fraction of the time
+COMPRESSION_LEVEL = 6
+# Eviction frees down to this share of the budget, so a full cache is not listed again on every write
+EVICT_TO = 0.9
+_SUFFIX = '.pkl.z'
+
+
+@lru_cache(maxsize=None)
+def package_version(distribution: str) -> str:
+    try:
+        return metadata.version(distribution)
+    except metadata.PackageNotFoundError:
+        return 'unknown'
+
+
+def library_versions(distributions: Iterable[str]) -> Dict[str, str]:
+    return {name: package_version(name) for name in distributions}
+
+
+def cache_key(pdf_sha256: str, method: str, config: Dict[str, Any], versions: Dict[str, str]) -> str:
+    payload = json.dumps({'pdf': pdf_sha256, 'method': method, 'config': config, 'versions': versions},
+                         sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ExtractionCache:
+    """Directory of compressed method results with size-bounded LRU eviction"""
+
+    def __init__(self, cache_dir: str = DEFAULT_METHOD_CACHE_DIR, max_mb: float = DEFAULT_METHOD_CACHE_MAX_MB):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = int(max_mb * 2 ** 20)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._size = 0
+        self.evict()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f'{key}{_SUFFIX}'
+
+    def get(self, key: str) -> Optional[Any]:
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.loads(zlib.decompress(f.read()))
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            # A truncated or stale entry is a miss; drop it so it is rewritten
+            logger.warning(f"Discarding unreadable cache entry {path.name}: {e}")
+            path.unlink(missing_ok=True)
+            return None
+        os.utime(path)
+        return value
+
+    def put(self, key: str, value: Any) -> int:
+        """Store value under key; returns the compressed size in bytes"""
+        data = zlib.compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), COMPRESSION_LEVEL)
+        path = self._path(key)
+        try:
+            replaced = path.stat().st_size
+        except FileNotFoundError:
+            replaced = 0
+        tmp_path = self.cache_dir / f'{key}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self._size += len(data) - replaced
+        if self._size > self.max_bytes:
+            self.evict()
+        return len(data)
+
+    def evict(self) -> int:
+        """
+        Delete least recently used entries until the directory is back under EVICT_TO of
+        max_bytes (if it was over max_bytes); returns entries removed
+        """
+        entries = []
+        for path in self.cache_dir.glob(f'*{_SUFFIX}'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes if total <= self.max_bytes else self.max_bytes * EVICT_TO
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= target:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            removed += 1
+        self._size = total
+        if removed:
+            logger.info(f"Method cache: evicted {removed} entries, {total / 2 ** 20:.1f} MB kept")
+        return removed
+
+    def size_bytes(self) -> int:
+        return sum(path.stat().st_size for path in self.cache_dir.glob(f'*{_SUFFIX}'))
+
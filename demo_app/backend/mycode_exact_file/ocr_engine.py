@@ -0,0 +1,293 @@
+"""
+OCR stage for scanned pages.
+
+Pages are rendered at a configurable DPI straight into grayscale NumPy arrays and
+recognised by tesseract across a process pool. With tesserocr installed the pixels are
+handed to the tesseract C API in memory (one API instance per process, so the language
+model is loaded once); otherwise pytesseract runs the tesseract binary on an uncompressed
+PGM file, which skips the PNG compression pytesseract would do for an array. Results are
+cached by a hash of the page's content stream, the raw image data it draws, the OCR
+settings and the tesseract version, so a scanned document that was seen before is
+answered without rendering or OCR. Both caches are bounded: the in-memory one by entry
+count, the directory by size (least recently used entries go first).
+"""
+import hashlib
+import json
+import logging
+import os
+import shlex
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import fitz  # PyMuPDF
+import numpy as np
+import pytesseract
+
+try:
+    import tesserocr
+except ImportError:  # optional; pytesseract and the tesseract binary are the fallback
+    tesserocr = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_OCR_DPI = int(os.getenv('OCR_DPI', '300'))
+DEFAULT_OCR_WORKERS = int(os.getenv('OCR_WORKERS', str(os.cpu_count() or 1)))
+DEFAULT_OCR_LANG = os.getenv('OCR_LANG', 'eng')
+DEFAULT_OCR_CACHE_DIR = Path(os.getenv('OCR_CACHE_DIR', Path.home() / '.cache' / 'pdf_extractor' / 'ocr'))
+DEFAULT_OCR_CACHE_MAX_MB = float(os.getenv('OCR_CACHE_MAX_MB', '64'))
+# Page results kept in memory per engine; the disk cache holds the rest
+MEMORY_CACHE_PAGES = int(os.getenv('OCR_MEMORY_CACHE_PAGES', '512'))
+# Words below this tesseract confidence are dropped, as the original OCR pass did
+MIN_WORD_CONFIDENCE = 30
+
+
+@lru_cache(maxsize=None)
+def tesseract_version() -> str:
+    """Version of the tesseract library OCR runs on ('unavailable' when it is not installed)"""
+    try:
+        if tesserocr is not None:
+            return 'tesserocr ' + tesserocr.tesseract_version().split()[1]
+        return str(pytesseract.get_tesseract_version())
+    except Exception:
+        return 'unavailable'
+
+
+def page_content_hash(doc: fitz.Document, page: fitz.Page, dpi: int, config: str, lang: str) -> str:
+    """Hash of everything that determines a page's OCR output, computed without rendering"""
+    digest = hashlib.sha256(f'{tesseract_version()}|{lang}|{dpi}|{config}|{page.rect}|{page.rotation}'.encode())
+    digest.update(page.read_contents())
+    for image in page.get_images(full=True):
+        digest.update(doc.xref_stream_raw(image[0]) or b'')
+    return digest.hexdigest()
+
+
+def render_page(page: fitz.Page, dpi: int) -> np.ndarray:
+    """Render a page to a grayscale uint8 array without encoding an image file"""
+    pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY, alpha=False)
+    return np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.stride)[:, :pix.width].copy()
+
+
+def _tesserocr_settings(config: str) -> Optional[Tuple[Optional[int], Dict[str, str]]]:
+    """Page segmentation mode and variables of a tesseract command-line config, None if it has other options"""
+    psm, variables = None, {}
+    tokens = shlex.split(config)
+    while tokens:
+        option = tokens.pop(0)
+        if option == '--psm' and tokens:
+            psm = int(tokens.pop(0))
+        elif option == '-c' and tokens and '=' in tokens[0]:
+            name, value = tokens.pop(0).split('=', 1)
+            variables[name] = value
+        else:
+            return None
+    return psm, variables
+
+
+_local = threading.local()
+
+
+def _tesserocr_api(lang: str, psm: Optional[int], variables: Dict[str, str]):
+    """This thread's tesseract API for lang, reset to the given settings"""
+    apis = getattr(_local, 'apis', None)
+    if apis is None:
+        apis = _local.apis = {}
+    api = apis.get(lang)
+    if api is None:
+        api = apis[lang] = tesserocr.PyTessBaseAPI(lang=lang)
+    api.SetPageSegMode(tesserocr.PSM.AUTO if psm is None else psm)
+    for name, value in variables.items():
+        api.SetVariable(name, value)
+    return api
+
+
+def _words_tesserocr(image: np.ndarray, lang: str, settings) -> List[Tuple[str, float]]:
+    api = _tesserocr_api(lang, *settings)
+    height, width = image.shape
+    api.SetImageBytes(np.ascontiguousarray(image).tobytes(), width, height, 1, width)
+    api.Recognize()
+    return api.MapWordConfidences()
+
+
+def _words_pytesseract(image: np.ndarray, config: str, lang: str) -> List[Tuple[str, float]]:
+    # pytesseract saves arrays as PNG; a binary PGM is the same pixels without the compression
+    height, width = image.shape
+    fd, path = tempfile.mkstemp(suffix='.pgm')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(b'P5\n%d %d\n255\n' % (width, height))
+            f.write(np.ascontiguousarray(image).tobytes())
+        data = pytesseract.image_to_data(path, lang=lang, config=config, output_type=pytesseract.Output.DICT)
+    finally:
+        os.unlink(path)
+    return list(zip(data['text'], (float(conf) for conf in data['conf'])))
+
+
+def recognise(image: np.ndarray, config: str = '', lang: str = DEFAULT_OCR_LANG) -> Dict[str, Any]:
+    """Run tesseract on a grayscale page image; returns the page text and its average word confidence"""
+    settings = _tesserocr_settings(config) if tesserocr is not None else None
+    if settings is not None:
+        recognised = _words_tesserocr(image, lang, settings)
+    else:
+        recognised = _words_pytesseract(image, config, lang)
+    words, confidences = [], []
+    for text, conf in recognised:
+        text = text.strip()
+        conf = int(conf)
+        if text and conf > MIN_WORD_CONFIDENCE:
+            words.append(text)
+            confidences.append(conf)
+    return {
+        'text': ' '.join(words),
+        'average_confidence': sum(confidences) / len(confidences) if confidences else 0.0,
+    }
+
+
+_worker_doc = None
+
+
+def _init_worker(pdf_source):
+    global _worker_doc
+    _worker_doc = fitz.open(pdf_source) if isinstance(pdf_source, str) else fitz.open(stream=pdf_source, filetype='pdf')
+
+
+def _ocr_page(page_num: int, dpi: int, config: str, lang: str) -> Tuple[Dict[str, Any], float]:
+    start = time.perf_counter()
+    result = recognise(render_page(_worker_doc[page_num], dpi), config, lang)
+    return result, time.perf_counter() - start
+
+
+class OCREngine:
+    """Cached, process-parallel tesseract OCR over the pages of a PDF"""
+
+    def __init__(self, dpi: int = DEFAULT_OCR_DPI, workers: int = DEFAULT_OCR_WORKERS,
+                 cache_dir: Optional[Path] = DEFAULT_OCR_CACHE_DIR, config: str = '',
+                 lang: str = DEFAULT_OCR_LANG, cache_max_mb: float = DEFAULT_OCR_CACHE_MAX_MB,
+                 memory_pages: int = MEMORY_CACHE_PAGES):
+        self.dpi = dpi
+        self.workers = max(1, workers)
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.config = config
+        self.lang = lang
+        self.cache_max_bytes = int(cache_max_mb * 2 ** 20)
+        self.memory_pages = memory_pages
+        self._memory_cache = OrderedDict()
+        self._cache_bytes = 0
+        if self.cache_dir:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            self._cache_bytes = self._evict_disk()
+
+    def _remember(self, key: str, value: Dict[str, Any]):
+        self._memory_cache[key] = value
+        self._memory_cache.move_to_end(key)
+        while len(self._memory_cache) > self.memory_pages:
+            self._memory_cache.popitem(last=False)
+
+    def _cache_get(self, key: str) -> Optional[Dict[str, Any]]:
+        if key in self._memory_cache:
+            self._memory_cache.move_to_end(key)
+            return self._memory_cache[key]
+        if self.cache_dir:
+            path = self.cache_dir / f'{key}.json'
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    value = json.load(f)
+            except (FileNotFoundError, ValueError):
+                return None
+            os.utime(path)
+            self._remember(key, value)
+            return value
+        return None
+
+    def _cache_put(self, key: str, value: Dict[str, Any]):
+        self._remember(key, value)
+        if self.cache_dir:
+            data = json.dumps(value, ensure_ascii=False).encode('utf-8')
+            tmp_path = self.cache_dir / f'{key}.{os.getpid()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, self.cache_dir / f'{key}.json')
+            self._cache_bytes += len(data)
+            if self._cache_bytes > self.cache_max_bytes:
+                self._cache_bytes = self._evict_disk()
+
+    def _evict_disk(self) -> int:
+        """Delete least recently used files until the directory fits cache_max_bytes; returns the bytes kept"""
+        entries = []
+        for path in self.cache_dir.glob('*.json'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.cache_max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+        return total
+
+    def ocr_pages(self, doc: fitz.Document, pdf_source, page_numbers: List[int]) -> Dict[str, Any]:
+        """
+        OCR the given pages (0-based) of an open document; pdf_source (its bytes or path)
+        is what the worker processes open it from.
+
+        Returns {'pages': [{'page', 'text', 'average_confidence', 'cached', 'seconds'}], 'stats'}
+        with pages in page order; stats carry pages/s and the cache hit rate. A page's seconds
+        are its render and recognition time (0 when cached or identical to an earlier page).
+        """
+        start = time.perf_counter()
+        keys = {n: page_content_hash(doc, doc[n], self.dpi, self.config, self.lang) for n in page_numbers}
+        results = {}
+        misses = []
+        for page_num, key in keys.items():
+            cached = self._cache_get(key)
+            if cached is not None:
+                results[page_num] = dict(cached, cached=True)
+            else:
+                misses.append(page_num)
+
+        # Identical pages (repeated scans, blank separators) are recognised once
+        unique = list({keys[n]: n for n in reversed(misses)}.values())[::-1]
+        recognised = {}
+        seconds = {}
+        if unique and (self.workers == 1 or len(unique) == 1):
+            for page_num in unique:
+                page_start = time.perf_counter()
+                recognised[keys[page_num]] = recognise(render_page(doc[page_num], self.dpi), self.config, self.lang)
+                seconds[page_num] = time.perf_counter() - page_start
+        elif unique:
+            with ProcessPoolExecutor(max_workers=min(self.workers, len(unique)), initializer=_init_worker,
+                                     initargs=(pdf_source,)) as pool:
+                ocr_results = pool.map(_ocr_page, unique, [self.dpi] * len(unique), [self.config] * len(unique),
+                                       [self.lang] * len(unique))
+                for page_num, (value, elapsed) in zip(unique, ocr_results):
+                    recognised[keys[page_num]] = value
+                    seconds[page_num] = elapsed
+        for key, value in recognised.items():
+            self._cache_put(key, value)
+        for page_num in misses:
+            results[page_num] = dict(recognised[keys[page_num]], cached=False)
+
+        elapsed = time.perf_counter() - start
+        stats = {
+            'pages': len(page_numbers),
+            'cache_hits': len(page_numbers) - len(misses),
+            'hit_rate': round((len(page_numbers) - len(misses)) / len(page_numbers), 3) if page_numbers else 0.0,
+            'pages_per_second': round(len(page_numbers) / elapsed, 2) if elapsed else 0.0,
+            'elapsed_s': round(elapsed, 3),
+            'dpi': self.dpi,
+            'workers': self.workers,
+        }
+        logger.info(f"OCR: {stats['pages']} pages at {self.dpi} dpi, {stats['cache_hits']} cached, "
+                    f"{stats['pages_per_second']} pages/s")
+        return {
+            'pages': [dict(results[n], page=n + 1, seconds=round(seconds.get(n, 0.0), 4)) for n in page_numbers],
+            'stats': stats,
+        }
@@ -0,0 +1,113 @@
+"""
+Multi-pattern string matching for content tagging.
+
+MultiPatternMatcher builds an Aho-Corasick automaton over a set of literal patterns
+(formulas found in a document, keywords) and reports every occurrence of every
+pattern in one pass over a text, instead of one substring search per pattern. The
+C implementation from pyahocorasick is used when it is installed; otherwise a
+pure-Python automaton with the same results.
+"""
+from collections import deque
+from typing import Dict, Iterable, List, Tuple
+
+try:
+    import ahocorasick
+except ImportError:  # optional dependency
+    ahocorasick = None
+
+# (start, end, pattern, tag) with end exclusive, as a slice of the searched text
+Match = Tuple[int, int, str, str]
+
+
+def fold_case(text: str) -> str:
+    """
+    Lower-case text one character at a time, keeping its length: characters whose lower
+    case is longer ('İ' -> 'i̇') are left as they are, so offsets into the result are
+    offsets into text.
+    """
+    if text.isascii():
+        return text.lower()
+    return ''.join(lower if len(lower := char.lower()) == 1 else char for char in text)
+
+
+class MultiPatternMatcher:
+    """Aho-Corasick matcher over literal patterns, each carrying a tag"""
+
+    def __init__(self, patterns: Iterable[Tuple[str, str]], ignore_case: bool = False,
+                 use_native: bool = True):
+        """
+        patterns: (pattern, tag) pairs; a pattern listed twice keeps its first tag.
+        ignore_case: match case-insensitively (patterns and text go through fold_case).
+        """
+        self.ignore_case = ignore_case
+        self.tags: Dict[str, str] = {}
+        for pattern, tag in patterns:
+            if pattern and pattern not in self.tags:
+                self.tags[pattern] = tag
+        self.backend = 'pyahocorasick' if ahocorasick is not None and use_native else 'python'
+        if not self.tags:
+            return
+        if self.backend == 'pyahocorasick':
+            self._automaton = ahocorasick.Automaton()
+            for pattern in self.tags:
+                key = fold_case(pattern) if ignore_case else pattern
+                # Lower-casing can make patterns collide; keep every original for the results
+                originals = self._automaton.get(key, ())
+                self._automaton.add_word(key, originals + (pattern,))
+            self._automaton.make_automaton()
+        else:
+            self._build()
+
+    def __len__(self) -> int:
+        return len(self.tags)
+
+    def _build(self):
+        # Trie as one transition dict per state, then breadth-first failure links
+        self._goto: List[Dict[str, int]] = [{}]
+        self._output: List[List[str]] = [[]]
+        for pattern in self.tags:
+            state = 0
+            for char in (fold_case(pattern) if self.ignore_case else pattern):
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._output.append([])
+                state = next_state
+            self._output[state].append(pattern)
+
+        self._fail = [0] * len(self._goto)
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                # A state also ends every pattern its failure state ends
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def find_all(self, text: str) -> List[Match]:
+        """Every (possibly overlapping) occurrence of every pattern, ordered by end then length"""
+        if not self.tags or not text:
+            return []
+        haystack = fold_case(text) if self.ignore_case else text
+        matches = []
+        if self.backend == 'pyahocorasick':
+            for end, originals in self._automaton.iter(haystack):
+                for pattern in originals:
+                    matches.append((end + 1 - len(pattern), end + 1, pattern, self.tags[pattern]))
+            return matches
+
+        goto, fail, output, tags = self._goto, self._fail, self._output, self.tags
+        state = 0
+        for index, char in enumerate(haystack):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for pattern in output[state]:
+                matches.append((index + 1 - len(pattern), index + 1, pattern, tags[pattern]))
+        return matches
@@ -0,0 +1,149 @@
+"""
+Opt-in profiling for the extractor.
+
+Profiler measures named sections, grouped by kind (methods, pipeline phases, pages):
+wall time, CPU time of the process and the tracemalloc peak above the memory in use
+when the section started. Sections nest; an inner section's peak still counts towards the
+enclosing one. Optionally a whole call is also recorded for offline analysis, either
+as a cProfile/pstats file or as collapsed stacks ("frame;frame;frame count" lines,
+the input format of flamegraph.pl, speedscope and inferno) from a sampling thread.
+
+When profiling is off the extractor holds no Profiler and uses NULL_SECTION, so the
+cost is one attribute check per section.
+"""
+import contextlib
+import cProfile
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+PROFILE_DUMP_FORMATS = ('pstats', 'collapsed')
+DEFAULT_PROFILE_DIR = os.getenv('PDF_PROFILE_DIR', 'profiles')
+# Interval of the stack sampler behind the collapsed-stack dumps
+STACK_SAMPLE_INTERVAL = float(os.getenv('PDF_PROFILE_SAMPLE_MS', '2')) / 1000
+_DUMP_SUFFIXES = {'pstats': '.prof', 'collapsed': '.folded'}
+
+NULL_SECTION = contextlib.nullcontext()
+
+
+class Profiler:
+    """Wall/CPU time and tracemalloc peak per named section"""
+
+    def __init__(self):
+        self.groups: Dict[str, Dict[str, Dict[str, float]]] = {}
+        self._stack: List[List[float]] = []
+        self._started_tracing = False
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+
+    def stop(self):
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def begin(self):
+        """Open a section; end() closes the most recently opened one and returns its figures"""
+        current, peak = tracemalloc.get_traced_memory()
+        if self._stack:
+            # Keep the enclosing section's peak so far before the counter is reset for this one
+            self._stack[-1][3] = max(self._stack[-1][3], peak)
+        tracemalloc.reset_peak()
+        self._stack.append([time.perf_counter(), time.process_time(), current, current])
+
+    def end(self) -> Dict[str, float]:
+        wall, cpu, start_memory, inner_peak = self._stack.pop()
+        peak = max(inner_peak, tracemalloc.get_traced_memory()[1])
+        if self._stack:
+            self._stack[-1][3] = max(self._stack[-1][3], peak)
+        return {
+            'wall_seconds': round(time.perf_counter() - wall, 4),
+            'cpu_seconds': round(time.process_time() - cpu, 4),
+            'tracemalloc_peak_kb': round((peak - start_memory) / 1024, 1),
+        }
+
+    @contextlib.contextmanager
+    def section(self, group: str, name: str):
+        """Measure the block as section name of group (repeated sections are summed, peaks maxed)"""
+        depth = len(self._stack)
+        self.begin()
+        try:
+            yield
+        finally:
+            # Drop inner sections an exception left open
+            del self._stack[depth + 1:]
+            self.record(group, name, self.end())
+
+    def record(self, group: str, name: str, figures: Dict[str, float]):
+        sections = self.groups.setdefault(group, {})
+        entry = sections.get(name)
+        if entry is None:
+            sections[name] = dict(figures)
+            return
+        entry['wall_seconds'] = round(entry['wall_seconds'] + figures['wall_seconds'], 4)
+        entry['cpu_seconds'] = round(entry['cpu_seconds'] + figures['cpu_seconds'], 4)
+        entry['tracemalloc_peak_kb'] = max(entry['tracemalloc_peak_kb'], figures['tracemalloc_peak_kb'])
+
+
+class StackSampler:
+    """Samples one thread's Python stack at a fixed interval and counts collapsed stacks"""
+
+    def __init__(self, thread_id: Optional[int] = None, interval: float = STACK_SAMPLE_INTERVAL):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._done = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        while not self._done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if names:
+                self.stacks[';'.join(reversed(names))] += 1
+
+    def __enter__(self) -> 'StackSampler':
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._done.set()
+        self._thread.join()
+        return False
+
+    def write(self, path: Path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def dump_path(directory: str, name: str, dump_format: str) -> Path:
+    Path(directory).mkdir(parents=True, exist_ok=True)
+    return Path(directory) / f"{name}{_DUMP_SUFFIXES[dump_format]}"
+
+
+def run_with_dump(func: Callable[[], Any], dump_format: str, path: Path) -> Any:
+    """Call func() under cProfile or the stack sampler and write the profile to path"""
+    if dump_format == 'pstats':
+        profile = cProfile.Profile()
+        try:
+            return profile.runcall(func)
+        finally:
+            profile.dump_stats(str(path))
+    with StackSampler() as sampler:
+        try:
+            return func()
+        finally:
+            sampler.write(path)
@@ -0,0 +1,172 @@
+"""
+Output layer for extraction results.
+
+Results are written as NDJSON: one header line with the document-level fields, then
+one line per page with that page's text, form fields and tables. Records
+(FormField, TableData, TextBlock, PageChars) are encoded directly by orjson when it
+is installed, without first copying the whole result into plain dicts. Tables are
+also written on their own to Parquet when pyarrow is installed (NDJSON otherwise);
+Excel is an optional step from that file.
+"""
+import dataclasses
+import json
+import logging
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional dependency
+    pa = pq = None
+
+logger = logging.getLogger(__name__)
+
+# Result lists written per page, with the key holding each item's page number
+PAGE_KEYS = {
+    'structured_text': 'page',
+    'form_fields': 'page_number',
+    'selected_checkboxes': 'page',
+    'selected_radio_buttons': 'page',
+    'filled_text_fields': 'page',
+    'tables': 'page',
+    'raw_material_tables': 'page',
+    'page_routes': 'page',
+}
+# Lists left out of the NDJSON: all_text_content is structured_text without the annotations
+OMITTED_KEYS = ('all_text_content',)
+
+
+def _to_builtin(obj: Any) -> Any:
+    """Fallback for objects the encoder does not know: records, mappings, column stores, NumPy scalars"""
+    if hasattr(obj, 'to_dicts'):
+        return obj.to_dicts()
+    if isinstance(obj, Mapping):
+        return dict(obj)
+    if dataclasses.is_dataclass(obj):
+        return {f.name: getattr(obj, f.name) for f in dataclasses.fields(obj)}
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    if hasattr(obj, '__dict__'):
+        return vars(obj)
+    return str(obj)
+
+
+def dumps(obj: Any) -> bytes:
+    """Encode one JSON value as UTF-8 bytes (no indentation)"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_to_builtin,
+                            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj, default=_to_builtin, ensure_ascii=False).encode('utf-8')
+
+
+def _page_of(item: Any, key: str) -> int:
+    value = item.get(key) if isinstance(item, Mapping) else getattr(item, key, None)
+    return int(value or 0)
+
+
+def iter_page_records(results: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """Header record (document-level fields) followed by one record per page"""
+    header = {k: v for k, v in results.items() if k not in PAGE_KEYS and k not in OMITTED_KEYS}
+    header['record'] = 'document'
+    yield header
+
+    pages: Dict[int, Dict[str, List[Any]]] = {}
+    for key, page_key in PAGE_KEYS.items():
+        for item in results.get(key) or []:
+            pages.setdefault(_page_of(item, page_key), {}).setdefault(key, []).append(item)
+    for page in sorted(pages):
+        yield {'record': 'page', 'page': page, **pages[page]}
+
+
+class NDJSONWriter:
+    """Appends one encoded record per line"""
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self._file = None
+        self.records = 0
+
+    def __enter__(self) -> 'NDJSONWriter':
+        self._file = open(self.path, 'wb')
+        return self
+
+    def write(self, record: Any):
+        self._file.write(dumps(record))
+        self._file.write(b'\n')
+        self.records += 1
+
+    def __exit__(self, exc_type, exc, tb):
+        self._file.close()
+        return False
+
+
+def write_results_ndjson(results: Dict[str, Any], path: str) -> str:
+    """Write a complete extract_all_data() result as NDJSON (header line, then one line per page)"""
+    with NDJSONWriter(path) as writer:
+        for record in iter_page_records(results):
+            writer.write(record)
+    return str(path)
+
+
+def _table_record(table: Any) -> Dict[str, Any]:
+    get = table.get if isinstance(table, dict) else lambda key, default=None: getattr(table, key, default)
+    rows = get('data') or get('rows') or []
+    return {
+        'page': int(get('page') or get('page_number') or 0),
+        'table_index': get('table_index'),
+        'extraction_method': get('extraction_method', ''),
+        'confidence': float(get('confidence') or 0.0),
+        'headers': ['' if cell is None else str(cell) for cell in get('headers') or []],
+        'rows': [['' if cell is None else str(cell) for cell in row] for row in rows],
+    }
+
+
+def write_tables(tables: List[Any], path_prefix: str) -> Optional[str]:
+    """
+    Write tables to '<prefix>.parquet' (one row per table, cells as nested string lists)
+    when pyarrow is available, else to '<prefix>.ndjson' with the same records.
+    Returns the path written, or None when there are no tables.
+    """
+    if not tables:
+        return None
+    records = [_table_record(table) for table in tables]
+    if pa is not None:
+        path = f"{path_prefix}.parquet"
+        pq.write_table(pa.Table.from_pylist(records), path, compression='zstd')
+        return path
+    path = f"{path_prefix}.ndjson"
+    with NDJSONWriter(path) as writer:
+        for record in records:
+            writer.write(record)
+    return path
+
+
+def read_tables(path: str) -> List[Dict[str, Any]]:
+    if path.endswith('.parquet'):
+        return pq.read_table(path).to_pylist()
+    with open(path, 'rb') as f:
+        return [orjson.loads(line) if orjson is not None else json.loads(line) for line in f if line.strip()]
+
+
+def tables_to_excel(tables_path: str, xlsx_path: str) -> str:
+    """Optional later step: one Excel sheet per table from a file written by write_tables"""
+    import pandas as pd
+
+    with pd.ExcelWriter(xlsx_path, engine='openpyxl') as writer:
+        for i, table in enumerate(read_tables(tables_path)):
+            width = max([len(table['headers'])] + [len(row) for row in table['rows']])
+            headers = table['headers'] + [f'Col_{j}' for j in range(len(table['headers']), width)]
+            rows = [row + [''] * (width - len(row)) for row in table['rows']]
+            pd.DataFrame(rows, columns=headers).to_excel(writer, sheet_name=f"Table_{i + 1}"[:31], index=False)
+    return xlsx_path
@@ -0,0 +1,105 @@
+"""
+Streaming consolidation of per-page extraction results.
+
+EnhancedPDFExtractor.iter_pages() yields one page of results at a time;
+StreamingConsolidator writes each page into a single JSON document as it arrives
+and keeps only document-level aggregates (counts and the distinct Roman numerals,
+formulas and special characters), so memory is bounded by the page in flight.
+"""
+import logging
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from serializers import dumps
+
+logger = logging.getLogger(__name__)
+
+# Per-page counters summed into the document summary
+_COUNTED = ('structured_text', 'form_fields', 'selected_checkboxes', 'selected_radio_buttons',
+            'filled_text_fields', 'tables', 'ocr')
+# Per-page value lists merged (deduplicated) into the document summary
+_MERGED = ('roman_numerals', 'formulas_and_equations', 'special_characters')
+
+
+class StreamingConsolidator:
+    """
+    Writes {"file_path", "pages": [...], "summary": {...}} incrementally.
+
+    Use as a context manager; call add_page() per page and read .summary after the
+    block. The summary's 'extraction_plan' is set from close(plan=...).
+    """
+
+    def __init__(self, output_path: str, file_path: str):
+        self.output_path = Path(output_path)
+        self.file_path = file_path
+        self.summary: Dict[str, Any] = {}
+        self._file = None
+        self._counts = {key: 0 for key in _COUNTED}
+        self._merged = {key: {} for key in _MERGED}
+        self._routes = {}
+        self._pages = 0
+        self._raw_material_tables = 0
+        self._start = None
+
+    def __enter__(self) -> 'StreamingConsolidator':
+        self._start = time.perf_counter()
+        self._file = open(self.output_path, 'wb')
+        self._file.write(b'{"file_path": ' + dumps(self.file_path) + b', "pages": [\n')
+        return self
+
+    def add_page(self, page: Dict[str, Any]):
+        if self._pages:
+            self._file.write(b',\n')
+        self._file.write(dumps(page))
+        self._pages += 1
+
+        for key in _COUNTED:
+            self._counts[key] += len(page.get(key, []))
+        for key in _MERGED:
+            # Dicts keep first-seen order and dedupe without a second structure
+            self._merged[key].update(dict.fromkeys(page.get(key, [])))
+        self._raw_material_tables += page.get('raw_material_tables', 0)
+        route = self._routes.setdefault(page.get('content_class'), {'pages': 0, 'seconds': 0.0})
+        route['pages'] += 1
+        route['seconds'] = round(route['seconds'] + sum(page.get('seconds', {}).values()), 4)
+
+    def close(self, plan: Optional[Dict[str, Any]] = None):
+        if self._file is None:
+            return
+        self.summary = {
+            'total_pages': self._pages,
+            'total_text_items': self._counts['structured_text'],
+            'total_form_fields': self._counts['form_fields'],
+            'selected_checkboxes_count': self._counts['selected_checkboxes'],
+            'selected_radio_buttons_count': self._counts['selected_radio_buttons'],
+            'filled_text_fields_count': self._counts['filled_text_fields'],
+            'total_tables': self._counts['tables'],
+            'raw_material_tables_count': self._raw_material_tables,
+            'ocr_pages': self._counts['ocr'],
+            'roman_numerals': list(self._merged['roman_numerals']),
+            'formulas_and_equations': list(self._merged['formulas_and_equations']),
+            'special_characters': list(self._merged['special_characters']),
+            'routes': self._routes,
+            'elapsed_s': round(time.perf_counter() - self._start, 3),
+        }
+        if plan is not None:
+            self.summary['extraction_plan'] = {k: v for k, v in plan.items() if k != 'pages'}
+        self._file.write(b'\n], "summary": ' + dumps(self.summary) + b'}\n')
+        self._file.close()
+        self._file = None
+        logger.info(f"Streamed {self._pages} pages to {self.output_path} in {self.summary['elapsed_s']}s")
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+def stream_extraction(extractor, output_path: str) -> Dict[str, Any]:
+    """Run extractor.iter_pages() into output_path; returns the document summary"""
+    consolidator = StreamingConsolidator(output_path, str(extractor.pdf_path))
+    with consolidator:
+        for page in extractor.iter_pages():
+            consolidator.add_page(page)
+        consolidator.close(plan=extractor.plan)
+    return consolidator.summary
@@ -0,0 +1,288 @@
+"""
+Resident JVM for tabula.
+
+tabula.read_pdf starts a Java process per call unless jpype is installed, and even
+with jpype the JVM only lives as long as the Python process that started it. The
+extractor runs every method in a short-lived process, so both paths paid JVM startup
+per document. TabulaSidecar keeps one long-lived helper process (with its JVM) per
+worker, serves read_pdf calls over a local connection and is restarted when a health
+check fails. read_pdf calls run on their own threads (taking turns on the one JVM), so
+pings are still answered while a long call is running. Only the
+process that started the sidecar restarts it: method processes are handed its address
+and key (TabulaSidecar.attach) and, when it is unreachable, run their call with tabula's
+own JVM instead of starting a second resident one.
+
+The JVM is only resident with jpype; without it tabula-py starts Java per call anyway,
+so the sidecar would save nothing. start() then stops it again and raises, and the
+sidecar stays unavailable for the life of the process. The sidecar leads its own process group, so stopping it also stops a Java
+process tabula started for a call.
+"""
+import logging
+import multiprocessing
+import os
+import secrets
+import signal
+import sys
+import threading
+import time
+from multiprocessing.connection import Client, Listener
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait for the sidecar to start, and for a health check reply
+SIDECAR_START_TIMEOUT = float(os.getenv('TABULA_SIDECAR_START_TIMEOUT', '60'))
+SIDECAR_PING_TIMEOUT = float(os.getenv('TABULA_SIDECAR_PING_TIMEOUT', '5'))
+# Java options for the resident JVM (it is started once, so they cannot change per call)
+SIDECAR_JAVA_OPTIONS = os.getenv('TABULA_JAVA_OPTIONS', '-Xmx512m').split()
+
+
+def _jvm_backend() -> str:
+    """Which tabula backend the sidecar ended up with: 'jpype' (in-process JVM) or 'subprocess'"""
+    import tabula.io
+    vm = tabula.io._tabula_vm
+    if vm is None:
+        return 'not started'
+    return 'jpype' if getattr(vm, 'tabula', None) is not None else 'subprocess'
+
+
+def _warm_up(java_options: List[str]):
+    # Start the JVM and load tabula-java before the first document arrives
+    import tabula.io
+    from tabula.backend import TabulaVm
+    if tabula.io._tabula_vm is None:
+        vm = TabulaVm(java_options=list(java_options), silent=True)
+        if vm.tabula is not None:
+            tabula.io._tabula_vm = vm
+
+
+def _read_pdf_direct(path: str, **kwargs) -> List[Any]:
+    import tabula
+    return tabula.read_pdf(path, **kwargs)
+
+
+def _serve(ready, authkey: bytes, java_options: List[str]):
+    """Sidecar process: answer pings and shutdown inline, read_pdf requests on a thread each"""
+    import tabula
+
+    if hasattr(os, 'setsid'):
+        os.setsid()
+    family = 'AF_UNIX' if sys.platform != 'win32' else 'AF_INET'
+    address = None if family == 'AF_UNIX' else ('127.0.0.1', 0)
+    with Listener(address, family=family, authkey=authkey) as listener:
+        try:
+            _warm_up(java_options)
+        except Exception as e:
+            logger.warning(f"Tabula sidecar could not start a resident JVM: {e}")
+        ready.send(listener.address)
+        ready.close()
+
+        started = time.time()
+        state = {'served': 0, 'busy': 0}
+        state_lock, jvm_lock = threading.Lock(), threading.Lock()
+
+        def read_pdf(conn, request):
+            # On its own thread, so the accept loop keeps answering pings meanwhile
+            with conn:
+                try:
+                    with jvm_lock:
+                        tables = tabula.read_pdf(request['path'], **request['kwargs'])
+                    conn.send({'status': 'ok', 'tables': tables})
+                except Exception as e:
+                    try:
+                        conn.send({'status': 'error', 'error': str(e)})
+                    except OSError:
+                        pass  # the caller is gone
+                finally:
+                    with state_lock:
+                        state['busy'] -= 1
+                        state['served'] += 1
+
+        while True:
+            try:
+                conn = listener.accept()
+                request = conn.recv()
+            except Exception as e:
+                logger.warning(f"Tabula sidecar rejected a connection: {e}")
+                continue
+            command = request.get('command')
+            if command == 'read_pdf':
+                with state_lock:
+                    state['busy'] += 1
+                threading.Thread(target=read_pdf, args=(conn, request), name='tabula-read-pdf', daemon=True).start()
+                continue
+            with conn:
+                if command == 'ping':
+                    with state_lock:
+                        counts = {'requests_served': state['served'], 'busy': state['busy']}
+                    conn.send({'status': 'ok', 'pid': os.getpid(), 'backend': _jvm_backend(),
+                               'uptime_s': round(time.time() - started, 1), **counts})
+                elif command == 'shutdown':
+                    conn.send({'status': 'ok'})
+                    return
+
+
+class TabulaSidecar:
+    """Client for a resident tabula process; started on first use and restarted when it dies or hangs"""
+
+    def __init__(self, java_options: Optional[List[str]] = None):
+        self.java_options = java_options or SIDECAR_JAVA_OPTIONS
+        self.authkey = secrets.token_bytes(16)
+        self.address = None
+        self.process = None
+        self.owner_pid = None
+        self.attached = False
+        # Why a resident JVM cannot be had in this process (jpype missing), once start() found out
+        self.unavailable = None
+        self.restarts = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def attach(cls, address, authkey: bytes) -> 'TabulaSidecar':
+        """Client of a sidecar another process started (see connection()); it never starts or restarts one"""
+        sidecar = cls()
+        sidecar.address = address
+        sidecar.authkey = authkey
+        sidecar.attached = True
+        return sidecar
+
+    def connection(self) -> Optional[Tuple[Any, bytes]]:
+        """(address, authkey) for attach() in another process; None while not running"""
+        return (self.address, self.authkey) if self.address is not None else None
+
+    def is_owner(self) -> bool:
+        """Whether this process started the sidecar (or none is started yet); only the owner starts or restarts it"""
+        return not self.attached and (self.owner_pid is None or os.getpid() == self.owner_pid)
+
+    def is_alive(self) -> bool:
+        if not self.is_owner():
+            # Other processes cannot poll the owner's child; a broken connection tells instead
+            return self.address is not None
+        return self.process is not None and self.process.is_alive()
+
+    def start(self):
+        # Spawn, so the sidecar never inherits a half-initialised JVM or the caller's open documents
+        ctx = multiprocessing.get_context('spawn')
+        reader, writer = ctx.Pipe(duplex=False)
+        self.process = ctx.Process(target=_serve, args=(writer, self.authkey, self.java_options),
+                                   name='tabula-sidecar', daemon=True)
+        self.process.start()
+        self.owner_pid = os.getpid()
+        writer.close()
+        if not reader.poll(SIDECAR_START_TIMEOUT):
+            self.stop()
+            raise RuntimeError(f"Tabula sidecar did not start within {SIDECAR_START_TIMEOUT}s")
+        self.address = reader.recv()
+        reader.close()
+        backend = self._request({'command': 'ping'}, timeout=SIDECAR_PING_TIMEOUT)['backend']
+        if backend != 'jpype':
+            self.stop()
+            self.unavailable = f"no resident JVM (tabula backend '{backend}', is jpype1 installed?)"
+            raise RuntimeError(self.unavailable)
+        logger.info(f"Tabula sidecar started (pid {self.process.pid})")
+
+    def stop(self):
+        # Only the process that started the sidecar shuts it down; forked users just drop their handle
+        if self.process is not None and os.getpid() == self.owner_pid and self.process.is_alive():
+            try:
+                self._request({'command': 'shutdown'}, timeout=SIDECAR_PING_TIMEOUT)
+            except Exception:
+                pass
+            self._kill()
+        self.process = None
+        self.address = None
+
+    def _kill(self):
+        # The whole group: a java subprocess still busy with a cancelled call must go too
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except (AttributeError, ProcessLookupError, PermissionError):
+            self.process.terminate()
+        self.process.join(5)
+
+    def cancel(self):
+        """
+        Abandon the read_pdf in flight after its caller was killed. tabula-java cannot be
+        interrupted mid-call, so the sidecar is replaced; the next call starts a new one.
+        """
+        with self._lock:
+            if self.process is not None and os.getpid() == self.owner_pid:
+                logger.warning("Cancelling tabula sidecar request")
+                self._kill()
+                self.process = None
+                self.address = None
+
+    def restart(self):
+        if not self.is_owner():
+            raise RuntimeError("tabula sidecar belongs to another process")
+        logger.warning("Restarting tabula sidecar")
+        self.stop()
+        self.restarts += 1
+        self.start()
+
+    def _request(self, request: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+        with Client(self.address, authkey=self.authkey) as conn:
+            conn.send(request)
+            if timeout is not None and not conn.poll(timeout):
+                raise TimeoutError(f"tabula sidecar did not answer {request['command']} within {timeout}s")
+            return conn.recv()
+
+    def health_check(self) -> Dict[str, Any]:
+        """Ping the sidecar; returns its status, or {'status': 'down', ...} if it is dead or not answering"""
+        if not self.is_alive():
+            return {'status': 'down', 'reason': 'not running'}
+        try:
+            health = self._request({'command': 'ping'}, timeout=SIDECAR_PING_TIMEOUT)
+        except Exception as e:
+            return {'status': 'down', 'reason': str(e)}
+        health['restarts'] = self.restarts
+        return health
+
+    def ensure_running(self) -> Dict[str, Any]:
+        """Start or restart the sidecar unless it passes a health check"""
+        with self._lock:
+            if not self.is_owner():
+                return self.health_check()
+            if self.unavailable:
+                raise RuntimeError(self.unavailable)
+            if self.process is None:
+                self.start()
+            elif self.health_check()['status'] != 'ok':
+                self.restart()
+            return self.health_check()
+
+    def read_pdf(self, path: str, **kwargs) -> List[Any]:
+        """
+        tabula.read_pdf in the resident JVM; retried once on a fresh sidecar if the connection
+        breaks. Another process's sidecar is not restarted; tabula is called directly instead.
+        """
+        for attempt in (1, 2):
+            if not self.is_owner() and self.address is None:
+                return _read_pdf_direct(path, **kwargs)
+            if not self.is_alive():
+                self.ensure_running()
+            try:
+                response = self._request({'command': 'read_pdf', 'path': str(path), 'kwargs': kwargs})
+                break
+            except (EOFError, ConnectionError, OSError):
+                if not self.is_owner():
+                    logger.warning("Tabula sidecar unreachable from this process; using a JVM for this call")
+                    return _read_pdf_direct(path, **kwargs)
+                if attempt == 2:
+                    raise
+                with self._lock:
+                    self.restart()
+        if response['status'] != 'ok':
+            raise RuntimeError(response['error'])
+        return response['tables']
+
+
+_sidecar = None
+
+
+def get_tabula_sidecar() -> TabulaSidecar:
+    """Per-process sidecar; other processes use it through TabulaSidecar.attach(*sidecar.connection())"""
+    global _sidecar
+    if _sidecar is None:
+        _sidecar = TabulaSidecar()
+    return _sidecar
@@ -4,25 +4,169 @@ import pandas as pd
 import tabula
 import camelot
 import pdfplumber
-from typing import Dict, List, Any, Optional, Tuple, Union
+from typing import Dict, List, Any, Iterator, Optional, Tuple, Union
 import re
 import json
 import logging
-from dataclasses import dataclass, field
+from collections.abc import Mapping
+from dataclasses import dataclass, field, fields, is_dataclass
 from pathlib import Path
 import unicodedata
+import hashlib
 import cv2
 import numpy as np
-from PIL import Image
-import pytesseract  # OCR for scanned PDFs
 import os
+import io
+import signal
+import sys
 import datetime
+import time
+import multiprocessing
+from multiprocessing.connection import wait
+from concurrent.futures import ProcessPoolExecutor
+from tabula_sidecar import TabulaSidecar, get_tabula_sidecar
+from ocr_engine import OCREngine, DEFAULT_OCR_DPI, DEFAULT_OCR_LANG, DEFAULT_OCR_WORKERS, tesseract_version
+from extraction_cache import ExtractionCache, DEFAULT_METHOD_CACHE_DIR, cache_key, library_versions
+from pattern_matcher import MultiPatternMatcher
+from profiling import Profiler, NULL_SECTION, PROFILE_DUMP_FORMATS, DEFAULT_PROFILE_DIR, dump_path, run_with_dump
+import serializers
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-@dataclass
+# Page-parallel extraction defaults (workers=1 keeps the serial path)
+DEFAULT_PAGE_WORKERS = int(os.getenv('PDF_PAGE_WORKERS', '1'))
+DEFAULT_PAGE_CHUNK_SIZE = int(os.getenv('PDF_PAGE_CHUNK_SIZE', '8'))
+
+# Extraction methods as (key, extractor method, label in extraction_methods_used), in consolidation order
+EXTRACTION_METHODS = [
+    ('pymupdf', '_extract_with_pymupdf', 'PyMuPDF'),
+    ('pdfplumber', '_extract_with_pdfplumber', 'PDFPlumber'),
+    ('pypdf2', '_extract_with_pypdf2', 'PyPDF2'),
+    ('tabula', '_extract_with_tabula', 'Table Extractors'),
+    ('camelot', '_extract_with_camelot', 'Table Extractors'),
+    ('ocr', '_extract_with_ocr', 'OCR'),
+]
+
+# Planner modes: 'fast' runs the minimum per page, 'balanced' skips methods that cannot help,
+# 'exhaustive' runs every method on every page (the behaviour before the planner)
+PLANNER_MODES = ('fast', 'balanced', 'exhaustive')
+DEFAULT_PLANNER_MODE = os.getenv('PDF_EXTRACTION_MODE', 'balanced')
+
+# Rough cost model per method as (startup ms, ms per page), measured on the sample docs
+METHOD_COST_MS = {
+    'pymupdf': (5, 5),
+    'pdfplumber': (20, 150),
+    'pypdf2': (5, 15),
+    'tabula': (1500, 100),
+    'camelot': (300, 400),
+    'ocr': (200, 1500),
+}
+
+# A page needs this many horizontal and vertical rules before lattice table readers can find a grid
+MIN_TABLE_RULES = 3
+# Pages whose images cover this much of the page and carry little text are treated as scanned
+SCANNED_IMAGE_COVERAGE = 0.5
+SCANNED_MAX_TEXT_CHARS = 100
+# Page content classes the planner routes on: image pages with a text layer are 'mixed', ruled or
+# widget pages without large images are 'vector_form'
+PAGE_CLASSES = ('born_digital', 'scanned', 'vector_form', 'mixed')
+
+# Parsed documents are reopened after this many pages; PyMuPDF and pdfminer keep every object
+# they parsed alive until the document is closed, so long documents otherwise grow without bound
+DOCUMENT_RECYCLE_PAGES = int(os.getenv('PDF_DOCUMENT_RECYCLE_PAGES', '25'))
+
+# 'resident' sends Tabula calls to a long-lived JVM sidecar, 'subprocess' lets tabula-py start Java per call;
+# resident needs jpype1 and falls back to subprocess without it
+TABULA_MODES = ('resident', 'subprocess')
+DEFAULT_TABULA_MODE = os.getenv('TABULA_MODE', 'resident')
+
+# Character-level data from PDFPlumber: 'columnar' (PageChars), 'dicts' (one dict per glyph) or 'none'
+CHAR_STORAGE_MODES = ('columnar', 'dicts', 'none')
+DEFAULT_CHAR_STORAGE = os.getenv('PDF_CHAR_STORAGE', 'columnar')
+
+# Seconds each method may run before it is cancelled; its partial work is discarded
+DEFAULT_METHOD_TIMEOUTS = {
+    'pymupdf': 120,
+    'pdfplumber': 300,
+    'pypdf2': 60,
+    'tabula': 180,
+    'camelot': 180,
+    'ocr': 600,
+}
+# Method processes alive at once when methods run concurrently; 0 starts every method at once.
+# 1 runs them one after another, each still in its own process under its timeout (batch workers)
+DEFAULT_METHOD_PROCESSES = int(os.getenv('PDF_METHOD_PROCESSES', '0'))
+# Seconds the iter_pages worker gets to exit after the last page before it is killed
+STREAM_WORKER_STOP_TIMEOUT = 10
+
+# Text reconciliation: a line from a later method is dropped when this share of its words is already on the page
+TEXT_DEDUP_OVERLAP = 0.8
+DEFAULT_TEXT_DEDUP = os.getenv('PDF_TEXT_DEDUP', '1') != '0'
+
+# Table reconciliation: candidates from different methods on a page are one table at this match score
+TABLE_MATCH_THRESHOLD = 0.5
+DEFAULT_TABLE_RECONCILE = os.getenv('PDF_TABLE_RECONCILE', '1') != '0'
+
+# Method results are cached on disk per (PDF hash, method, method config, library versions);
+# bump the version when a method's output changes so older entries stop matching
+METHOD_CACHE_VERSION = 2
+# Distributions whose versions are part of each method's cache key
+METHOD_LIBRARIES = {
+    'pymupdf': ('PyMuPDF',),
+    'pdfplumber': ('pdfplumber', 'pdfminer.six'),
+    'pypdf2': ('PyPDF2',),
+    'tabula': ('tabula-py',),
+    'camelot': ('camelot-py',),
+    'ocr': ('PyMuPDF', 'pytesseract'),
+}
+
+# Opt-in profiling: wall/CPU time and tracemalloc peak per method, phase and page in the statistics.
+# The dump is a per-document cProfile file ('pstats') or flamegraph input ('collapsed') in the profile directory
+DEFAULT_PROFILE = os.getenv('PDF_PROFILE', '0') != '0'
+DEFAULT_PROFILE_DUMP = os.getenv('PDF_PROFILE_DUMP') or None
+
+# Content detectors, compiled once and run per deduplicated text item
+ROMAN_NUMERAL_RE = re.compile(
+    r'\b(?=[MDCLXVI])M{0,3}(?:C[MD]|D?C{0,3})?(?:X[CL]|L?X{0,3})?(?:I[XV]|V?I{0,3})?\b', re.IGNORECASE)
+FORMULA_RES = [
+    re.compile(r'[A-Za-z0-9]+\s*[+\-*/=]\s*[A-Za-z0-9]+'),  # Basic equations
+    re.compile(r'[A-Za-z]+\d*\s*[\+\-]\s*[A-Za-z]+\d*'),     # Chemical formulas
+    re.compile(r'\d+\.\d+\s*[A-Za-z%]+'),                     # Percentages/measurements
+    re.compile(r'[A-Za-z]+\(\w+\)'),                          # Function notation
+]
+NON_ASCII_RE = re.compile(r'[^\x00-\x7f]')
+NUMBERED_LIST_RE = re.compile(r'^\d+\.')
+HEADING_RE = re.compile(r'^[A-Z][^.]*:$')
+RAW_MATERIAL_RE = re.compile(r'raw\s+material', re.IGNORECASE)
+# Keywords tagged (case-insensitively) alongside the document's formulas, with their tag
+CONTENT_KEYWORDS = {
+    'raw material': 'raw_material',
+}
+
+@dataclass(frozen=True, slots=True)
+class FontInfo:
+    """Font of a text line; one shared instance per distinct descriptor (see intern_font_info)"""
+    font: str = ''
+    size: float = 0
+    flags: int = 0
+    color: int = 0
+
+_font_infos: Dict[Tuple[str, float, int, int], FontInfo] = {}
+
+def intern_font_info(font: str, size: float, flags: int, color: int) -> FontInfo:
+    key = (font, size, flags, color)
+    info = _font_infos.get(key)
+    if info is None:
+        info = _font_infos[key] = FontInfo(sys.intern(font), size, flags, color)
+    return info
+
+def record_dict(record) -> Dict[str, Any]:
+    """Field dict of a slotted record, in field order (the shape __dict__ used to give)"""
+    return {f.name: getattr(record, f.name) for f in fields(record)}
+
+@dataclass(frozen=True, slots=True)
 class FormField:
     """Enhanced data class to store form field information"""
     name: str
@@ -34,7 +178,7 @@ class FormField:
     page_number: int = 0
     raw_text: str = ""
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class TableData:
     """Enhanced data class to store table information"""
     page_number: int
@@ -46,15 +190,97 @@ class TableData:
     confidence: float = 0.0
     raw_text: str = ""
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class TextBlock:
     """Data class for text blocks"""
     text: str
     page_number: int
     coordinates: Tuple[float, float, float, float] = None
-    font_info: Dict = field(default_factory=dict)
+    font_info: Optional[FontInfo] = None
     is_structured: bool = False
 
+class StructuredText(Mapping):
+    """
+    A structured_text item: the consolidated text item plus its content_type and matches.
+    Reads through to the item instead of copying it; iterates like {**item, content_type, matches}.
+    """
+    __slots__ = ('item', 'content_type', 'matches')
+    
+    def __init__(self, item: Dict[str, Any], content_type: str, matches: List[Dict[str, Any]]):
+        self.item = item
+        self.content_type = content_type
+        self.matches = matches
+    
+    def __getitem__(self, key: str) -> Any:
+        if key == 'content_type':
+            return self.content_type
+        if key == 'matches':
+            return self.matches
+        return self.item[key]
+    
+    def __iter__(self) -> Iterator[str]:
+        yield from self.item
+        yield 'content_type'
+        yield 'matches'
+    
+    def __len__(self) -> int:
+        return len(self.item) + 2
+
+class PageChars:
+    """
+    Character-level data of one page stored column-wise: one NumPy struct array for the
+    boxes, a dictionary-encoded font column and the glyph text as one string with offsets.
+    Roughly 50 bytes per character instead of a 7-key dict; to_dicts() rebuilds the old shape.
+    """
+    __slots__ = ('boxes', 'fonts', 'text', 'offsets')
+    
+    DTYPE = np.dtype([('x0', 'f8'), ('y0', 'f8'), ('x1', 'f8'), ('y1', 'f8'), ('size', 'f8'), ('font', 'u2')])
+    
+    def __init__(self, boxes: np.ndarray, fonts: List[str], text: str, offsets: np.ndarray):
+        self.boxes = boxes
+        self.fonts = fonts
+        self.text = text
+        self.offsets = offsets
+    
+    @classmethod
+    def from_pdfplumber(cls, chars: List[Dict[str, Any]]) -> 'PageChars':
+        font_codes = {}
+        rows = []
+        texts = []
+        for char in chars:
+            fontname = char.get('fontname', '')
+            code = font_codes.setdefault(fontname, len(font_codes))
+            rows.append((char.get('x0', 0), char.get('y0', 0), char.get('x1', 0), char.get('y1', 0),
+                         char.get('size', 0), code))
+            texts.append(char.get('text', ''))
+        offsets = np.zeros(len(texts) + 1, dtype=np.int32)
+        np.cumsum([len(t) for t in texts], out=offsets[1:])
+        return cls(np.array(rows, dtype=cls.DTYPE), [sys.intern(f) for f in font_codes], ''.join(texts), offsets)
+    
+    def __len__(self) -> int:
+        return len(self.boxes)
+    
+    def char(self, index: int) -> str:
+        return self.text[self.offsets[index]:self.offsets[index + 1]]
+    
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        """Materialize the per-character dicts _extract_with_pdfplumber used to build"""
+        columns = {name: self.boxes[name].tolist() for name in ('x0', 'y0', 'x1', 'y1', 'size')}
+        fonts = [self.fonts[code] for code in self.boxes['font'].tolist()]
+        return [{
+            'char': self.char(i),
+            'x0': columns['x0'][i],
+            'y0': columns['y0'][i],
+            'x1': columns['x1'][i],
+            'y1': columns['y1'][i],
+            'fontname': fonts[i],
+            'size': columns['size'][i]
+        } for i in range(len(self))]
+    
+    @property
+    def nbytes(self) -> int:
+        return self.boxes.nbytes + self.offsets.nbytes + len(self.text.encode('utf-8'))
+
 class EnhancedPDFExtractor:
     """
     Comprehensive PDF data extractor with enhanced accuracy for:
@@ -65,18 +291,154 @@ class EnhancedPDFExtractor:
     - OCR support for scanned PDFs
     """
     
-    def __init__(self, pdf_path: str, enable_ocr: bool = True):
+    def __init__(self, pdf_path: str, enable_ocr: bool = True, workers: int = DEFAULT_PAGE_WORKERS,
+                 page_chunk_size: int = DEFAULT_PAGE_CHUNK_SIZE, concurrent_methods: bool = True,
+                 method_timeouts: Optional[Dict[str, float]] = None, method_processes: int = DEFAULT_METHOD_PROCESSES,
+                 mode: str = DEFAULT_PLANNER_MODE,
+                 method_pages: Optional[Dict[str, List[int]]] = None, tabula_mode: str = DEFAULT_TABULA_MODE,
+                 char_storage: str = DEFAULT_CHAR_STORAGE, ocr_dpi: int = DEFAULT_OCR_DPI,
+                 ocr_workers: int = DEFAULT_OCR_WORKERS, dedup_text: bool = DEFAULT_TEXT_DEDUP,
+                 reconcile_tables: bool = DEFAULT_TABLE_RECONCILE, cache_dir: Optional[str] = DEFAULT_METHOD_CACHE_DIR,
+                 profile: bool = DEFAULT_PROFILE, profile_dump: Optional[str] = DEFAULT_PROFILE_DUMP,
+                 profile_dir: str = DEFAULT_PROFILE_DIR):
+        if mode not in PLANNER_MODES:
+            raise ValueError(f"mode must be one of {PLANNER_MODES}, got {mode!r}")
+        if tabula_mode not in TABULA_MODES:
+            raise ValueError(f"tabula_mode must be one of {TABULA_MODES}, got {tabula_mode!r}")
+        if char_storage not in CHAR_STORAGE_MODES:
+            raise ValueError(f"char_storage must be one of {CHAR_STORAGE_MODES}, got {char_storage!r}")
+        if profile_dump is not None and profile_dump not in PROFILE_DUMP_FORMATS:
+            raise ValueError(f"profile_dump must be None or one of {PROFILE_DUMP_FORMATS}, got {profile_dump!r}")
         self.pdf_path = Path(pdf_path)
         self.enable_ocr = enable_ocr
+        self.mode = mode
+        self.tabula_mode = tabula_mode
+        self.char_storage = char_storage
+        self.ocr_dpi = ocr_dpi
+        self.ocr_workers = ocr_workers
+        self.dedup_text = dedup_text
+        self.reconcile_tables = reconcile_tables
+        # Directory of the per-method result cache; None or '' disables it
+        self.cache_dir = cache_dir or None
+        self.cache_stats = {'enabled': self.cache_dir is not None, 'hits': {}, 'misses': [], 'stored_bytes': 0}
+        # Profiling is off unless asked for; a dump implies it. Without a Profiler sections are no-ops
+        self.profile_dump = profile_dump
+        self.profile_dir = profile_dir
+        self._profiler = Profiler() if profile or profile_dump else None
+        self.profile_dumps = []
+        self.plan = None
+        self.tabula_health = None
+        # Methods that raised or returned an 'error' instead of a result
+        self.failed_methods = []
+        # Sidecar of the parent process, when this extractor runs one method in a child
+        self._tabula_client = None
+        # (process, connection) of the iter_pages worker while it runs
+        self._stream_worker = None
+        # Pages (0-based) each method is limited to, as chosen by the planner; absent means all pages
+        self.method_pages = method_pages or {}
+        self.workers = max(1, workers)
+        self.page_chunk_size = max(1, page_chunk_size)
+        self.concurrent_methods = concurrent_methods
+        self.method_timeouts = {**DEFAULT_METHOD_TIMEOUTS, **(method_timeouts or {})}
+        self.method_processes = max(0, method_processes)
         self.form_fields = []
         self.tables = []
         self.text_blocks = []
         self.extraction_log = []
+        # File bytes and PyMuPDF document, read and parsed once per extraction
+        self._pdf_bytes = None
+        self._doc = None
+        self._plumber_pdf = None
+        # Streaming opens the documents from the file instead: the bytes grow with the page count
+        self._from_file = False
+        self._page_pool = None
+        self._method_cache = None
+        self._pdf_sha256 = None
+    
+    def _document(self) -> fitz.Document:
+        """Shared PyMuPDF document, opened from the in-memory bytes (or the file) on first use"""
+        if self._doc is None:
+            if self._from_file:
+                self._doc = fitz.open(self.pdf_path)
+            else:
+                self._doc = fitz.open(stream=self._read_bytes(), filetype='pdf')
+        return self._doc
+    
+    def _read_bytes(self) -> bytes:
+        """PDF file contents, read from disk once"""
+        if self._pdf_bytes is None:
+            self._pdf_bytes = self.pdf_path.read_bytes()
+        return self._pdf_bytes
+    
+    def _pdf_stream(self) -> io.BufferedIOBase:
+        """Fresh stream over the shared bytes (no copy), or the file, for libraries that take a file object"""
+        return open(self.pdf_path, 'rb') if self._from_file else io.BytesIO(self._read_bytes())
+    
+    def _release_documents(self):
+        """Close the parsed documents (they are reopened from the bytes on next use)"""
+        if self._plumber_pdf is not None:
+            self._plumber_pdf.close()
+        if self._doc is not None:
+            self._doc.close()
+            # MuPDF keeps decoded fonts and images in a process-wide store of up to 256 MB
+            fitz.TOOLS.store_shrink(100)
+        self._plumber_pdf = None
+        self._doc = None
+    
+    def close(self):
+        """Release the shared document, file bytes and page worker pool"""
+        if self._page_pool is not None:
+            self._page_pool.shutdown()
+        self._release_documents()
+        self._page_pool = None
+        self._pdf_bytes = None
+    
+    def _page_chunks(self, pages: List[int]) -> List[List[int]]:
+        return [pages[start:start + self.page_chunk_size] for start in range(0, len(pages), self.page_chunk_size)]
+    
+    def _map_pages(self, method_name: str, pages: List[int]) -> List[Dict[str, List]]:
+        """
+        Run a per-page-range method over all pages and return its partial results in page order.
+        
+        With more than one worker the page chunks are fanned out over a process pool whose
+        workers each hold their own copy of the document; otherwise the method runs in-process.
+        """
+        chunks = self._page_chunks(pages)
+        if self.workers == 1 or len(chunks) <= 1:
+            return [getattr(self, method_name)(pages)]
+        if self._page_pool is None:
+            self._page_pool = ProcessPoolExecutor(
+                max_workers=min(self.workers, len(chunks)),
+                initializer=_init_page_worker,
+                initargs=(str(self.pdf_path), self._read_bytes(), self._profiler is not None)
+            )
+        return list(self._page_pool.map(_run_page_chunk, [method_name] * len(chunks), chunks))
+    
+    @staticmethod
+    def _merge_page_results(partials: List[Dict[str, List]]) -> Dict[str, List]:
+        merged = {key: [] for key in partials[0]}
+        for partial in partials:
+            for key, items in partial.items():
+                merged[key].extend(items)
+        return merged
         
     def extract_all_data(self) -> Dict[str, Any]:
         """
         Main method to extract ALL data from PDF with enhanced accuracy
         """
+        if self._profiler is None:
+            return self._extract_all_data()
+        self._profiler.start()
+        try:
+            if self.profile_dump is None:
+                return self._extract_all_data()
+            path = self._profile_dump_path()
+            self.profile_dumps.append(str(path))
+            return run_with_dump(self._extract_all_data, self.profile_dump, path)
+        finally:
+            self._profiler.stop()
+    
+    def _extract_all_data(self) -> Dict[str, Any]:
         try:
             logger.info(f"Starting extraction from: {self.pdf_path}")
             
@@ -104,62 +466,44 @@ class EnhancedPDFExtractor:
             }
             
             # Get basic PDF info
-            pdf_info = self._get_pdf_info()
+            with self._section('phases', 'pdf_info'):
+                pdf_info = self._get_pdf_info()
             extraction_results.update(pdf_info)
             
-            # Extract using multiple methods for maximum coverage
-            methods_results = {}
-            
-            # Method 1: PyMuPDF (most comprehensive)
-            try:
-                methods_results['pymupdf'] = self._extract_with_pymupdf()
-                extraction_results['extraction_methods_used'].append('PyMuPDF')
-            except Exception as e:
-                logger.error(f"PyMuPDF extraction failed: {e}")
-                self.extraction_log.append(f"PyMuPDF failed: {e}")
-            
-            # Method 2: PDFPlumber (good for tables and structured text)
-            try:
-                methods_results['pdfplumber'] = self._extract_with_pdfplumber()
-                extraction_results['extraction_methods_used'].append('PDFPlumber')
-            except Exception as e:
-                logger.error(f"PDFPlumber extraction failed: {e}")
-                self.extraction_log.append(f"PDFPlumber failed: {e}")
-            
-            # Method 3: PyPDF2 (form fields)
-            try:
-                methods_results['pypdf2'] = self._extract_with_pypdf2()
-                extraction_results['extraction_methods_used'].append('PyPDF2')
-            except Exception as e:
-                logger.error(f"PyPDF2 extraction failed: {e}")
-                self.extraction_log.append(f"PyPDF2 failed: {e}")
+            # Plan which methods run on which pages, then extract with them
+            with self._section('phases', 'plan'):
+                plan = self._plan_extraction()
+            extraction_results['extraction_plan'] = plan
+            extraction_results['is_scanned_pdf'] = plan['is_scanned_pdf']
+            method_keys = [key for key, decision in plan['methods'].items() if decision['run']]
             
-            # Method 4: Tabula and Camelot (tables)
-            try:
-                methods_results['table_extractors'] = self._extract_tables_comprehensive()
-                extraction_results['extraction_methods_used'].append('Table Extractors')
-            except Exception as e:
-                logger.error(f"Table extraction failed: {e}")
-                self.extraction_log.append(f"Table extraction failed: {e}")
-            
-            # Method 5: OCR if needed
-            if self.enable_ocr and self._is_scanned_pdf():
-                try:
-                    methods_results['ocr'] = self._extract_with_ocr()
-                    extraction_results['extraction_methods_used'].append('OCR')
-                    extraction_results['is_scanned_pdf'] = True
-                except Exception as e:
-                    logger.error(f"OCR extraction failed: {e}")
-                    self.extraction_log.append(f"OCR failed: {e}")
+            with self._section('phases', 'methods'):
+                methods_results, method_timings, timed_out = self._run_methods(method_keys)
+            for key, _, label in EXTRACTION_METHODS:
+                if key in methods_results and label not in extraction_results['extraction_methods_used']:
+                    extraction_results['extraction_methods_used'].append(label)
+            extraction_results['method_timings'] = method_timings
+            extraction_results['timed_out_methods'] = timed_out
+            extraction_results['failed_methods'] = self.failed_methods
+            extraction_results['tabula_sidecar'] = self.tabula_health
+            extraction_results['ocr_stats'] = methods_results.get('ocr', {}).get('ocr_stats')
+            extraction_results['method_cache'] = self.cache_stats
+            extraction_results['page_routes'] = self._route_timings(plan, methods_results, method_timings)
             
             # Merge and consolidate results
-            extraction_results = self._consolidate_results(extraction_results, methods_results)
+            with self._section('phases', 'consolidate'):
+                extraction_results = self._consolidate_results(extraction_results, methods_results)
             
             # Post-process to find specific content types
-            extraction_results = self._post_process_content(extraction_results)
+            start = time.perf_counter()
+            with self._section('phases', 'post_process'):
+                extraction_results = self._post_process_content(extraction_results)
+            extraction_results['text_dedup']['post_process_ms'] = round((time.perf_counter() - start) * 1000, 2)
             
             # Generate statistics
-            extraction_results['statistics'] = self._generate_statistics(extraction_results)
+            with self._section('phases', 'statistics'):
+                extraction_results['statistics'] = self._generate_statistics(extraction_results)
+            extraction_results['statistics']['profile'] = self._profile_summary(methods_results)
             extraction_results['extraction_log'] = self.extraction_log
             
             logger.info("Extraction completed successfully")
@@ -168,11 +512,573 @@ class EnhancedPDFExtractor:
         except Exception as e:
             logger.error(f"Fatal extraction error: {e}")
             return {'error': f'Failed to extract PDF data: {str(e)}', 'extraction_log': self.extraction_log}
+        finally:
+            self.close()
+    
+    def iter_pages(self) -> Iterator[Dict[str, Any]]:
+        """
+        Extract page by page, yielding each page's JSON-ready results as soon as it is done.
+        
+        Every page runs the methods on its route one page at a time, then goes through the
+        same text/table reconciliation and content detection as extract_all_data, so memory
+        holds one page of results rather than the whole document. PyPDF2 is not run: it only
+        reads document-wide AcroForm values, which PyMuPDF reads from the widgets per page.
+        With concurrent_methods the methods run in one long-lived worker process, which
+        holds the document open across pages and is killed (and replaced) only when a method
+        exceeds its method_timeouts entry, which then bounds a single page; otherwise they
+        run in this process without timeouts. Documents are opened from the file rather than
+        from its bytes held in memory. The plan is available as self.plan once the first
+        page is yielded.
+        """
+        self._release_documents()
+        self._pdf_bytes = None
+        self._from_file = True
+        try:
+            self.plan = self._plan_extraction()
+            planned_pages = dict(self.method_pages)
+            if any('tabula' in profile['route'] for profile in self.plan['pages']):
+                self._prepare_tabula()
+            for profile in self.plan['pages']:
+                page_num = profile['page'] - 1
+                keys = [key for key in profile['route'] if key != 'pypdf2']
+                if self.concurrent_methods:
+                    methods_results, timings, timed_out = self._run_page_methods(page_num, keys)
+                else:
+                    for key in keys:
+                        self.method_pages[key] = [page_num]
+                    methods_results, timings, timed_out = self._execute_methods(keys)
+                
+                if profile['page'] % DOCUMENT_RECYCLE_PAGES == 0:
+                    self._release_documents()
+                page_results = self._consolidate_results({}, methods_results)
+                page_results = self._post_process_content(page_results)
+                yield self._clean_for_json({
+                    'page': profile['page'],
+                    'content_class': profile['content_class'],
+                    'route': profile['route'],
+                    'seconds': timings,
+                    'timed_out': timed_out,
+                    'structured_text': page_results['structured_text'],
+                    'form_fields': page_results['form_fields'],
+                    'selected_checkboxes': page_results['selected_checkboxes'],
+                    'selected_radio_buttons': page_results['selected_radio_buttons'],
+                    'filled_text_fields': page_results['filled_text_fields'],
+                    'tables': page_results['tables'],
+                    'raw_material_tables': len(page_results['raw_material_tables']),
+                    'roman_numerals': page_results['roman_numerals'],
+                    'formulas_and_equations': page_results['formulas_and_equations'],
+                    'special_characters': page_results['special_characters'],
+                    'ocr': methods_results.get('ocr', {}).get('ocr_text', [])
+                })
+            self.method_pages = planned_pages
+        finally:
+            self._stop_stream_worker()
+            self.close()
+            self._from_file = False
+    
+    def _page_profile(self, page) -> Dict[str, Any]:
+        """Cheap per-page statistics the planner decides on"""
+        h_rules = v_rules = 0
+        for drawing in page.get_cdrawings():
+            for item in drawing['items']:
+                if item[0] == 'l':
+                    (x0, y0), (x1, y1) = item[1], item[2]
+                    h_rules += abs(y1 - y0) < 1 and abs(x1 - x0) > 10
+                    v_rules += abs(x1 - x0) < 1 and abs(y1 - y0) > 10
+                elif item[0] == 're':
+                    rect = fitz.Rect(item[1])
+                    if rect.height < 2 and rect.width > 10:
+                        h_rules += 1
+                    elif rect.width < 2 and rect.height > 10:
+                        v_rules += 1
+                    elif drawing.get('color') is not None and rect.width > 10 and rect.height > 10 \
+                            and rect != page.rect:
+                        # A stroked box contributes two rules each way (table cells are often drawn like this)
+                        h_rules += 2
+                        v_rules += 2
+        
+        page_area = abs(page.rect) or 1
+        image_area = sum(abs(fitz.Rect(info['bbox']) & page.rect) for info in page.get_image_info())
+        return {
+            'page': page.number + 1,
+            'text_chars': len(page.get_text().strip()),
+            'has_widgets': page.first_widget is not None,
+            'image_coverage': round(min(image_area / page_area, 1.0), 3),
+            'h_rules': h_rules,
+            'v_rules': v_rules,
+        }
+    
+    def _classify_page(self, profile: Dict[str, Any]) -> str:
+        """Content class of a page from its profile: one of PAGE_CLASSES"""
+        image_page = profile['image_coverage'] >= SCANNED_IMAGE_COVERAGE
+        if image_page and profile['text_chars'] < SCANNED_MAX_TEXT_CHARS:
+            return 'scanned'
+        if image_page:
+            return 'mixed'
+        if profile['has_widgets'] or (profile['h_rules'] >= MIN_TABLE_RULES and profile['v_rules'] >= MIN_TABLE_RULES):
+            return 'vector_form'
+        return 'born_digital'
+    
+    def _route_page(self, profile: Dict[str, Any]) -> List[str]:
+        """Methods a page is sent to in the current mode, cheapest first"""
+        content_class = profile['content_class']
+        ruled = profile['h_rules'] >= MIN_TABLE_RULES and profile['v_rules'] >= MIN_TABLE_RULES
+        ocr = ['ocr'] if self.enable_ocr else []
+        if self.mode == 'exhaustive':
+            # Every method on every page, except OCR, which cannot add anything to a page without images
+            route = ['pymupdf', 'pdfplumber', 'pypdf2', 'tabula', 'camelot']
+            return route + ocr if content_class in ('scanned', 'mixed') else route
+        
+        fast = self.mode == 'fast'
+        route = ['pymupdf']
+        # PDFPlumber's text duplicates PyMuPDF; in fast mode it only runs for its table finder
+        if (profile['text_chars'] and not fast) or ruled:
+            route.append('pdfplumber')
+        # PyPDF2 only adds AcroForm text values, which PyMuPDF reads from the widgets too
+        if profile['has_widgets'] and not fast:
+            route.append('pypdf2')
+        if ruled and not fast:
+            route += ['tabula', 'camelot']
+        # Mixed pages keep their text layer in fast mode; only pure image pages are OCR'd there
+        if content_class == 'scanned' or (content_class == 'mixed' and not fast):
+            route += ocr
+        return route
+    
+    def _plan_extraction(self) -> Dict[str, Any]:
+        """
+        Choose the methods (and pages) worth running for this document in the current mode.
+        
+        Every page is classified from its profile and routed to the methods it needs
+        (see _route_page); a method runs on the union of the pages routed to it. Returns
+        the plan recorded in the results: per page its class and route, per method
+        whether it runs, on which pages (1-based), why, and its estimated cost.
+        """
+        start = time.perf_counter()
+        profiles = []
+        for page_num in range(len(self._document())):
+            profiles.append(self._page_profile(self._document()[page_num]))
+            if (page_num + 1) % DOCUMENT_RECYCLE_PAGES == 0:
+                self._release_documents()
+        for profile in profiles:
+            profile['content_class'] = self._classify_page(profile)
+            profile['route'] = self._route_page(profile)
+        all_pages = [p['page'] for p in profiles]
+        class_counts = {c: sum(p['content_class'] == c for p in profiles) for c in PAGE_CLASSES}
+        
+        methods = {}
+        for key, _, _ in EXTRACTION_METHODS:
+            pages = [p['page'] for p in profiles if key in p['route']]
+            classes = sorted({p['content_class'] for p in profiles if key in p['route']})
+            methods[key] = {
+                'run': bool(pages),
+                'pages': pages,
+                'reason': f"{self.mode} route for {', '.join(classes)} pages" if pages else f"not routed in {self.mode} mode",
+            }
+        
+        for key, decision in methods.items():
+            startup_ms, page_ms = METHOD_COST_MS[key]
+            decision['estimated_ms'] = startup_ms + page_ms * len(decision['pages']) if decision['run'] else 0
+            # Methods limited to some pages only look at those
+            if decision['run'] and len(decision['pages']) < len(all_pages):
+                self.method_pages[key] = [page - 1 for page in decision['pages']]
+            else:
+                self.method_pages.pop(key, None)
+        
+        plan = {
+            'mode': self.mode,
+            'methods': methods,
+            'pages': profiles,
+            'page_classes': class_counts,
+            'is_scanned_pdf': bool(profiles) and class_counts['scanned'] == len(profiles),
+            'estimated_ms': sum(d['estimated_ms'] for d in methods.values()),
+            'skipped_estimated_ms': sum(METHOD_COST_MS[k][0] + METHOD_COST_MS[k][1] * len(all_pages)
+                                        for k, d in methods.items() if not d['run'] and k != 'ocr'),
+            'planning_ms': round((time.perf_counter() - start) * 1000, 2),
+        }
+        logger.info(f"Extraction plan ({self.mode}): "
+                    f"{', '.join(k for k, d in methods.items() if d['run'])} on "
+                    f"{', '.join(f'{n} {c}' for c, n in class_counts.items() if n)} pages "
+                    f"(~{plan['estimated_ms']} ms estimated, planned in {plan['planning_ms']} ms)")
+        return plan
+    
+    def _route_timings(self, plan: Dict[str, Any], methods_results: Dict[str, Any],
+                       method_timings: Dict[str, float]) -> List[Dict[str, Any]]:
+        """
+        Per-page routing decisions with the seconds each routed method spent on the page.
+        
+        PyMuPDF, PDFPlumber, PyPDF2 and OCR time every page; for the methods that process
+        their pages in one call (Tabula, Camelot) the method's time is split evenly.
+        """
+        measured = {}
+        for key, results in methods_results.items():
+            for timing in results.get('page_timings', []) if isinstance(results, dict) else []:
+                measured[(key, timing['page'])] = timing['seconds']
+        
+        routes = []
+        for profile in plan.get('pages', []):
+            seconds = {}
+            for key in profile['route']:
+                if key not in methods_results:
+                    continue  # failed or timed out
+                routed = plan['methods'][key]['pages']
+                seconds[key] = measured.get((key, profile['page']),
+                                            round(method_timings.get(key, 0.0) / len(routed), 4))
+            routes.append({
+                'page': profile['page'],
+                'content_class': profile['content_class'],
+                'route': profile['route'],
+                'seconds': seconds,
+                'total_seconds': round(sum(seconds.values()), 4),
+            })
+        return routes
+    
+    def _pages_for(self, key: str) -> List[int]:
+        """Pages (0-based) a method should process"""
+        pages = self.method_pages.get(key)
+        return list(range(len(self._document()))) if pages is None else pages
+    
+    def _page_spec(self, key: str) -> str:
+        """Page selection in the 'all' / '1,3,4' form Tabula and Camelot accept"""
+        pages = self.method_pages.get(key)
+        return 'all' if pages is None else ','.join(str(page + 1) for page in pages)
+    
+    def _options(self) -> Dict[str, Any]:
+        """Constructor arguments needed to rebuild this extractor in another process"""
+        return {'enable_ocr': self.enable_ocr, 'workers': self.workers, 'page_chunk_size': self.page_chunk_size,
+                'mode': self.mode, 'method_pages': self.method_pages, 'tabula_mode': self.tabula_mode,
+                'char_storage': self.char_storage, 'ocr_dpi': self.ocr_dpi, 'ocr_workers': self.ocr_workers,
+                'profile': self._profiler is not None, 'profile_dump': self.profile_dump,
+                'profile_dir': self.profile_dir}
+    
+    def _run_methods(self, method_keys: List[str]) -> Tuple[Dict[str, Any], Dict[str, float], List[str]]:
+        """
+        Run extraction methods and return (results by method, seconds per method, timed out methods).
+        
+        Methods whose result for this document and configuration is in the cache are loaded
+        from it (their seconds are the load time); the rest run and are stored for next time.
+        """
+        results, timings, pending = {}, {}, []
+        for key, _, _ in EXTRACTION_METHODS:
+            if key not in method_keys:
+                continue
+            start = time.perf_counter()
+            cached = self._cache_get(key)
+            if cached is None:
+                pending.append(key)
+                continue
+            results[key] = cached
+            timings[key] = round(time.perf_counter() - start, 3)
+            self.cache_stats['hits'][key] = round(timings[key] * 1000, 2)
+            self.extraction_log.append(f"{key} loaded from cache in {self.cache_stats['hits'][key]} ms")
+        
+        timed_out = []
+        if pending:
+            ran, ran_timings, timed_out = self._execute_methods(pending)
+            for key, result in ran.items():
+                self._cache_put(key, result)
+            results.update(ran)
+            timings.update(ran_timings)
+        
+        order = [key for key, _, _ in EXTRACTION_METHODS if key in method_keys]
+        return ({key: results[key] for key in order if key in results},
+                {key: timings[key] for key in order if key in timings}, timed_out)
+    
+    def _execute_methods(self, method_keys: List[str]) -> Tuple[Dict[str, Any], Dict[str, float], List[str]]:
+        """
+        Run extraction methods without the cache; same return value as _run_methods.
+        
+        Concurrently, every method runs in its own process so that one exceeding its timeout
+        can be terminated; results of the methods that finished are kept either way. At most
+        method_processes of them are alive at once (0: no limit), and a method's timeout
+        counts from its own start.
+        """
+        methods = {key: name for key, name, _ in EXTRACTION_METHODS if key in method_keys}
+        results, timings, timed_out = {}, {}, []
+        if 'tabula' in methods:
+            self._prepare_tabula()
+        
+        if not self.concurrent_methods:
+            for key, name in methods.items():
+                start = time.perf_counter()
+                try:
+                    with self._section('methods', key):
+                        self._keep_result(results, key, getattr(self, name)())
+                except Exception as e:
+                    self._method_failed(key, e)
+                timings[key] = round(time.perf_counter() - start, 3)
+            return results, timings, timed_out
+        
+        pending = list(methods.items())
+        limit = self.method_processes or len(pending)
+        running = {}
+        while pending or running:
+            while pending and len(running) < limit:
+                key, name = pending.pop(0)
+                reader, writer = multiprocessing.Pipe(duplex=False)
+                process = multiprocessing.Process(
+                    target=_run_method_in_process,
+                    args=(writer, str(self.pdf_path), None if self._from_file else self._read_bytes(),
+                          self._options(), key, name, self._sidecar_connection(key)),
+                    name=f'extract-{key}'
+                )
+                start = time.perf_counter()
+                process.start()
+                writer.close()
+                running[reader] = (key, process, start, start + self.method_timeouts.get(key, 300))
+            now = time.perf_counter()
+            ready = wait(list(running), timeout=max(0.0, min(d for _, _, _, d in running.values()) - now))
+            for reader in ready:
+                key, process, start, _ = running.pop(reader)
+                try:
+                    status, payload, profile = reader.recv()
+                except EOFError:
+                    status, payload, profile = 'error', f'process exited with code {process.exitcode}', None
+                reader.close()
+                process.join()
+                timings[key] = round(time.perf_counter() - start, 3)
+                if profile is not None:
+                    self._profiler.record('methods', key, profile['figures'])
+                    self.profile_dumps.extend(profile['dumps'])
+                if status == 'ok':
+                    self._keep_result(results, key, payload)
+                else:
+                    self._method_failed(key, payload)
+            now = time.perf_counter()
+            for reader, (key, process, start, deadline) in list(running.items()):
+                if now >= deadline:
+                    _kill_method_process(process)
+                    reader.close()
+                    del running[reader]
+                    timings[key] = round(now - start, 3)
+                    timed_out.append(key)
+                    self._method_timed_out(key)
+        
+        # Keep the consolidation order independent of which method finished first
+        results = {key: results[key] for key in methods if key in results}
+        timings = {key: timings[key] for key in methods}
+        return results, timings, timed_out
+    
+    def _prepare_tabula(self):
+        """Start (or heal) the resident JVM before Tabula runs; method processes are handed its address"""
+        if self.tabula_mode != 'resident':
+            return
+        try:
+            self.tabula_health = self._tabula_sidecar().ensure_running()
+        except Exception as e:
+            logger.warning(f"Tabula sidecar unavailable, using a JVM per call: {e}")
+            self.extraction_log.append(f"tabula sidecar unavailable: {e}")
+            self.tabula_mode = 'subprocess'
+    
+    def _method_timed_out(self, key: str):
+        """Record a method whose process was killed at its timeout"""
+        if key == 'tabula' and self.tabula_mode == 'resident':
+            # The sidecar would keep working on the abandoned read_pdf
+            self._tabula_sidecar().cancel()
+        logger.error(f"{key} extraction timed out after {self.method_timeouts[key]}s")
+        self.extraction_log.append(f"{key} timed out after {self.method_timeouts[key]}s and was cancelled")
+    
+    def _start_stream_worker(self):
+        parent_conn, child_conn = multiprocessing.Pipe()
+        process = multiprocessing.Process(
+            target=_run_stream_worker,
+            args=(child_conn, str(self.pdf_path), self._options(), self._sidecar_connection('tabula')),
+            name='extract-pages'
+        )
+        process.start()
+        child_conn.close()
+        self._stream_worker = (process, parent_conn)
+    
+    def _stop_stream_worker(self, kill: bool = False):
+        if self._stream_worker is None:
+            return
+        process, conn = self._stream_worker
+        self._stream_worker = None
+        if not kill:
+            try:
+                conn.send(None)
+            except OSError:
+                kill = True  # already gone
+            else:
+                process.join(STREAM_WORKER_STOP_TIMEOUT)
+                kill = process.exitcode is None
+        if kill:
+            _kill_method_process(process)
+        conn.close()
+        process.join()
+    
+    def _run_page_methods(self, page_num: int, keys: List[str]) -> Tuple[Dict[str, Any], Dict[str, float], List[str]]:
+        """
+        Run one page's methods in the streaming worker; same return value as _execute_methods.
+        
+        The worker reports each method as it finishes; one exceeding its timeout gets the
+        worker killed, and the page's remaining methods go to a fresh one.
+        """
+        results, timings, timed_out = {}, {}, []
+        pending = list(keys)
+        while pending:
+            if self._stream_worker is None:
+                self._start_stream_worker()
+            process, conn = self._stream_worker
+            conn.send((page_num, pending))
+            while pending:
+                key = pending.pop(0)
+                if not conn.poll(self.method_timeouts.get(key, 300)):
+                    self._stop_stream_worker(kill=True)
+                    timings[key] = float(self.method_timeouts.get(key, 300))
+                    timed_out.append(key)
+                    self._method_timed_out(key)
+                    break
+                try:
+                    status, payload, seconds = conn.recv()
+                except EOFError:
+                    self._stop_stream_worker(kill=True)
+                    self._method_failed(key, f'page worker exited with code {process.exitcode}')
+                    break
+                timings[key] = round(seconds, 3)
+                if status == 'ok':
+                    self._keep_result(results, key, payload)
+                else:
+                    self._method_failed(key, payload)
+        return results, timings, timed_out
+    
+    def _tabula_sidecar(self) -> TabulaSidecar:
+        """This process's sidecar, or the one a method process was handed by its parent"""
+        return self._tabula_client or get_tabula_sidecar()
+    
+    def _sidecar_connection(self, key: str):
+        if key != 'tabula' or self.tabula_mode != 'resident':
+            return None
+        return self._tabula_sidecar().connection()
+    
+    def _cache(self) -> Optional[ExtractionCache]:
+        if self._method_cache is None and self.cache_dir is not None:
+            try:
+                self._method_cache = ExtractionCache(self.cache_dir)
+            except OSError as e:
+                logger.warning(f"Method cache unavailable at {self.cache_dir}: {e}")
+                self.extraction_log.append(f"method cache unavailable: {e}")
+                self.cache_dir = None
+                self.cache_stats['enabled'] = False
+        return self._method_cache
+    
+    def _sha256(self) -> str:
+        if self._pdf_sha256 is None:
+            self._pdf_sha256 = hashlib.sha256(self._read_bytes()).hexdigest()
+        return self._pdf_sha256
+    
+    def _cache_key(self, key: str) -> str:
+        """Cache key of a method's result: PDF contents, method, its configuration and library versions"""
+        config = {'version': METHOD_CACHE_VERSION, 'pages': self.method_pages.get(key)}
+        if key == 'pdfplumber':
+            config['char_storage'] = self.char_storage
+        elif key == 'ocr':
+            config.update(dpi=self.ocr_dpi, lang=DEFAULT_OCR_LANG, tesseract=tesseract_version())
+        return cache_key(self._sha256(), key, config, library_versions(METHOD_LIBRARIES[key]))
+    
+    def _cache_get(self, key: str) -> Optional[Dict[str, Any]]:
+        cache = self._cache()
+        if cache is None:
+            return None
+        cached = cache.get(self._cache_key(key))
+        if cached is None:
+            self.cache_stats['misses'].append(key)
+            return None
+        if 'page_timings' in cached:
+            # Page times describe this run, in which the pages cost nothing
+            cached['page_timings'] = [{'page': timing['page'], 'seconds': 0.0} for timing in cached['page_timings']]
+        return cached
+    
+    def _cache_put(self, key: str, result: Dict[str, Any]):
+        cache = self._cache()
+        # A method that caught its own failure returns an 'error'; that must not be replayed
+        if cache is None or not isinstance(result, dict) or 'error' in result:
+            return
+        try:
+            self.cache_stats['stored_bytes'] += cache.put(self._cache_key(key), result)
+        except Exception as e:
+            logger.warning(f"Could not cache {key} results: {e}")
+    
+    def _section(self, group: str, name: str):
+        """Profiled section when profiling is on, else a shared no-op context"""
+        return NULL_SECTION if self._profiler is None else self._profiler.section(group, name)
+    
+    def _profile_dump_path(self, part: Optional[str] = None) -> Path:
+        name = f"{self.pdf_path.stem}_{self._sha256()[:8]}"
+        return dump_path(self.profile_dir, f"{name}_{part}" if part else name, self.profile_dump)
+    
+    def _run_profiled_method(self, key: str, name: str) -> Tuple[Any, Optional[Dict[str, Any]]]:
+        """
+        Body of a method process: the method's result and, when profiling, its figures and dumps.
+        
+        The work happens in this process, so with a dump it profiles itself to a per-method file.
+        """
+        if self._profiler is None:
+            return getattr(self, name)(), None
+        
+        def run():
+            with self._section('methods', key):
+                return getattr(self, name)()
+        
+        self._profiler.start()
+        try:
+            if self.profile_dump is None:
+                result = run()
+            else:
+                path = self._profile_dump_path(key)
+                self.profile_dumps.append(str(path))
+                result = run_with_dump(run, self.profile_dump, path)
+        finally:
+            self._profiler.stop()
+        return result, {'figures': self._profiler.groups['methods'][key], 'dumps': self.profile_dumps}
+    
+    def _page_begin(self) -> float:
+        """Start timing a page; when profiling, the page is also a profiled section"""
+        if self._profiler is not None:
+            self._profiler.begin()
+        return time.perf_counter()
+    
+    def _page_timing(self, page: int, start: float) -> Dict[str, Any]:
+        timing = {'page': page, 'seconds': round(time.perf_counter() - start, 4)}
+        if self._profiler is not None:
+            figures = self._profiler.end()
+            timing['cpu_seconds'] = figures['cpu_seconds']
+            timing['tracemalloc_peak_kb'] = figures['tracemalloc_peak_kb']
+        return timing
+    
+    def _profile_summary(self, methods_results: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Profiled phases, methods and pages for the statistics; None when profiling is off"""
+        if self._profiler is None:
+            return None
+        pages = []
+        for key, results in methods_results.items():
+            for timing in results.get('page_timings', []) if isinstance(results, dict) else []:
+                if 'cpu_seconds' in timing:
+                    pages.append({'method': key, **timing})
+        return {
+            'phases': self._profiler.groups.get('phases', {}),
+            'methods': self._profiler.groups.get('methods', {}),
+            'pages': pages,
+            'dumps': self.profile_dumps,
+        }
+    
+    def _keep_result(self, results: Dict[str, Any], key: str, result: Any):
+        """Keep a method's result, unless the method caught its own failure and returned an 'error'"""
+        if isinstance(result, dict) and 'error' in result:
+            self._method_failed(key, result['error'])
+        else:
+            results[key] = result
+    
+    def _method_failed(self, key: str, error):
+        label = next(label for k, _, label in EXTRACTION_METHODS if k == key)
+        logger.error(f"{label} ({key}) extraction failed: {error}")
+        self.extraction_log.append(f"{key} failed: {error}")
+        if key not in self.failed_methods:
+            self.failed_methods.append(key)
     
     def _get_pdf_info(self) -> Dict[str, Any]:
         """Get basic PDF information"""
         try:
-            doc = fitz.open(self.pdf_path)
+            doc = self._document()
             info = {
                 'total_pages': len(doc),
                 'metadata': doc.metadata,
@@ -181,15 +1087,10 @@ class EnhancedPDFExtractor:
                 'has_images': False
             }
             
-            # Check for forms and images
-            for page_num in range(len(doc)):
-                page = doc[page_num]
-                if page.widgets():
-                    info['has_forms'] = True
-                if page.get_images():
-                    info['has_images'] = True
+            # Check for forms and images from the catalog and page resources, without loading pages
+            info['has_forms'] = bool(doc.is_form_pdf)
+            info['has_images'] = any(doc.get_page_images(page_num) for page_num in range(len(doc)))
             
-            doc.close()
             return info
         except Exception as e:
             logger.error(f"Failed to get PDF info: {e}")
@@ -197,16 +1098,23 @@ class EnhancedPDFExtractor:
     
     def _extract_with_pymupdf(self) -> Dict[str, Any]:
         """Extract using PyMuPDF with enhanced text handling"""
+        partials = self._map_pages('_pymupdf_pages', self._pages_for('pymupdf'))
+        return self._merge_page_results(partials)
+    
+    def _pymupdf_pages(self, page_numbers: List[int]) -> Dict[str, Any]:
+        """PyMuPDF extraction for a range of pages"""
         results = {
             'text_blocks': [],
             'form_fields': [],
             'images': [],
-            'drawings': []
+            'drawings': [],
+            'page_timings': []
         }
         
-        doc = fitz.open(self.pdf_path)
+        doc = self._document()
         
-        for page_num in range(len(doc)):
+        for page_num in page_numbers:
+            page_start = self._page_begin()
             page = doc[page_num]
             
             # Extract text with formatting information
@@ -214,24 +1122,18 @@ class EnhancedPDFExtractor:
             for block in text_dict["blocks"]:
                 if "lines" in block:  # Text block
                     for line in block["lines"]:
-                        line_text = ""
-                        font_info = {}
-                        for span in line["spans"]:
-                            line_text += span["text"]
-                            font_info = {
-                                'font': span.get('font', ''),
-                                'size': span.get('size', 0),
-                                'flags': span.get('flags', 0),
-                                'color': span.get('color', 0)
-                            }
+                        line_text = "".join(span["text"] for span in line["spans"])
                         
                         if line_text.strip():
+                            # The line is described by its last span's font
+                            span = line["spans"][-1]
                             text_block = TextBlock(
                                 text=line_text,
                                 page_number=page_num + 1,
                                 coordinates=(block["bbox"][0], block["bbox"][1], 
                                            block["bbox"][2], block["bbox"][3]),
-                                font_info=font_info
+                                font_info=intern_font_info(span.get('font', ''), span.get('size', 0),
+                                                           span.get('flags', 0), span.get('color', 0))
                             )
                             results['text_blocks'].append(text_block)
             
@@ -242,51 +1144,59 @@ class EnhancedPDFExtractor:
                 if field_info:
                     results['form_fields'].append(field_info)
             
-            # Extract images
-            image_list = page.get_images()
-            for img_index, img in enumerate(image_list):
-                try:
-                    xref = img[0]
-                    pix = fitz.Pixmap(doc, xref)
-                    if pix.n - pix.alpha < 4:  # GRAY or RGB
-                        img_data = {
-                            'page': page_num + 1,
-                            'index': img_index,
-                            'width': pix.width,
-                            'height': pix.height,
-                            'xref': xref
-                        }
-                        results['images'].append(img_data)
-                    pix = None
-                except Exception as e:
-                    logger.warning(f"Failed to process image on page {page_num + 1}: {e}")
+            # Extract image metadata from the image dictionaries; pixels are never decoded
+            for img_index, img in enumerate(page.get_images(full=True)):
+                xref, _, width, height, bpc, colorspace = img[:6]
+                results['images'].append({
+                    'page': page_num + 1,
+                    'index': img_index,
+                    'width': width,
+                    'height': height,
+                    'xref': xref,
+                    'bits_per_component': bpc,
+                    'colorspace': colorspace
+                })
+            
+            results['page_timings'].append(self._page_timing(page_num + 1, page_start))
         
-        doc.close()
         return results
     
     def _extract_with_pdfplumber(self) -> Dict[str, Any]:
         """Extract using PDFPlumber for better table detection"""
+        partials = self._map_pages('_pdfplumber_pages', self._pages_for('pdfplumber'))
+        return self._merge_page_results(partials)
+    
+    def _pdfplumber_pages(self, page_numbers: List[int]) -> Dict[str, Any]:
+        """PDFPlumber extraction for a range of pages"""
         results = {
             'tables': [],
             'text_content': [],
-            'characters': []
+            'characters': [],
+            'page_timings': []
         }
         
-        with pdfplumber.open(self.pdf_path) as pdf:
-            for page_num, page in enumerate(pdf.pages):
-                # Extract all text
-                text = page.extract_text()
-                if text:
-                    results['text_content'].append({
-                        'page': page_num + 1,
-                        'text': text,
-                        'method': 'pdfplumber'
-                    })
-                
-                # Extract character-level information
-                chars = page.chars
-                page_chars = []
-                for char in chars:
+        if self._plumber_pdf is None:
+            # From a path pdfplumber closes the file itself
+            self._plumber_pdf = pdfplumber.open(self.pdf_path if self._from_file else self._pdf_stream())
+        pdf = self._plumber_pdf
+        for page_num in page_numbers:
+            page_start = self._page_begin()
+            page = pdf.pages[page_num]
+            # Extract all text
+            text = page.extract_text()
+            if text:
+                results['text_content'].append({
+                    'page': page_num + 1,
+                    'text': text,
+                    'method': 'pdfplumber'
+                })
+            
+            # Extract character-level information
+            page_chars = []
+            if self.char_storage == 'columnar' and page.chars:
+                page_chars = PageChars.from_pdfplumber(page.chars)
+            elif self.char_storage == 'dicts':
+                for char in page.chars:
                     page_chars.append({
                         'char': char.get('text', ''),
                         'x0': char.get('x0', 0),
@@ -296,47 +1206,54 @@ class EnhancedPDFExtractor:
                         'fontname': char.get('fontname', ''),
                         'size': char.get('size', 0)
                     })
-                
-                if page_chars:
-                    results['characters'].append({
-                        'page': page_num + 1,
-                        'characters': page_chars
-                    })
-                
-                # Extract tables
-                tables = page.extract_tables()
-                for table_idx, table in enumerate(tables):
-                    if table:
-                        table_data = TableData(
-                            page_number=page_num + 1,
-                            table_index=table_idx,
-                            headers=table[0] if table else [],
-                            rows=table[1:] if len(table) > 1 else [],
-                            extraction_method='pdfplumber'
-                        )
-                        results['tables'].append(table_data)
+            
+            if len(page_chars):
+                results['characters'].append({
+                    'page': page_num + 1,
+                    'characters': page_chars
+                })
+            
+            # Extract tables (with their bounding boxes, for reconciliation across methods)
+            for table_idx, found in enumerate(page.find_tables()):
+                table = found.extract()
+                if table:
+                    table_data = TableData(
+                        page_number=page_num + 1,
+                        table_index=table_idx,
+                        headers=table[0] if table else [],
+                        rows=table[1:] if len(table) > 1 else [],
+                        coordinates=tuple(found.bbox),
+                        extraction_method='pdfplumber'
+                    )
+                    results['tables'].append(table_data)
+            
+            # Drop the page's parsed objects; long documents otherwise keep every page in memory
+            page.close()
+            results['page_timings'].append(self._page_timing(page_num + 1, page_start))
         
         return results
     
     def _extract_with_pypdf2(self) -> Dict[str, Any]:
-        """Extract using PyPDF2 for form fields"""
+        """Extract using PyPDF2 for form fields, and text from the pages routed to it"""
         results = {
             'form_fields': [],
-            'text_content': []
+            'text_content': [],
+            'page_timings': []
         }
         
         try:
-            with open(self.pdf_path, 'rb') as file:
+            with self._pdf_stream() as file:
                 reader = PyPDF2.PdfReader(file)
                 
                 if reader.is_encrypted:
                     logger.warning("PDF is encrypted, skipping PyPDF2 extraction")
                     return results
                 
-                # Extract text from all pages
-                for page_num, page in enumerate(reader.pages):
+                # Extract text from the planned pages
+                for page_num in self._pages_for('pypdf2'):
+                    page_start = self._page_begin()
                     try:
-                        text = page.extract_text()
+                        text = reader.pages[page_num].extract_text()
                         if text:
                             results['text_content'].append({
                                 'page': page_num + 1,
@@ -345,6 +1262,7 @@ class EnhancedPDFExtractor:
                             })
                     except Exception as e:
                         logger.warning(f"Failed to extract text from page {page_num + 1}: {e}")
+                    results['page_timings'].append(self._page_timing(page_num + 1, page_start))
                 
                 # Extract form fields
                 if '/AcroForm' in reader.trailer.get('/Root', {}):
@@ -364,36 +1282,54 @@ class EnhancedPDFExtractor:
         
         except Exception as e:
             logger.error(f"PyPDF2 extraction failed: {e}")
+            results['error'] = str(e)
         
         return results
     
     def _extract_tables_comprehensive(self) -> Dict[str, Any]:
         """Comprehensive table extraction using multiple methods"""
-        results = {
-            'tabula_tables': [],
-            'camelot_tables': []
-        }
+        results = self._extract_with_tabula()
+        results.update(self._extract_with_camelot())
+        return results
+    
+    # Tabula and Camelot hand the path to Java/Ghostscript-backed readers, so they keep reading from disk
+    def _extract_with_tabula(self) -> Dict[str, Any]:
+        """Table extraction with Tabula"""
+        results = {'tabula_tables': []}
         
-        # Tabula extraction
         try:
-            tables = tabula.read_pdf(self.pdf_path, pages='all', multiple_tables=True, silent=True)
+            read_pdf = self._tabula_sidecar().read_pdf if self.tabula_mode == 'resident' else tabula.read_pdf
+            # JSON output carries each table's page and area, which DataFrames drop
+            tables = read_pdf(self.pdf_path, pages=self._page_spec('tabula'), multiple_tables=True, silent=True,
+                              output_format='json')
             for i, table in enumerate(tables):
-                if not table.empty:
+                cells = [[cell.get('text', '') for cell in row] for row in table.get('data', [])]
+                if cells and any(any(row) for row in cells):
+                    headers, data = cells[0], cells[1:]
                     table_data = {
                         'extraction_method': 'tabula',
                         'table_index': i,
-                        'headers': table.columns.tolist(),
-                        'data': table.values.tolist(),
-                        'shape': table.shape,
-                        'dataframe': table.to_dict('records')
+                        'page': table.get('page_number'),
+                        'headers': headers,
+                        'data': data,
+                        'shape': (len(data), len(headers)),
+                        'dataframe': [dict(zip(headers, row)) for row in data],
+                        'coordinates': (table['left'], table['top'], table['right'], table['bottom'])
+                        if 'top' in table else None
                     }
                     results['tabula_tables'].append(table_data)
         except Exception as e:
             logger.warning(f"Tabula extraction failed: {e}")
+            results['error'] = str(e)
+        
+        return results
+    
+    def _extract_with_camelot(self) -> Dict[str, Any]:
+        """Table extraction with Camelot"""
+        results = {'camelot_tables': []}
         
-        # Camelot extraction
         try:
-            tables = camelot.read_pdf(str(self.pdf_path), pages='all')
+            tables = camelot.read_pdf(str(self.pdf_path), pages=self._page_spec('camelot'))
             for i, table in enumerate(tables):
                 if table.df is not None and not table.df.empty:
                     table_data = {
@@ -410,13 +1346,14 @@ class EnhancedPDFExtractor:
                     results['camelot_tables'].append(table_data)
         except Exception as e:
             logger.warning(f"Camelot extraction failed: {e}")
+            results['error'] = str(e)
         
         return results
     
     def _is_scanned_pdf(self) -> bool:
         """Check if PDF is scanned (image-based)"""
         try:
-            doc = fitz.open(self.pdf_path)
+            doc = self._document()
             total_images = 0
             total_text = 0
             
@@ -428,8 +1365,6 @@ class EnhancedPDFExtractor:
                 total_images += len(images)
                 total_text += len(text)
             
-            doc.close()
-            
             # If lots of images but little text, likely scanned
             return total_images > 0 and total_text < 100
             
@@ -437,48 +1372,32 @@ class EnhancedPDFExtractor:
             return False
     
     def _extract_with_ocr(self) -> Dict[str, Any]:
-        """Extract text using OCR for scanned PDFs"""
+        """Extract text using OCR on the image pages routed to it"""
         results = {
             'ocr_text': [],
-            'ocr_confidence': []
+            'ocr_confidence': [],
+            'ocr_stats': {},
+            'page_timings': []
         }
         
         try:
-            doc = fitz.open(self.pdf_path)
+            engine = OCREngine(dpi=self.ocr_dpi, workers=self.ocr_workers)
+            source = str(self.pdf_path) if self._from_file else self._read_bytes()
+            ocr = engine.ocr_pages(self._document(), source, self._pages_for('ocr'))
+            results['ocr_stats'] = ocr['stats']
             
-            for page_num in range(len(doc)):
-                page = doc[page_num]
-                pix = page.get_pixmap()
-                img_data = pix.tobytes("png")
-                
-                # Convert to PIL Image
-                img = Image.open(io.BytesIO(img_data))
-                
-                # Perform OCR
-                ocr_result = pytesseract.image_to_data(img, output_type=pytesseract.Output.DICT)
-                
-                page_text = []
-                confidences = []
-                
-                for i in range(len(ocr_result['text'])):
-                    text = ocr_result['text'][i].strip()
-                    conf = int(ocr_result['conf'][i])
-                    
-                    if text and conf > 30:  # Only include text with decent confidence
-                        page_text.append(text)
-                        confidences.append(conf)
-                
-                if page_text:
+            for page in ocr['pages']:
+                results['page_timings'].append({'page': page['page'], 'seconds': page['seconds']})
+                if page['text']:
                     results['ocr_text'].append({
-                        'page': page_num + 1,
-                        'text': ' '.join(page_text),
-                        'average_confidence': sum(confidences) / len(confidences)
+                        'page': page['page'],
+                        'text': page['text'],
+                        'average_confidence': page['average_confidence']
                     })
             
-            doc.close()
-            
         except Exception as e:
             logger.error(f"OCR extraction failed: {e}")
+            results['error'] = str(e)
         
         return results
     
@@ -543,7 +1462,20 @@ class EnhancedPDFExtractor:
                 
                 # OCR text
                 if 'ocr_text' in results:
-                    all_text.extend(results['ocr_text'])
+                    all_text.extend(dict(item, method='ocr') for item in results['ocr_text'])
+        
+        start = time.perf_counter()
+        dedup_stats = {
+            'enabled': self.dedup_text,
+            'items_before': len(all_text),
+            'chars_before': sum(len(item['text']) for item in all_text)
+        }
+        if self.dedup_text:
+            all_text, dedup_stats['merged_lines'] = self._reconcile_text(all_text)
+        dedup_stats['items_after'] = len(all_text)
+        dedup_stats['chars_after'] = sum(len(item['text']) for item in all_text)
+        dedup_stats['dedup_ms'] = round((time.perf_counter() - start) * 1000, 2)
+        base_results['text_dedup'] = dedup_stats
         
         base_results['all_text_content'] = all_text
         base_results['has_text_content'] = len(all_text) > 0
@@ -558,7 +1490,7 @@ class EnhancedPDFExtractor:
             if isinstance(results, dict) and 'form_fields' in results:
                 for field in results['form_fields']:
                     if isinstance(field, FormField):
-                        all_form_fields.append(field.__dict__)
+                        all_form_fields.append(record_dict(field))
                         
                         if field.field_type == 'checkbox' and field.is_selected:
                             selected_checkboxes.append({
@@ -601,7 +1533,7 @@ class EnhancedPDFExtractor:
                 if 'tables' in results:
                     for table in results['tables']:
                         if isinstance(table, TableData):
-                            table_dict = table.__dict__
+                            table_dict = record_dict(table)
                         else:
                             table_dict = table
                         all_tables.append(table_dict)
@@ -612,6 +1544,19 @@ class EnhancedPDFExtractor:
                 if 'camelot_tables' in results:
                     all_tables.extend(results['camelot_tables'])
         
+        start = time.perf_counter()
+        table_stats = {
+            'enabled': self.reconcile_tables,
+            'tables_before': len(all_tables),
+            'output_bytes_before': len(json.dumps(self._clean_for_json(all_tables), default=str))
+        }
+        if self.reconcile_tables:
+            all_tables = self._reconcile_tables(all_tables)
+        table_stats['tables_after'] = len(all_tables)
+        table_stats['output_bytes_after'] = len(json.dumps(self._clean_for_json(all_tables), default=str))
+        table_stats['reconcile_ms'] = round((time.perf_counter() - start) * 1000, 2)
+        base_results['table_reconciliation'] = table_stats
+        
         # Find raw material tables
         for table in all_tables:
             table_text = ""
@@ -621,7 +1566,7 @@ class EnhancedPDFExtractor:
                 for row in table['data'][:3]:  # Check first few rows
                     table_text += " ".join(str(cell) for cell in row)
             
-            if re.search(r'raw\s+material', table_text, re.IGNORECASE):
+            if RAW_MATERIAL_RE.search(table_text):
                 raw_material_tables.append(table)
         
         base_results['tables'] = all_tables
@@ -630,68 +1575,225 @@ class EnhancedPDFExtractor:
         
         return base_results
     
-    def _post_process_content(self, results: Dict) -> Dict:
-        """Post-process to identify specific content types"""
+    @staticmethod
+    def _reconcile_text(all_text: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+        """
+        Keep each line of page text once across methods, in method order.
         
-        # Combine all text for analysis
-        all_text = ""
-        for text_item in results.get('all_text_content', []):
-            all_text += text_item.get('text', '') + " "
+        Page-level text (PDFPlumber, PyPDF2, OCR) is split into lines. A line is merged into
+        a line kept earlier on the same page from another method when both are the same line:
+        equal normalised text, or TEXT_DEDUP_OVERLAP of the words of each line in common
+        (with overlapping boxes when both have coordinates). Lines of one method are never
+        compared with each other, and a kept line absorbs at most one line per method, so
+        repeated labels stay repeated. A merged line adds its method to the kept item's
+        'sources' and is counted in the returned merged_lines per method. Items come back
+        ordered by page.
+        """
+        pages = {}
+        reconciled = []
+        merged = {}
+        for item in all_text:
+            method = item.get('method', 'unknown')
+            state = pages.setdefault(item.get('page', 0), {'lines': {}, 'kept': [], 'words': {}})
+            coordinates = item.get('coordinates')
+            lines = [item['text']] if 'coordinates' in item else item['text'].splitlines()
+            for line in lines:
+                key = ' '.join(line.split()).casefold()
+                if not key:
+                    continue
+                words = set(key.split())
+                match = next((kept for kept in state['lines'].get(key, []) if method not in kept['sources']), None)
+                if match is None:
+                    match = EnhancedPDFExtractor._similar_line(state, method, words, coordinates)
+                if match is not None:
+                    match['sources'].append(method)
+                    merged[method] = merged.get(method, 0) + 1
+                    continue
+                line_item = dict(item, text=line if 'coordinates' in item else line.strip(), sources=[method])
+                state['lines'].setdefault(key, []).append(line_item)
+                for word in words:
+                    state['words'].setdefault(word, []).append(len(state['kept']))
+                state['kept'].append((line_item, words))
+                reconciled.append(line_item)
+        reconciled.sort(key=lambda item: item.get('page', 0))
+        return reconciled, merged
+    
+    @staticmethod
+    def _similar_line(state: Dict[str, Any], method: str, words: set,
+                      coordinates: Optional[Tuple[float, ...]]) -> Optional[Dict[str, Any]]:
+        """Kept line of another method sharing TEXT_DEDUP_OVERLAP of both lines' words, best match first"""
+        shared = {}
+        for word in words:
+            for index in state['words'].get(word, ()):
+                shared[index] = shared.get(index, 0) + 1
+        best, best_count = None, 0
+        for index, count in shared.items():
+            kept, kept_words = state['kept'][index]
+            if (count <= best_count or method in kept['sources'] or count < TEXT_DEDUP_OVERLAP * len(words)
+                    or count < TEXT_DEDUP_OVERLAP * len(kept_words)):
+                continue
+            box = kept.get('coordinates')
+            if coordinates and box and not (min(coordinates[2], box[2]) > max(coordinates[0], box[0])
+                                            and min(coordinates[3], box[3]) > max(coordinates[1], box[1])):
+                continue
+            best, best_count = kept, count
+        return best
+    
+    @staticmethod
+    def _table_cells(table: Dict[str, Any]) -> List[List[str]]:
+        """Header and body cells of a table from any method, as normalised strings"""
+        rows = [table.get('headers') or []] + list(table.get('data') or table.get('rows') or [])
+        return [[' '.join(str(cell).split()).casefold() if cell is not None and cell == cell else ''
+                 for cell in row] for row in rows]
+    
+    def _table_region(self, table: Dict[str, Any], page: int) -> Optional[fitz.Rect]:
+        """Table area in PyMuPDF page space (top-left origin), or None if the method gave none"""
+        coordinates = table.get('coordinates')
+        if not coordinates or not page:
+            return None
+        if table.get('extraction_method') == 'camelot':
+            # Camelot reports PDF space (bottom-left origin)
+            height = self._document()[page - 1].rect.height
+            x0, y0, x1, y1 = coordinates
+            return fitz.Rect(x0, height - y1, x1, height - y0)
+        return fitz.Rect(coordinates)
+    
+    @staticmethod
+    def _table_match(a: Dict[str, Any], b: Dict[str, Any]) -> Tuple[float, float]:
+        """(match score, content similarity) of two table candidates"""
+        union = a['words'] | b['words']
+        similarity = len(a['words'] & b['words']) / len(union) if union else 0.0
+        if a['region'] is None or b['region'] is None:
+            return similarity, similarity
+        overlap = abs(a['region'] & b['region'])
+        iou = overlap / (abs(a['region']) + abs(b['region']) - overlap or 1)
+        return (iou + similarity) / 2, similarity
+    
+    def _reconcile_tables(self, all_tables: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        One canonical table per region across PDFPlumber, Tabula and Camelot.
         
-        # Find Roman numerals
-        roman_pattern = r'\b(?=[MDCLXVI])M{0,3}(?:C[MD]|D?C{0,3})?(?:X[CL]|L?X{0,3})?(?:I[XV]|V?I{0,3})?\b'
-        roman_numerals = list(set(re.findall(roman_pattern, all_text, re.IGNORECASE)))
-        results['roman_numerals'] = roman_numerals
+        Candidates on the same page are grouped when their score (mean of bounding-box IoU
+        and cell word Jaccard, or the Jaccard alone without boxes) reaches
+        TABLE_MATCH_THRESHOLD; a group holds at most one table per method. The candidate
+        with the best mix of filled cells and agreement with the others is kept. Its
+        confidence is half its filled-cell ratio plus half that agreement, so a table only
+        one method found stays at or below 0.5.
+        """
+        candidates = []
+        for table in all_tables:
+            page = int(table.get('page_number') or table.get('page') or 0)
+            cells = self._table_cells(table)
+            total = sum(len(row) for row in cells)
+            candidates.append({
+                'table': table,
+                'method': table.get('extraction_method', 'unknown'),
+                'page': page,
+                'region': self._table_region(table, page),
+                'words': {word for row in cells for cell in row for word in cell.split()},
+                'fill': sum(1 for row in cells for cell in row if cell) / total if total else 0.0,
+                'accuracy': table.get('accuracy')
+            })
         
-        # Find formulas and equations
-        formula_patterns = [
-            r'[A-Za-z0-9]+\s*[+\-*/=]\s*[A-Za-z0-9]+',  # Basic equations
-            r'[A-Za-z]+\d*\s*[\+\-]\s*[A-Za-z]+\d*',     # Chemical formulas
-            r'\d+\.\d+\s*[A-Za-z%]+',                     # Percentages/measurements
-            r'[A-Za-z]+\(\w+\)',                          # Function notation
-        ]
+        groups = []
+        for candidate in candidates:
+            best, best_score = None, TABLE_MATCH_THRESHOLD
+            for group in groups:
+                if group[0]['page'] != candidate['page'] or any(m['method'] == candidate['method'] for m in group):
+                    continue
+                score = max(self._table_match(member, candidate)[0] for member in group)
+                if score >= best_score:
+                    best, best_score = group, score
+            if best is None:
+                groups.append([candidate])
+            else:
+                best.append(candidate)
         
-        formulas = []
-        for pattern in formula_patterns:
-            matches = re.findall(pattern, all_text)
-            formulas.extend(matches)
+        reconciled = []
+        for group in groups:
+            ranked = []
+            for member in group:
+                similarities = [self._table_match(member, other)[1] for other in group if other is not member]
+                support = sum(similarities) / len(similarities) if similarities else 0.0
+                quality = member['fill'] * (member['accuracy'] / 100 if member['accuracy'] else 1.0)
+                ranked.append((0.5 * quality + 0.5 * support, support, member, similarities))
+            _, support, chosen, _ = max(ranked, key=lambda entry: entry[0])
+            
+            canonical = dict(chosen['table'])
+            canonical['page'] = chosen['page']
+            canonical['confidence'] = round(0.5 * chosen['fill'] + 0.5 * support, 3)
+            canonical['sources'] = [
+                {'extraction_method': member['method'], 'table_index': member['table'].get('table_index'),
+                 'similarity': round(self._table_match(chosen, member)[1], 3) if member is not chosen else 1.0}
+                for member in group
+            ]
+            reconciled.append((chosen['page'], chosen['region'].y0 if chosen['region'] else 0.0, canonical))
         
-        results['formulas_and_equations'] = list(set(formulas))
+        reconciled.sort(key=lambda entry: entry[:2])
+        return [table for _, _, table in reconciled]
+    
+    def _post_process_content(self, results: Dict) -> Dict:
+        """Post-process to identify specific content types"""
         
-        # Find special characters
+        # One pass over the (deduplicated) text runs every detector on each item
+        roman_numerals = set()
+        formulas = set()
         special_chars = set()
-        for char in all_text:
-            if ord(char) > 127:  # Non-ASCII characters
-                special_chars.add(char)
-        
-        results['special_characters'] = list(special_chars)
+        text_items = results.get('all_text_content', [])
+        for text_item in text_items:
+            text = text_item.get('text', '')
+            roman_numerals.update(ROMAN_NUMERAL_RE.findall(text))
+            for pattern in FORMULA_RES:
+                formulas.update(pattern.findall(text))
+            special_chars.update(NON_ASCII_RE.findall(text))
         
-        # Structure text content by type
+        # Tag every occurrence of the document's formulas and of CONTENT_KEYWORDS with one automaton
+        start = time.perf_counter()
+        matcher = MultiPatternMatcher([(formula, 'formula') for formula in formulas] + list(CONTENT_KEYWORDS.items()),
+                                      ignore_case=True)
+        match_count = 0
         structured_text = []
-        for text_item in results.get('all_text_content', []):
+        for text_item in text_items:
             text = text_item.get('text', '')
+            stripped = text.strip()
+            matches = []
+            for match_start, match_end, pattern, tag in matcher.find_all(text):
+                # Formulas are matched case-sensitively, keywords are not
+                if tag == 'formula' and text[match_start:match_end] != pattern:
+                    continue
+                matches.append({'start': match_start, 'end': match_end, 'text': text[match_start:match_end], 'tag': tag})
+            match_count += len(matches)
             
             # Classify text type
             text_type = 'general'
-            if re.search(r'^\d+\.', text.strip()):
+            if NUMBERED_LIST_RE.search(stripped):
                 text_type = 'numbered_list'
-            elif re.search(r'^[A-Z][^.]*:$', text.strip()):
+            elif HEADING_RE.search(stripped):
                 text_type = 'heading'
-            elif re.search(r'raw\s+material', text, re.IGNORECASE):
+            elif RAW_MATERIAL_RE.search(text):
                 text_type = 'raw_material'
-            elif len(formulas) > 0 and any(formula in text for formula in formulas):
+            elif any(match['tag'] == 'formula' for match in matches):
                 text_type = 'formula'
             
-            structured_item = text_item.copy()
-            structured_item['content_type'] = text_type
-            structured_text.append(structured_item)
+            structured_text.append(StructuredText(text_item, text_type, matches))
         
+        results['content_tagging'] = {
+            'patterns': len(matcher),
+            'backend': matcher.backend,
+            'matches': match_count,
+            'tagging_ms': round((time.perf_counter() - start) * 1000, 2)
+        }
+        
+        results['roman_numerals'] = list(roman_numerals)
+        results['formulas_and_equations'] = list(formulas)
+        results['special_characters'] = list(special_chars)
         results['structured_text'] = structured_text
         
         return results
     
     def _generate_statistics(self, results: Dict) -> Dict:
         """Generate extraction statistics"""
+        plan = results.get('extraction_plan', {})
         stats = {
             'total_pages_processed': results.get('total_pages', 0),
             'extraction_methods_count': len(results.get('extraction_methods_used', [])),
@@ -705,7 +1807,25 @@ class EnhancedPDFExtractor:
             'roman_numerals_found': len(results.get('roman_numerals', [])),
             'formulas_found': len(results.get('formulas_and_equations', [])),
             'special_characters_found': len(results.get('special_characters', [])),
-            'is_scanned_pdf': results.get('is_scanned_pdf', False)
+            'is_scanned_pdf': results.get('is_scanned_pdf', False),
+            'method_timings': results.get('method_timings', {}),
+            'planner': {
+                'mode': plan.get('mode'),
+                'methods_run': [k for k, d in plan.get('methods', {}).items() if d['run']],
+                'methods_skipped': [k for k, d in plan.get('methods', {}).items() if not d['run']],
+                'estimated_ms': plan.get('estimated_ms', 0),
+                'skipped_estimated_ms': plan.get('skipped_estimated_ms', 0),
+                'planning_ms': plan.get('planning_ms', 0)
+            },
+            'routes': self._route_summary(results.get('page_routes', [])),
+            'timed_out_methods': results.get('timed_out_methods', []),
+            'failed_methods': results.get('failed_methods', []),
+            'tabula_sidecar': results.get('tabula_sidecar'),
+            'ocr': results.get('ocr_stats'),
+            'text_dedup': results.get('text_dedup'),
+            'content_tagging': results.get('content_tagging'),
+            'table_reconciliation': results.get('table_reconciliation'),
+            'method_cache': results.get('method_cache')
         }
         
         # Calculate text coverage
@@ -714,6 +1834,17 @@ class EnhancedPDFExtractor:
         
         return stats
     
+    @staticmethod
+    def _route_summary(page_routes: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """Pages and seconds spent per page content class"""
+        summary = {}
+        for route in page_routes:
+            entry = summary.setdefault(route['content_class'], {'pages': 0, 'seconds': 0.0, 'methods': []})
+            entry['pages'] += 1
+            entry['seconds'] = round(entry['seconds'] + route['total_seconds'], 4)
+            entry['methods'] += [key for key in route['route'] if key not in entry['methods']]
+        return summary
+    
     def save_results(self, results: Dict, output_path: str = None) -> str:
         """Save extraction results with enhanced formatting"""
         if output_path is None:
@@ -739,6 +1870,8 @@ class EnhancedPDFExtractor:
                         elif 'data' in table and table['data']:
                             headers = table.get('headers', [f'Col_{j}' for j in range(len(table['data'][0]))])
                             df = pd.DataFrame(table['data'], columns=headers)
+                        elif table.get('rows'):
+                            df = pd.DataFrame(table['rows'], columns=table.get('headers') or None)
                         else:
                             continue
                         
@@ -795,12 +1928,37 @@ class EnhancedPDFExtractor:
         logger.info(f"Results saved to: {json_path}")
         return json_path
     
+    def save_results_ndjson(self, results: Dict, output_path: str = None, excel: bool = False) -> Dict[str, str]:
+        """
+        Save extraction results as NDJSON (document header, then one line per page) plus a
+        separate tables file (Parquet when pyarrow is installed, else NDJSON). The Excel
+        workbook is only built when asked for, from the tables file.
+        """
+        if output_path is None:
+            output_path = self.pdf_path.stem + "_comprehensive_extraction"
+        
+        output_files = {'main_results': serializers.write_results_ndjson(results, f"{output_path}.ndjson")}
+        tables_path = serializers.write_tables(results.get('tables', []), f"{output_path}_tables")
+        if tables_path:
+            output_files['tables'] = tables_path
+            if excel:
+                output_files['tables_excel'] = serializers.tables_to_excel(tables_path, f"{output_path}_tables.xlsx")
+        
+        logger.info(f"Results saved to: {output_files['main_results']}")
+        return output_files
+    
     def _clean_for_json(self, obj):
         """Clean object for JSON serialization"""
         if isinstance(obj, dict):
             return {k: self._clean_for_json(v) for k, v in obj.items()}
         elif isinstance(obj, list):
             return [self._clean_for_json(item) for item in obj]
+        elif isinstance(obj, PageChars):
+            return obj.to_dicts()
+        elif isinstance(obj, Mapping):
+            return {k: self._clean_for_json(v) for k, v in obj.items()}
+        elif is_dataclass(obj):
+            return self._clean_for_json(record_dict(obj))
         elif hasattr(obj, '__dict__'):
             return self._clean_for_json(obj.__dict__)
         elif isinstance(obj, (str, int, float, bool)) or obj is None:
@@ -808,8 +1966,99 @@ class EnhancedPDFExtractor:
         else:
             return str(obj)
 
+def _run_method_in_process(conn, pdf_path: str, pdf_bytes: bytes, options: Dict[str, Any], key: str,
+                           method_name: str, sidecar: Optional[Tuple[Any, bytes]] = None):
+    """
+    Process target for one extraction method; sends ('ok', result, profile) or ('error', message, None)
+    back. Without pdf_bytes the documents are opened from pdf_path; sidecar is the parent's
+    tabula sidecar connection (address, authkey).
+    """
+    if hasattr(os, 'setsid'):
+        # Own process group, so a timeout also kills the page workers, Java and Ghostscript started from here
+        os.setsid()
+    extractor = EnhancedPDFExtractor(pdf_path, concurrent_methods=False, **options)
+    extractor._pdf_bytes = pdf_bytes
+    extractor._from_file = pdf_bytes is None
+    if sidecar is not None:
+        extractor._tabula_client = TabulaSidecar.attach(*sidecar)
+    try:
+        result, profile = extractor._run_profiled_method(key, method_name)
+        conn.send(('ok', result, profile))
+    except Exception as e:
+        conn.send(('error', str(e), None))
+    finally:
+        extractor.close()
+        conn.close()
+
+def _kill_method_process(process: multiprocessing.Process, grace: float = 2.0):
+    """Terminate a method process and everything in its process group"""
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+    except (AttributeError, ProcessLookupError, PermissionError):
+        # No process groups (Windows), or the child has not reached setsid yet
+        process.terminate()
+    process.join(grace)
+    try:
+        # Members that outlived the leader or ignored SIGTERM (a JVM busy in native code)
+        os.killpg(process.pid, signal.SIGKILL)
+    except (AttributeError, ProcessLookupError, PermissionError):
+        if process.exitcode is None:
+            process.kill()
+    process.join()
+
+def _run_stream_worker(conn, pdf_path: str, options: Dict[str, Any], sidecar: Optional[Tuple[Any, bytes]] = None):
+    """
+    Process target behind iter_pages: receives (page number, method keys), runs each method on
+    that page and sends (status, result or message, seconds) per method; None ends it.
+    """
+    if hasattr(os, 'setsid'):
+        os.setsid()
+    extractor = EnhancedPDFExtractor(pdf_path, concurrent_methods=False, **options)
+    extractor._from_file = True
+    if sidecar is not None:
+        extractor._tabula_client = TabulaSidecar.attach(*sidecar)
+    methods = {key: name for key, name, _ in EXTRACTION_METHODS}
+    try:
+        while True:
+            try:
+                request = conn.recv()
+            except EOFError:
+                break
+            if request is None:
+                break
+            page_num, keys = request
+            for key in keys:
+                extractor.method_pages[key] = [page_num]
+                start = time.perf_counter()
+                try:
+                    reply = ('ok', getattr(extractor, methods[key])())
+                except Exception as e:
+                    reply = ('error', str(e))
+                conn.send(reply + (time.perf_counter() - start,))
+            if (page_num + 1) % DOCUMENT_RECYCLE_PAGES == 0:
+                extractor._release_documents()
+    finally:
+        extractor.close()
+        conn.close()
+
+# Per-process extractor used by page workers; each worker parses the document once
+_page_worker_extractor = None
+
+def _init_page_worker(pdf_path: str, pdf_bytes: bytes, profile: bool = False):
+    global _page_worker_extractor
+    _page_worker_extractor = EnhancedPDFExtractor(pdf_path, enable_ocr=False, profile=profile)
+    _page_worker_extractor._pdf_bytes = pdf_bytes
+    if profile:
+        # Page figures are measured here; tracing lasts as long as the worker
+        _page_worker_extractor._profiler.start()
+
+def _run_page_chunk(method_name: str, page_numbers: List[int]) -> Dict[str, List]:
+    return getattr(_page_worker_extractor, method_name)(page_numbers)
+
 # Enhanced usage function
-def extract_pdf_data_comprehensive(pdf_path: str, enable_ocr: bool = True, save_results: bool = True, output_prefix: str = None) -> Dict[str, Any]:
+def extract_pdf_data_comprehensive(pdf_path: str, enable_ocr: bool = True, save_results: bool = True, output_prefix: str = None,
+                                   workers: int = DEFAULT_PAGE_WORKERS, page_chunk_size: int = DEFAULT_PAGE_CHUNK_SIZE,
+                                   output_format: str = 'json') -> Dict[str, Any]:
     """
     Comprehensive PDF data extraction function
     
@@ -818,14 +2067,20 @@ def extract_pdf_data_comprehensive(pdf_path: str, enable_ocr: bool = True, save_
         enable_ocr (bool): Enable OCR for scanned PDFs
         save_results (bool): Whether to save results to files
         output_prefix (str): Optional prefix for output files
+        workers (int): Processes used for page-parallel PyMuPDF/PDFPlumber extraction (1 = serial)
+        page_chunk_size (int): Pages handed to a worker at a time
+        output_format (str): 'json' (indented JSON, Excel tables and a text report) or
+            'ndjson' (per-page NDJSON and a Parquet/NDJSON tables file)
     
     Returns:
         Dict containing all extracted data with enhanced accuracy
     """
-    extractor = EnhancedPDFExtractor(pdf_path, enable_ocr=enable_ocr)
+    extractor = EnhancedPDFExtractor(pdf_path, enable_ocr=enable_ocr, workers=workers, page_chunk_size=page_chunk_size)
     results = extractor.extract_all_data()
     
-    if save_results and 'error' not in results:
+    if save_results and 'error' not in results and output_format == 'ndjson':
+        results['output_files'] = extractor.save_results_ndjson(results, output_prefix)
+    elif save_results and 'error' not in results:
         output_file = extractor.save_results(results, output_prefix)
         results['output_files'] = {
             'main_results': output_file,
@@ -915,7 +2170,7 @@ def save_extracted_data_to_json(results: Dict[str, Any], output_path: str) -> No
                     'page': block.get('page', 0),
                     'text': block.get('text', ''),
                     'coordinates': block.get('coordinates', None),
-                    'font_info': block.get('font_info', {})
+                    'font_info': record_dict(block['font_info']) if block.get('font_info') else {}
                 }
                 for block in results.get('all_text_content', [])
             ],
@@ -964,6 +2219,11 @@ if __name__ == "__main__":
     import datetime
     import json
 
+    # With arguments, run the batch CLI: python test_new.py <files|dirs|globs> [--output-dir ...]
+    if len(sys.argv) > 1:
+        from batch_extract import main
+        sys.exit(main(sys.argv[1:]))
+
     # 🔧 Hardcoded input values (instead of argparse)
     # Use Path to handle file paths correctly demo_app\backend\sample_docs\EM19335_Quotation_with_material__23.05.2025.pdf
     current_dir = Path(__file__).parent
@@ -1023,6 +2283,18 @@ if __name__ == "__main__":
         print(f"🔢 Roman Numerals: {stats.get('roman_numerals_found', 0)}")
         print(f"🧮 Formulas: {stats.get('formulas_found', 0)}")
         print(f"🌟 Special Characters: {stats.get('special_characters_found', 0)}")
+        cache = stats.get('method_cache') or {}
+        if cache.get('enabled'):
+            print(f"💾 Cached Methods: {', '.join(cache['hits']) or 'none'}")
+        profile = stats.get('profile')
+        if profile:
+            print("⏱️ Profile (wall / CPU / tracemalloc peak):")
+            for group in ('methods', 'phases'):
+                for name, figures in profile[group].items():
+                    print(f"   {group[:-1]} {name}: {figures['wall_seconds']}s / {figures['cpu_seconds']}s / "
+                          f"{figures['tracemalloc_peak_kb']} KB")
+            for path in profile['dumps']:
+                print(f"   dump: {path}")
         
         print(f"\n✅ Extraction completed successfully!")
         print(f"📁 Results saved to: {output_json}")
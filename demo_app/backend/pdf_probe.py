@@ -0,0 +1,115 @@
+import logging
+import os
+import re
+import time
+
+import fitz  # PyMuPDF
+
+logger = logging.getLogger(__name__)
+
+# Pages whose content streams are sampled for text density; the rest is extrapolated
+PROBE_SAMPLE_PAGES = int(os.getenv('PROBE_SAMPLE_PAGES', '4'))
+# Rough processing cost in ms: per document (model round trip), per page, and extra per image-only page
+PROBE_COST_MS = {
+    'document': 4000,
+    'page': 400,
+    'scanned_page': 1500,
+}
+# Gemini bills every PDF page as a fixed number of input tokens
+TOKENS_PER_PAGE = 258
+
+_REFERENCE = re.compile(r'(\d+) 0 R')
+
+
+def _open(pdf):
+    if isinstance(pdf, (bytes, bytearray)):
+        return fitz.open(stream=bytes(pdf), filetype='pdf')
+    if hasattr(pdf, 'read'):
+        return fitz.open(stream=pdf.read(), filetype='pdf')
+    return fitz.open(pdf)
+
+
+def _content_stream(doc, page_number):
+    """Decompressed content stream of a page, read through the xref table without loading the page"""
+    kind, value = doc.xref_get_key(doc.page_xref(page_number), 'Contents')
+    if kind == 'xref':
+        xrefs = [int(value.split()[0])]
+    elif kind == 'array':
+        xrefs = [int(x) for x in _REFERENCE.findall(value)]
+    else:
+        xrefs = []
+    return b''.join(doc.xref_stream(xref) or b'' for xref in xrefs)
+
+
+def _text_operators(content):
+    # Tj and TJ show nearly all text; counting bytes is far cheaper than tokenizing the stream
+    return content.count(b'Tj') + content.count(b'TJ')
+
+
+def _sample_pages(page_count):
+    step = max(1, page_count // PROBE_SAMPLE_PAGES)
+    return list(range(0, page_count, step))[:PROBE_SAMPLE_PAGES]
+
+
+def probe(pdf):
+    """
+    Metadata-only look at a PDF (path, bytes or file object) for routing and admission.
+
+    Reads the xref table, page resources and a few content streams; no page is
+    rendered, laid out or text-extracted, and no image is decoded. Image sizes come
+    from the image dictionaries; text density is the number of text-showing operators
+    per page on the sampled pages.
+    """
+    start = time.perf_counter()
+    with _open(pdf) as doc:
+        result = {
+            'page_count': len(doc),
+            'is_encrypted': bool(doc.is_encrypted),
+            'needs_password': bool(doc.needs_pass),
+            'has_forms': False,
+            'form_field_count': 0,
+            'images': [],
+            'image_pages': 0,
+            'text_density': None,
+            'text_layer_pages_estimate': None,
+            'scanned_pages_estimate': None,
+            'estimated_ms': None,
+            'estimated_tokens': len(doc) * TOKENS_PER_PAGE,
+        }
+        if doc.needs_pass:
+            # Nothing past the trailer can be read without the password
+            result['elapsed_ms'] = round((time.perf_counter() - start) * 1000, 2)
+            return result
+
+        result['form_field_count'] = int(doc.is_form_pdf or 0)
+        result['has_forms'] = result['form_field_count'] > 0
+
+        image_pages = set()
+        seen = set()
+        for page_number in range(len(doc)):
+            for xref, _, width, height, bpc, colorspace, _, _, image_filter, *_ in doc.get_page_images(page_number):
+                image_pages.add(page_number)
+                if xref not in seen:
+                    seen.add(xref)
+                    result['images'].append({'xref': xref, 'page': page_number + 1, 'width': width,
+                                             'height': height, 'bits_per_component': bpc,
+                                             'colorspace': colorspace, 'filter': image_filter})
+        result['image_pages'] = len(image_pages)
+
+        sampled = _sample_pages(len(doc))
+        text_ops = {n: _text_operators(_content_stream(doc, n)) for n in sampled}
+        if sampled:
+            share = len(doc) / len(sampled)
+            scanned = sum(1 for n in sampled if n in image_pages and not text_ops[n])
+            result['text_density'] = round(sum(text_ops.values()) / len(sampled), 1)
+            result['text_layer_pages_estimate'] = round(sum(1 for n in sampled if text_ops[n]) * share)
+            result['scanned_pages_estimate'] = round(scanned * share)
+        result['estimated_ms'] = (PROBE_COST_MS['document'] + PROBE_COST_MS['page'] * len(doc)
+                                  + PROBE_COST_MS['scanned_page'] * (result['scanned_pages_estimate'] or 0))
+        result['sampled_pages'] = [n + 1 for n in sampled]
+
+    result['elapsed_ms'] = round((time.perf_counter() - start) * 1000, 2)
+    logger.info(f"Probe: {result['page_count']} pages, {len(result['images'])} images, "
+                f"~{result['scanned_pages_estimate']} scanned, estimated {result['estimated_ms']} ms "
+                f"(probed in {result['elapsed_ms']} ms)")
+    return result
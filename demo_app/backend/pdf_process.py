@@ -4,6 +4,11 @@ import os
 from dotenv import load_dotenv
 import json
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from prompt_compiler import get_compiled_prompt, field_key, count_tokens, is_selection_field
+from form_prepass import resolve_form_fields
+from chunk_index import format_excerpts
 
 load_dotenv()
 
@@ -22,6 +27,17 @@ gemini_config = {
 gemini_model = os.getenv('GEMINI_MODEL',"gemini-2.0-flash")
 gemini_api_key = os.getenv('GEMINI_API_KEY')
 
+SYSTEM_INSTRUCTION = "You are an expert data extraction assistant specialized in processing manufacturing industry quotation and enquiry forms from PDF documents. The document contains tables, checkboxes, radio buttons, input fields,text fields, and filled-in data also should exacte the data on this pdf."
+
+# Retrieved excerpts stand in for the attached PDF when a chunk index is used
+RETRIEVAL_CONTEXT = """The attached PDF is given as the excerpts below, each marked with its page number.
+
+{excerpts}
+
+"""
+# Field groups sent to the model at the same time for one document
+RETRIEVAL_CONCURRENCY = int(os.getenv('RETRIEVAL_CONCURRENCY', '4'))
+
 
 EXTRACTION_PROMPT = """
 SCHEMA NAME: Application details
@@ -211,57 +227,168 @@ def extract_json_from_response(response_text):
         logger.error(f"Response text: {response_text}")
         raise e
 
-def process_single_pdf(file_path, field_definitions):
+def build_extraction_prompt(field_definitions, schema=None, use_compiled_prompt=True):
+    """Return the extraction prompt, compiled per schema version or from the legacy template"""
+    if use_compiled_prompt:
+        return get_compiled_prompt(field_definitions, schema).text
+    field_def_text = format_field_definitions(field_definitions)
+    return EXTRACTION_PROMPT.format(field_definitions=field_def_text)
 
-    try:
-        # Configure Gemini API
-        genai.configure(api_key=gemini_api_key)
-        
-        # Upload PDF to Gemini
-        files = [upload_to_gemini(file_path, mime_type="application/pdf")]
-        wait_for_files_active(files)
-        
-        # Initialize model and chat session
-        model = genai.GenerativeModel(
-            model_name='gemini-2.0-flash',
-            generation_config=gemini_config,
-            system_instruction="You are an expert data extraction assistant specialized in processing manufacturing industry quotation and enquiry forms from PDF documents. The document contains tables, checkboxes, radio buttons, input fields,text fields, and filled-in data also should exacte the data on this pdf."
-        )
-        
-        # Start chat session with the uploaded file
-        chat_session = model.start_chat(history=[{"role": "user", "parts": [files[0]]}])
-        
-        # Format field definitions for the prompt
-        field_def_text = format_field_definitions(field_definitions)
+def extract_with_model(file_path, field_definitions, schema=None, use_compiled_prompt=True):
+    """Ask Gemini for the given fields and return the parsed JSON data"""
+    # Configure Gemini API
+    genai.configure(api_key=gemini_api_key)
+    
+    # Upload PDF to Gemini
+    files = [upload_to_gemini(file_path, mime_type="application/pdf")]
+    wait_for_files_active(files)
+    
+    # Initialize model and chat session
+    model = genai.GenerativeModel(
+        model_name='gemini-2.0-flash',
+        generation_config=gemini_config,
+        system_instruction=SYSTEM_INSTRUCTION
+    )
+    
+    # Start chat session with the uploaded file
+    chat_session = model.start_chat(history=[{"role": "user", "parts": [files[0]]}])
+    
+    # Create extraction prompt (cached per schema id and version)
+    extraction_prompt = build_extraction_prompt(field_definitions, schema, use_compiled_prompt)
+    logger.debug(f"Extraction prompt:\n{extraction_prompt}")
+    
+    # Send extraction request
+    extraction_response = chat_session.send_message(extraction_prompt)
+    logger.debug(f"Model response:\n{extraction_response.text}")
+    # Extract JSON data from response
+    return extract_json_from_response(extraction_response.text)
 
-        print(field_def_text)
+def extract_with_context(chunks, field_definitions, schema=None, use_compiled_prompt=True):
+    """Ask Gemini for the given fields from retrieved text chunks instead of the uploaded PDF"""
+    genai.configure(api_key=gemini_api_key)
+    model = genai.GenerativeModel(
+        model_name='gemini-2.0-flash',
+        generation_config=gemini_config,
+        system_instruction=SYSTEM_INSTRUCTION
+    )
+    chat_session = model.start_chat(history=[])
+    prompt = RETRIEVAL_CONTEXT.format(excerpts=format_excerpts(chunks))
+    prompt += build_extraction_prompt(field_definitions, schema, use_compiled_prompt)
+    response = chat_session.send_message(prompt)
+    # Keep only this group's fields; other groups answer the rest
+    keys = {field_key(field) for field in field_definitions}
+    return {key: value for key, value in extract_json_from_response(response.text).items() if key in keys}, prompt
+
+def extract_with_retrieval(file_path, field_definitions, chunk_index, schema=None, use_compiled_prompt=True):
+    """
+    Ask Gemini for the given fields group by group, each with only the top-k chunks of
+    the document for its fields. Returns (data, retrieval stats), or None when the
+    document is too small or has no text layer and should be sent whole.
+    """
+    retrieval = chunk_index.retrieve(file_path, field_definitions)
+    if retrieval is None:
+        return None
+    groups = retrieval.pop('groups')
+    with ThreadPoolExecutor(max_workers=max(1, min(RETRIEVAL_CONCURRENCY, len(groups)))) as executor:
+        answers = list(executor.map(
+            lambda group: extract_with_context(group['chunks'], group['fields'], schema, use_compiled_prompt), groups))
+    data = {}
+    for group_data, _ in answers:
+        data.update(group_data)
+    retrieval.update({
+        'groups': len(groups),
+        'chunks_sent': sum(len(group['chunks']) for group in groups),
+        'prompt_tokens': sum(count_tokens(prompt) for _, prompt in answers),
+    })
+    logger.info(f"Retrieval sent {retrieval['chunks_sent']} of {retrieval['chunks_total']} chunks in "
+                f"{retrieval['groups']} groups (~{retrieval['prompt_tokens']} prompt tokens, document "
+                f"~{retrieval['document_tokens']} tokens)")
+    return data, retrieval
+
+def process_single_pdf(file_path, field_definitions, schema=None, use_compiled_prompt=True, use_form_prepass=True,
+                       template_registry=None, chunk_index=None):
+    """
+    Extract schema fields from a PDF.
+
+    Fields backed by AcroForm widgets or by checkbox/radio marks on flattened pages
+    are answered locally by the form pre-pass. If a template registry is given and
+    the PDF matches a known layout, text fields are then read by the template's
+    coordinates. Only the remaining fields are sent to the model: with a chunk index and
+    no checkbox/radio field among them, as the document chunks retrieved for each group
+    of fields ('retrieval' holds the sizes); otherwise with the whole PDF attached, since
+    text chunks carry no selection state. 'provenance' records which source ('widget',
+    'mark', 'template' or 'model') produced each field.
+    """
+    prepass = {'values': {}, 'matches': {}}
+    template_match = None
+    retrieval = None
+    try:
+        if use_form_prepass:
+            prepass = resolve_form_fields(file_path, field_definitions)
         
+        data = dict(prepass['values'])
+        provenance = {key: match['source'] for key, match in prepass['matches'].items()}
         
-        # Create extraction prompt
-        extraction_prompt = EXTRACTION_PROMPT.format(field_definitions=field_def_text)
-        print(extraction_prompt)
+        # Known layouts answer text fields from the template's field regions
+        if template_registry is not None:
+            pending_keys = [field_key(field) for field in field_definitions if field_key(field) not in data]
+            template_match = template_registry.apply(file_path, pending_keys) if pending_keys else None
+            if template_match:
+                for key, value in template_match['values'].items():
+                    data[key] = value
+                    provenance[key] = 'template'
         
-        # Send extraction request
-        extraction_response = chat_session.send_message(extraction_prompt)
-        print(extraction_response.text)
-        # Extract JSON data from response
-        extraction_json_data = extract_json_from_response(extraction_response.text)
+        # Only fields the local passes could not answer go to the model
+        unresolved_fields = [field for field in field_definitions if field_key(field) not in data]
+        model_ms = None
+        if unresolved_fields:
+            model_start = time.perf_counter()
+            answered = None
+            # Once one field needs the PDF attached, retrieved chunks for the others would only add tokens
+            if chunk_index is not None and not any(is_selection_field(field) for field in unresolved_fields):
+                answered = extract_with_retrieval(file_path, unresolved_fields, chunk_index, schema, use_compiled_prompt)
+            if answered is not None:
+                model_data, retrieval = answered
+            else:
+                model_data = extract_with_model(file_path, unresolved_fields, schema, use_compiled_prompt)
+            model_ms = (time.perf_counter() - model_start) * 1000
+            for key, value in model_data.items():
+                data.setdefault(key, value)
+                provenance.setdefault(key, 'model')
+            if template_registry is not None:
+                template_registry.record_model_call(model_ms)
+        if template_match:
+            template_registry.record_outcome(len(template_match['values']), len(unresolved_fields),
+                                             template_match['elapsed_ms'], model_ms)
         
-        logger.info(f"Successfully processed PDF: {file_path}")
+        logger.info(f"Successfully processed PDF: {file_path} "
+                    f"({len(field_definitions) - len(unresolved_fields)} local, {len(unresolved_fields)} model fields)")
         return {
             'status': 'success',
-            'data': extraction_json_data,
+            'data': data,
+            'provenance': provenance,
+            'widget_matches': prepass['matches'],
+            'template': {k: v for k, v in template_match.items() if k != 'values'} if template_match else None,
+            'retrieval': retrieval,
             'file_path': file_path
         }
         
     except Exception as e:
         logger.error(f"Error processing PDF {file_path}: {str(e)}")
         print(e)
-        # Return empty data with field names in case of error
-        empty_data = {field.get('name', ''): None for field in field_definitions}
+        # Return empty data with field names in case of error, keeping anything answered locally
+        empty_data = {field_key(field): None for field in field_definitions}
+        empty_data.update(prepass['values'])
+        provenance = {key: match['source'] for key, match in prepass['matches'].items()}
+        if template_match:
+            empty_data.update(template_match['values'])
+            provenance.update({key: 'template' for key in template_match['values']})
         return {
             'status': 'error',
             'data': empty_data,
+            'provenance': provenance,
+            'widget_matches': prepass['matches'],
+            'template': {k: v for k, v in template_match.items() if k != 'values'} if template_match else None,
             'file_path': file_path,
             'error': str(e)
         }
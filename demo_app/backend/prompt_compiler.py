@@ -0,0 +1,244 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from dataclasses import dataclass, field
+
+logger = logging.getLogger(__name__)
+
+# Warn when a compiled prompt grows past this many (approximate) tokens
+PROMPT_TOKEN_BUDGET = int(os.getenv('PROMPT_TOKEN_BUDGET', '1200'))
+
+PROMPT_HEADER = """SCHEMA NAME: {schema_name}
+Extract the fields below from the attached PDF. Return ONLY a valid JSON object whose keys are exactly the field names listed. Do not infer or guess: if a field is not clearly present, its value is null.
+
+FIELD DEFINITIONS:
+{field_definitions}
+"""
+
+PROMPT_SELECTION_RULES = """SELECTIONS:
+- Only report options that are visibly checked, filled or selected; ignore unselected ones.
+- Fields that depend on an option marked "No"/unselected must be null.
+"""
+
+PROMPT_FOOTER = """Return only the JSON object."""
+
+# Extraction rule per schema field type
+FIELD_TYPE_RULES = {
+    'text': 'text: the exact text as printed',
+    'number': 'number: a numeric value without units',
+    'percentage': 'percentage: the numeric value without the % sign',
+    'currency': 'currency: the numeric amount without currency symbols',
+    'date': 'date: ISO format YYYY-MM-DD',
+    'email': 'email: the address exactly as printed',
+    'phone': 'phone: the number including country code if shown',
+    'checkbox': 'checkbox: a list of the checked option labels',
+    'radio': 'radio: the selected option label',
+    'table': 'table: a list of row objects keyed by the column headers; skip empty rows',
+}
+
+# Examples are only included when a field in the schema needs them
+PROMPT_EXAMPLES = {
+    'checkbox': 'Checkbox: "☐ ASTM ⬛ ISO ☐ Will be provided" -> ["ISO"]',
+    'radio': 'Radio: "3 Phase, 1 neutral: ● Yes ○ No" -> "Yes"',
+    'range': 'Min/Max: "Relative humidity at site: Min 25 % Max 55 %" -> {"min": "25", "max": "55"}',
+    'table': ('Table: | Sl | Raw material Name | Feed rate % | with row | 1 | LLDPE | 37.65 | '
+              '-> [{"Sl": "1", "Raw material Name": "LLDPE", "Feed rate %": "37.65"}]'),
+}
+
+# Keyword hints used to pick examples for schemas that only use the "text" type
+EXAMPLE_HINTS = {
+    'checkbox': re.compile(r'\b(application|method|scope|usage|form|options?|select\w*|check\w*)\b', re.IGNORECASE),
+    'radio': re.compile(r'\b(yes|no|available|required|willing|phase|if yes|bench ?mark|trial|hazardous)\b', re.IGNORECASE),
+    'range': re.compile(r'\b(min|max|minimum|maximum|range|temperature|humidity)\b', re.IGNORECASE),
+    'table': re.compile(r'\b(table|rows?|raw material|formulation|formulaon|items?|line items?)\b', re.IGNORECASE),
+}
+
+SELECTION_TYPES = {'checkbox', 'radio'}
+
+# Rough BPE-style approximation: words split into ~4 character pieces, punctuation counts alone
+_TOKEN_PATTERN = re.compile(r"[A-Za-z]+|\d|[^\sA-Za-z\d]")
+
+
+def count_tokens(text):
+    """Approximate the number of model tokens in text without calling the API"""
+    tokens = 0
+    for match in _TOKEN_PATTERN.finditer(text):
+        piece = match.group()
+        tokens += (len(piece) + 3) // 4 if piece.isalpha() else 1
+    return tokens
+
+
+@dataclass
+class CompiledPrompt:
+    """A compiled extraction prompt for one schema version"""
+    text: str
+    token_count: int
+    examples: list = field(default_factory=list)
+    over_budget: bool = False
+
+
+_prompt_cache = {}
+_prompt_cache_lock = threading.Lock()
+
+
+def fields_fingerprint(field_definitions):
+    """Stable hash of a field list, used when a schema has no id/version"""
+    payload = json.dumps(field_definitions, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def field_key(field_def):
+    """Key the model is asked to use for a field in its JSON response"""
+    return field_def.get('name', '').strip().lower()
+
+
+def _field_type(field_def):
+    return (field_def.get('type') or 'text').lower()
+
+
+def is_selection_field(field_def):
+    """Checkbox/radio field, by type or, for schemas typing everything as text, by the example hints"""
+    field_type = _field_type(field_def)
+    if field_type in SELECTION_TYPES:
+        return True
+    hint_text = f"{field_def.get('name', '')} {field_def.get('description', '')}"
+    return field_type == 'text' and any(EXAMPLE_HINTS[kind].search(hint_text) for kind in SELECTION_TYPES)
+
+
+def _select_examples(field_definitions):
+    """Pick the examples relevant to the schema's field types and names"""
+    selected = []
+    for key in PROMPT_EXAMPLES:
+        for field_def in field_definitions:
+            field_type = _field_type(field_def)
+            hint_text = f"{field_def.get('name', '')} {field_def.get('description', '')}"
+            if field_type == key or (field_type == 'text' and EXAMPLE_HINTS[key].search(hint_text)):
+                selected.append(key)
+                break
+    return selected
+
+
+def _format_field_line(index, field_def):
+    name = field_key(field_def)
+    field_type = _field_type(field_def)
+    line = f"{index}. {name} ({field_type})"
+    description = field_def.get('description', '').strip()
+    if description:
+        # Keep only the location hint if present, as format_field_definitions did
+        if 'Location:' in description:
+            description = 'Location: ' + description.split('Location:')[-1].strip()
+        line += f" - {description}"
+    return line
+
+
+def compile_prompt(field_definitions, schema_name='Extraction'):
+    """Build a compact extraction prompt from the field definitions"""
+    field_lines = [_format_field_line(i, f) for i, f in enumerate(field_definitions, 1)]
+    field_types = []
+    for field_def in field_definitions:
+        field_type = _field_type(field_def)
+        if field_type in FIELD_TYPE_RULES and field_type not in field_types:
+            field_types.append(field_type)
+
+    examples = _select_examples(field_definitions)
+
+    sections = [PROMPT_HEADER.format(schema_name=schema_name, field_definitions='\n'.join(field_lines))]
+    sections.append('VALUE FORMATS:\n' + '\n'.join(f"- {FIELD_TYPE_RULES[t]}" for t in field_types) + '\n')
+    if SELECTION_TYPES & set(field_types) or {'checkbox', 'radio'} & set(examples):
+        sections.append(PROMPT_SELECTION_RULES)
+    if examples:
+        sections.append('EXAMPLES:\n' + '\n'.join(f"- {PROMPT_EXAMPLES[e]}" for e in examples) + '\n')
+    sections.append(PROMPT_FOOTER)
+
+    text = '\n'.join(sections)
+    token_count = count_tokens(text)
+    over_budget = token_count > PROMPT_TOKEN_BUDGET
+    if over_budget:
+        logger.warning(f"Prompt for schema '{schema_name}' is ~{token_count} tokens, "
+                       f"over the budget of {PROMPT_TOKEN_BUDGET}")
+    return CompiledPrompt(text=text, token_count=token_count, examples=examples, over_budget=over_budget)
+
+
+def get_compiled_prompt(field_definitions, schema=None):
+    """Return the cached prompt for (schema id, version), compiling it on first use"""
+    schema = schema or {}
+    if schema.get('fields') is not None and field_definitions != schema['fields']:
+        # A subset of the schema (e.g. fields left after the form pre-pass) gets its own entry
+        schema = {'name': schema.get('name', 'Extraction')}
+    schema_id = schema.get('id') or fields_fingerprint(field_definitions)
+    version = schema.get('version') or schema.get('updated_at') or fields_fingerprint(field_definitions)
+    cache_key = (schema_id, version)
+
+    with _prompt_cache_lock:
+        compiled = _prompt_cache.get(cache_key)
+    if compiled is None:
+        compiled = compile_prompt(field_definitions, schema.get('name', 'Extraction'))
+        with _prompt_cache_lock:
+            _prompt_cache[cache_key] = compiled
+        logger.info(f"Compiled prompt for schema {schema_id} v{version}: ~{compiled.token_count} tokens")
+    return compiled
+
+
+def clear_prompt_cache():
+    """Drop all compiled prompts"""
+    with _prompt_cache_lock:
+        _prompt_cache.clear()
+
+
+def compare_with_legacy(field_definitions, schema=None):
+    """Compare the compiled prompt size against the legacy EXTRACTION_PROMPT template"""
+    from pdf_process import EXTRACTION_PROMPT, format_field_definitions
+
+    legacy_text = EXTRACTION_PROMPT.format(field_definitions=format_field_definitions(field_definitions))
+    compiled = get_compiled_prompt(field_definitions, schema)
+    legacy_tokens = count_tokens(legacy_text)
+    return {
+        'legacy_chars': len(legacy_text),
+        'legacy_tokens': legacy_tokens,
+        'compiled_chars': len(compiled.text),
+        'compiled_tokens': compiled.token_count,
+        'token_reduction': round(1 - compiled.token_count / legacy_tokens, 3) if legacy_tokens else 0.0,
+        'examples': compiled.examples,
+    }
+
+
+if __name__ == '__main__':
+    import sys
+
+    # Prompt size comparison for every stored schema; pass --with-model to also compare
+    # the model output of both prompts on the sample docs (needs GEMINI_API_KEY)
+    schemas_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'schemas')
+    schemas = []
+    for filename in sorted(os.listdir(schemas_dir)):
+        if filename.endswith('.json'):
+            with open(os.path.join(schemas_dir, filename), 'r') as f:
+                schemas.append(json.load(f))
+
+    for schema in schemas:
+        report = compare_with_legacy(schema['fields'], schema)
+        print(f"{schema['name']:<30} legacy ~{report['legacy_tokens']:>5} tokens  "
+              f"compiled ~{report['compiled_tokens']:>5} tokens  "
+              f"(-{report['token_reduction']:.0%}, examples: {', '.join(report['examples']) or 'none'})")
+
+    if '--with-model' in sys.argv:
+        from pdf_process import process_single_pdf
+
+        sample_docs_dir = os.path.join(os.path.dirname(schemas_dir), '..', '..', 'sample_docs')
+        for pdf_name in sorted(os.listdir(sample_docs_dir)):
+            pdf_path = os.path.join(sample_docs_dir, pdf_name)
+            for schema in schemas:
+                legacy = process_single_pdf(pdf_path, schema['fields'], schema,
+                                            use_compiled_prompt=False, use_form_prepass=False)
+                compiled = process_single_pdf(pdf_path, schema['fields'], schema,
+                                              use_compiled_prompt=True, use_form_prepass=False)
+                legacy_data = legacy['data'] or {}
+                compiled_data = compiled['data'] or {}
+                keys = set(legacy_data) | set(compiled_data)
+                agree = sum(1 for k in keys if legacy_data.get(k) == compiled_data.get(k))
+                filled_legacy = sum(1 for v in legacy_data.values() if v not in (None, '', []))
+                filled_compiled = sum(1 for v in compiled_data.values() if v not in (None, '', []))
+                print(f"{pdf_name[:40]:<40} {schema['name'][:25]:<25} agreement {agree}/{len(keys)}  "
+                      f"filled legacy {filled_legacy} compiled {filled_compiled}")
@@ -0,0 +1,187 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from prompt_compiler import field_key
+from pdf_process import process_single_pdf
+
+logger = logging.getLogger(__name__)
+
+# Documents re-extracted at the same time across all jobs (bounds concurrent model calls)
+REEXTRACT_CONCURRENCY = int(os.getenv('REEXTRACT_CONCURRENCY', '4'))
+
+
+def _field_signature(field_def):
+    # What the model sees of a field; a change here invalidates stored values
+    return ((field_def.get('type') or 'text').lower(), field_def.get('description', '').strip())
+
+
+def diff_fields(old_fields, new_fields):
+    """
+    Compare two field lists by field key.
+
+    Returns {'added', 'changed', 'removed', 'unchanged'} as lists of keys. A renamed
+    field shows up as removed plus added.
+    """
+    old = {field_key(f): _field_signature(f) for f in old_fields}
+    new = {field_key(f): _field_signature(f) for f in new_fields}
+    return {
+        'added': [k for k in new if k not in old],
+        'changed': [k for k in new if k in old and new[k] != old[k]],
+        'removed': [k for k in old if k not in new],
+        'unchanged': [k for k in new if k in old and new[k] == old[k]],
+    }
+
+
+class ReextractionManager:
+    """
+    Runs incremental re-extraction jobs after a schema edit.
+
+    Each stored result on the schema is diffed against the fields it was extracted
+    with; only added or changed fields are sent through the pipeline again, values of
+    unchanged fields are reused and removed fields are dropped.
+    """
+
+    def __init__(self, results_folder, upload_folder, template_registry=None, chunk_index=None,
+                 max_workers=REEXTRACT_CONCURRENCY):
+        self.results_folder = results_folder
+        self.upload_folder = upload_folder
+        self.template_registry = template_registry
+        self.chunk_index = chunk_index
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='reextract')
+        self.jobs = {}
+        self._lock = threading.Lock()
+        # Result files being rewritten, so overlapping jobs never interleave on one file
+        self._result_locks = {}
+
+    def _result_lock(self, result_id):
+        with self._lock:
+            return self._result_locks.setdefault(result_id, threading.Lock())
+
+    def _find_upload(self, session_id):
+        for filename in os.listdir(self.upload_folder):
+            if filename.startswith(session_id):
+                return os.path.join(self.upload_folder, filename)
+        return None
+
+    def _results_for_schema(self, schema_id):
+        result_ids = []
+        for filename in os.listdir(self.results_folder):
+            if filename.endswith('.json'):
+                with open(os.path.join(self.results_folder, filename), 'r') as f:
+                    if json.load(f).get('schema_id') == schema_id:
+                        result_ids.append(filename[:-5])
+        return result_ids
+
+    def start(self, schema, old_fields):
+        """Queue re-extraction of every stored result on the schema; returns the job, or None if nothing changed"""
+        diff = diff_fields(old_fields, schema['fields'])
+        if not (diff['added'] or diff['changed'] or diff['removed']):
+            return None
+
+        result_ids = self._results_for_schema(schema['id'])
+        job = {
+            'id': str(uuid.uuid4()),
+            'schema_id': schema['id'],
+            'schema_version': schema.get('version', 1),
+            'diff': diff,
+            'status': 'running' if result_ids else 'completed',
+            'total': len(result_ids),
+            'completed': 0,
+            'failed': 0,
+            'skipped': 0,
+            'fields_extracted': 0,
+            'fields_reused': 0,
+            'errors': [],
+            'started_at': datetime.now().isoformat(),
+            'finished_at': None if result_ids else datetime.now().isoformat(),
+            'elapsed_ms': 0.0,
+        }
+        with self._lock:
+            # A newer schema version supersedes jobs still queued for an older one
+            for other in self.jobs.values():
+                if other['schema_id'] == schema['id'] and other['status'] == 'running':
+                    other['status'] = 'superseded'
+            self.jobs[job['id']] = job
+
+        start = time.perf_counter()
+        for result_id in result_ids:
+            self.executor.submit(self._run_one, job, schema, old_fields, result_id, start)
+        logger.info(f"Re-extraction job {job['id']} for schema {schema['id']} v{job['schema_version']}: "
+                    f"{len(result_ids)} results, added {diff['added']}, changed {diff['changed']}, "
+                    f"removed {diff['removed']}")
+        return job
+
+    def _run_one(self, job, schema, old_fields, result_id, start):
+        outcome = 'skipped'
+        try:
+            if job['status'] == 'superseded':
+                return
+            with self._result_lock(result_id):
+                outcome = self.reextract_result(result_id, schema, old_fields, job)
+        except Exception as e:
+            outcome = 'failed'
+            logger.error(f"Re-extraction of result {result_id} failed: {str(e)}")
+            with self._lock:
+                job['errors'].append({'result_id': result_id, 'error': str(e)})
+        finally:
+            with self._lock:
+                job[outcome] += 1
+                job['elapsed_ms'] = round((time.perf_counter() - start) * 1000, 2)
+                if job['completed'] + job['failed'] + job['skipped'] == job['total'] and job['status'] == 'running':
+                    job['status'] = 'completed'
+                    job['finished_at'] = datetime.now().isoformat()
+
+    def reextract_result(self, result_id, schema, old_fields, job=None):
+        """Bring one stored result up to the schema's current fields; returns 'completed' or 'skipped'"""
+        result_file = os.path.join(self.results_folder, f'{result_id}.json')
+        with open(result_file, 'r') as f:
+            result_data = json.load(f)
+
+        # Diff against the fields this result was actually extracted with
+        diff = diff_fields(result_data.get('schema_fields', old_fields), schema['fields'])
+        stale = set(diff['changed']) | set(diff['removed'])
+        wanted = set(diff['added']) | set(diff['changed'])
+        fields_to_extract = [f for f in schema['fields'] if field_key(f) in wanted]
+
+        uploaded_file = self._find_upload(result_data['session_id']) if fields_to_extract else None
+        if fields_to_extract and not uploaded_file:
+            return 'skipped'
+
+        for entry in result_data['results']:
+            data = {k: v for k, v in entry['data'].items() if k not in stale}
+            provenance = {k: v for k, v in entry.get('provenance', {}).items() if k not in stale}
+            if fields_to_extract:
+                result = process_single_pdf(uploaded_file, fields_to_extract, schema,
+                                            template_registry=self.template_registry,
+                                            chunk_index=self.chunk_index)
+                if result['status'] != 'success':
+                    raise Exception(result.get('error') or 'extraction failed')
+                data.update(result['data'])
+                provenance.update(result.get('provenance', {}))
+            entry['data'] = data
+            entry['provenance'] = provenance
+            if job is not None:
+                with self._lock:
+                    job['fields_extracted'] += len(fields_to_extract)
+                    job['fields_reused'] += len(diff['unchanged'])
+
+        result_data.update({
+            'schema_name': schema['name'],
+            'schema_version': schema.get('version', 1),
+            'schema_fields': schema['fields'],
+            'reextracted_at': datetime.now().isoformat(),
+        })
+        with open(result_file, 'w') as f:
+            json.dump(result_data, f, indent=2)
+        return 'completed'
+
+    def get_job(self, job_id):
+        with self._lock:
+            job = self.jobs.get(job_id)
+            return json.loads(json.dumps(job)) if job else None
@@ -0,0 +1,410 @@
+import atexit
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from datetime import datetime
+
+import fitz  # PyMuPDF
+
+from form_layout import normalize_label
+from form_prepass import collect_mark_candidates, collect_widget_candidates
+
+logger = logging.getLogger(__name__)
+
+# Minimum layout similarity for an upload to be treated as a known template
+MATCH_THRESHOLD = 0.75
+# Minimum confidence for a field read by template coordinates; lower goes to the model
+FIELD_CONFIDENCE_THRESHOLD = 0.6
+
+# Grid (pt) used to quantize anchor words and drawing skeleton rects
+ANCHOR_GRID = 10
+SKELETON_GRID = 5
+# Only drawings at least this long are layout (rules, frames, table grids); smaller ones are marks
+SKELETON_MIN_SIZE = 20
+# Pages used for the fingerprint; recurring forms differ from each other on the first pages already
+FINGERPRINT_PAGES = 3
+# Anchor may move this far (pt) and still count as in place
+ANCHOR_TOLERANCE = 5
+# Lookup statistics are written at most this often (seconds); the rest is flushed at exit
+STATS_SAVE_INTERVAL = 5.0
+# Schema field types answered by marks, not by text the template could read
+SELECTION_FIELD_TYPES = {'checkbox', 'radio'}
+
+_ANCHOR_WORD = re.compile(r'^[A-Za-z][A-Za-z/&.:()-]{2,}$')
+
+
+def _jaccard(a, b):
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def fingerprint_document(doc):
+    """
+    Layout fingerprint of an open PDF.
+
+    'key' buckets templates by page count and page sizes; 'anchors' (quantized label
+    words) and 'skeleton' (quantized rules and frames) are compared within a bucket.
+    """
+    sizes = [f"{round(page.rect.width)}x{round(page.rect.height)}" for page in doc]
+    anchors = set()
+    skeleton = set()
+    for page in doc:
+        if page.number >= FINGERPRINT_PAGES:
+            break
+        for word in page.get_text('words'):
+            if _ANCHOR_WORD.match(word[4]):
+                anchors.add(f"{page.number}:{word[4].lower()}@{int(word[0] // ANCHOR_GRID)},{int(word[1] // ANCHOR_GRID)}")
+        for drawing in page.get_drawings():
+            rect = drawing['rect']
+            if max(rect.width, rect.height) >= SKELETON_MIN_SIZE:
+                skeleton.add(f"{page.number}:" + ','.join(str(int(v // SKELETON_GRID)) for v in rect))
+    return {
+        'key': f"{len(doc)}|{','.join(sizes)}",
+        'page_count': len(doc),
+        'anchors': anchors,
+        'skeleton': skeleton,
+    }
+
+
+def layout_similarity(fingerprint, template_fingerprint):
+    """Similarity (0..1) of two fingerprints in the same bucket"""
+    anchors = _jaccard(fingerprint['anchors'], template_fingerprint['anchors'])
+    if not fingerprint['skeleton'] and not template_fingerprint['skeleton']:
+        return anchors
+    return 0.6 * anchors + 0.4 * _jaccard(fingerprint['skeleton'], template_fingerprint['skeleton'])
+
+
+def _value_lines(value):
+    if isinstance(value, bool) or value is None or isinstance(value, (list, dict)):
+        return []
+    return [line.strip() for line in str(value).splitlines() if line.strip()]
+
+
+def _locate_value(page, words, lines):
+    """Bounding rect of a (possibly multi-line) value on the page, or None"""
+    tokens = ' '.join(lines).split()
+    texts = [w[4] for w in words]
+    # Prefer a run of whole words, so the region does not start or end mid-word
+    for i in range(len(texts) - len(tokens) + 1):
+        if texts[i:i + len(tokens)] == tokens:
+            rect = fitz.Rect(words[i][:4])
+            for word in words[i + 1:i + len(tokens)]:
+                rect |= fitz.Rect(word[:4])
+            return rect
+    hits = page.search_for(lines[0])
+    if not hits:
+        return None
+    rect = fitz.Rect(hits[0])
+    for line in lines[1:]:
+        below = [r for r in page.search_for(line) if r.y0 >= rect.y0 - 1]
+        if not below:
+            break
+        rect |= min(below, key=lambda r: r.y0)
+    return rect
+
+
+def _read_region(words, rect, multiline):
+    """Text of the words whose centre lies in the region, one line per text line"""
+    lines = {}
+    for word in words:
+        cx, cy = (word[0] + word[2]) / 2, (word[1] + word[3]) / 2
+        if rect.x0 <= cx <= rect.x1 and rect.y0 <= cy <= rect.y1:
+            lines.setdefault((word[5], word[6]), []).append(word[4])
+    text = [' '.join(line) for _, line in sorted(lines.items())]
+    return '\n'.join(text) if multiline else (text[0] if text else '')
+
+
+def _option_labels(doc):
+    """Normalized labels printed next to checkboxes and radio buttons (static text of the form)"""
+    candidates = collect_widget_candidates(doc) if doc.is_form_pdf else []
+    candidates += collect_mark_candidates(doc, skip_pages={c['page'] for c in candidates})
+    labels = set()
+    for candidate in candidates:
+        if candidate['kind'] == 'text':
+            continue
+        for label in candidate['labels'] + candidate.get('options', []):
+            labels.add(normalize_label(label))
+    labels.discard('')
+    return labels
+
+
+def _anchor_for(words, value_rect):
+    """Nearest static word left of the value on its row, else the nearest one above"""
+    static = [w for w in words if not fitz.Rect(w[:4]).intersects(value_rect) and _ANCHOR_WORD.match(w[4])]
+    row = [w for w in static if w[2] <= value_rect.x0 + 1 and abs(w[1] - value_rect.y0) < 6]
+    if row:
+        return max(row, key=lambda w: w[2])
+    above = [w for w in static if w[3] <= value_rect.y0 + 1 and w[0] <= value_rect.x1]
+    if above:
+        return min(above, key=lambda w: (value_rect.y0 - w[3]) + abs(w[0] - value_rect.x0) / 4)
+    return None
+
+
+def _field_region(page, words, value_rect):
+    """Value rect widened to the right up to the next static word on the row (values vary in length)"""
+    right = [w[0] for w in words if w[0] >= value_rect.x1 + 2 and abs(w[1] - value_rect.y0) < 6
+             and not fitz.Rect(w[:4]).intersects(value_rect)]
+    x1 = min(right, default=page.rect.x1 - 20) - 1
+    return fitz.Rect(value_rect.x0 - 1, value_rect.y0 - 1, max(x1, value_rect.x1 + 1), value_rect.y1 + 1)
+
+
+class TemplateRegistry:
+    """
+    Registry of known form layouts, persisted as JSON files in a folder.
+
+    Templates are learned from a verified extraction: each text field stores the
+    region its value occupied and the label word next to it. Matching uploads are
+    read back by those coordinates, shifted by how far the label moved.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.stats_file = os.path.join(folder, 'stats.json')
+        self._lock = threading.Lock()
+        self.templates = {}
+        self._buckets = {}
+        self.stats = {
+            'lookups': 0,
+            'matches': 0,
+            'template_fields': 0,
+            'fallback_fields': 0,
+            'model_calls_skipped': 0,
+            'template_ms': 0.0,
+            'model_calls': 0,
+            'model_ms': 0.0,
+            'latency_saved_ms': 0.0,
+        }
+        self._stats_saved_at = 0.0
+        self._stats_dirty = False
+        os.makedirs(folder, exist_ok=True)
+        self._load()
+        atexit.register(self.flush_stats)
+
+    def _load(self):
+        for filename in os.listdir(self.folder):
+            path = os.path.join(self.folder, filename)
+            if filename == 'stats.json':
+                with open(path, 'r') as f:
+                    self.stats.update(json.load(f))
+            elif filename.endswith('.json'):
+                with open(path, 'r') as f:
+                    self._index(json.load(f))
+
+    def _index(self, template):
+        fingerprint = template['fingerprint']
+        fingerprint['anchors'] = set(fingerprint['anchors'])
+        fingerprint['skeleton'] = set(fingerprint['skeleton'])
+        self.templates[template['id']] = template
+        self._buckets.setdefault(fingerprint['key'], []).append(template['id'])
+
+    def _save_stats(self, force=False):
+        """Write the stats if STATS_SAVE_INTERVAL has passed since the last write (caller holds the lock)"""
+        self._stats_dirty = True
+        now = time.monotonic()
+        if not force and now - self._stats_saved_at < STATS_SAVE_INTERVAL:
+            return
+        with open(self.stats_file, 'w') as f:
+            json.dump(self.stats, f, indent=2)
+        self._stats_saved_at = now
+        self._stats_dirty = False
+
+    def flush_stats(self):
+        with self._lock:
+            if self._stats_dirty:
+                self._save_stats(force=True)
+
+    def learn(self, file_path, verified_data, name=None, source_result_id=None, field_definitions=None):
+        """
+        Create a template from a PDF and its verified field values; returns the template.
+
+        Only free-text values are learned: checkbox/radio fields and values that are
+        option labels printed on the form ("Yes", "Standard IP55") are skipped, since
+        their position says nothing about what is ticked.
+        """
+        selection_keys = {(f.get('name') or '').strip().lower() for f in field_definitions or []
+                          if (f.get('type') or 'text').lower() in SELECTION_FIELD_TYPES}
+        fields = {}
+        with fitz.open(file_path) as doc:
+            fingerprint = fingerprint_document(doc)
+            option_labels = _option_labels(doc)
+            page_words = {}
+            for key, value in verified_data.items():
+                lines = _value_lines(value)
+                if not lines or key in selection_keys or normalize_label(' '.join(lines)) in option_labels:
+                    continue
+                for page in doc:
+                    if page.number not in page_words:
+                        page_words[page.number] = page.get_text('words')
+                    words = page_words[page.number]
+                    rect = _locate_value(page, words, lines)
+                    if rect is None:
+                        continue
+                    anchor = _anchor_for(words, rect)
+                    fields[key] = {
+                        'page': page.number,
+                        'rect': list(_field_region(page, words, rect)),
+                        'anchor': {'text': anchor[4], 'x0': anchor[0], 'y0': anchor[1]} if anchor else None,
+                        'multiline': len(lines) > 1,
+                        'numeric': bool(re.fullmatch(r'[\d.,\s%-]+', lines[0])),
+                    }
+                    break
+
+        template = {
+            'id': str(uuid.uuid4()),
+            'name': name or os.path.basename(file_path),
+            'source_result_id': source_result_id,
+            'created_at': datetime.now().isoformat(),
+            'fingerprint': {
+                'key': fingerprint['key'],
+                'page_count': fingerprint['page_count'],
+                'anchors': sorted(fingerprint['anchors']),
+                'skeleton': sorted(fingerprint['skeleton']),
+            },
+            'fields': fields,
+        }
+        with self._lock:
+            with open(os.path.join(self.folder, f"{template['id']}.json"), 'w') as f:
+                json.dump(template, f, indent=2)
+            self._index(json.loads(json.dumps(template)))
+        logger.info(f"Learned template '{template['name']}' with {len(fields)} located fields "
+                    f"(of {len(verified_data)} verified)")
+        return template
+
+    def delete(self, template_id):
+        with self._lock:
+            template = self.templates.pop(template_id, None)
+            if template is None:
+                return False
+            self._buckets[template['fingerprint']['key']].remove(template_id)
+            os.remove(os.path.join(self.folder, f'{template_id}.json'))
+        return True
+
+    def match(self, fingerprint):
+        """Best template for a fingerprint as (template, similarity), or (None, best similarity)"""
+        best, best_score = None, 0.0
+        for template_id in self._buckets.get(fingerprint['key'], []):
+            score = layout_similarity(fingerprint, self.templates[template_id]['fingerprint'])
+            if score > best_score:
+                best, best_score = self.templates[template_id], score
+        if best_score < MATCH_THRESHOLD:
+            return None, best_score
+        return best, best_score
+
+    def extract(self, doc, template, field_keys):
+        """Read fields by template coordinates; returns {key: (value, confidence)}"""
+        values = {}
+        page_words = {}
+        for key in field_keys:
+            spec = template['fields'].get(key)
+            if spec is None or spec['page'] >= len(doc):
+                continue
+            page = doc[spec['page']]
+            rect = fitz.Rect(spec['rect'])
+            confidence = 0.5
+            anchor = spec.get('anchor')
+            if spec['page'] not in page_words:
+                page_words[spec['page']] = page.get_text('words')
+            words = page_words[spec['page']]
+            if anchor:
+                found = [w for w in words if w[4] == anchor['text']]
+                if found:
+                    nearest = min(found, key=lambda w: abs(w[0] - anchor['x0']) + abs(w[1] - anchor['y0']))
+                    dx, dy = nearest[0] - anchor['x0'], nearest[1] - anchor['y0']
+                    in_place = abs(dx) <= ANCHOR_TOLERANCE and abs(dy) <= ANCHOR_TOLERANCE
+                    confidence = 0.95 if in_place else 0.7
+                    rect = fitz.Rect(rect.x0 + dx, rect.y0 + dy, rect.x1 + dx, rect.y1 + dy)
+                else:
+                    confidence = 0.3
+            text = _read_region(words, rect, spec.get('multiline'))
+            if not text:
+                confidence = 0.0
+            elif spec.get('numeric') and not re.fullmatch(r'[\d.,\s%-]+', text):
+                confidence = min(confidence, 0.4)
+            values[key] = (text or None, confidence)
+        return values
+
+    def apply(self, file_path, field_keys):
+        """
+        Match a PDF against the registry and read the requested fields.
+
+        Returns {'template_id', 'similarity', 'values', 'confidence', 'elapsed_ms'} where
+        'values' only holds fields read with enough confidence; None if nothing matched.
+        """
+        with self._lock:
+            if not self.templates:
+                # Nothing learned yet: no need to open and fingerprint the upload
+                return None
+        start = time.perf_counter()
+        with fitz.open(file_path) as doc:
+            fingerprint = fingerprint_document(doc)
+            lookup_start = time.perf_counter()
+            with self._lock:
+                template, similarity = self.match(fingerprint)
+            lookup_ms = (time.perf_counter() - lookup_start) * 1000
+            extracted = self.extract(doc, template, field_keys) if template else {}
+
+        with self._lock:
+            self.stats['lookups'] += 1
+            if template:
+                self.stats['matches'] += 1
+            self._save_stats()
+        if template is None:
+            logger.info(f"No template match for {file_path} (best similarity {similarity:.2f}, "
+                        f"lookup {lookup_ms:.3f} ms)")
+            return None
+
+        values = {k: v for k, (v, c) in extracted.items() if c >= FIELD_CONFIDENCE_THRESHOLD}
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        logger.info(f"Matched template '{template['name']}' (similarity {similarity:.2f}, lookup {lookup_ms:.3f} ms): "
+                    f"{len(values)}/{len(field_keys)} fields read in {elapsed_ms:.1f} ms")
+        return {
+            'template_id': template['id'],
+            'similarity': round(similarity, 3),
+            'values': values,
+            'confidence': {k: round(c, 2) for k, (v, c) in extracted.items()},
+            'elapsed_ms': round(elapsed_ms, 2),
+        }
+
+    def record_outcome(self, template_fields, fallback_fields, template_ms, model_ms=None):
+        """Track field counts and latency for a matched document; model_ms is None when the model was skipped"""
+        with self._lock:
+            self.stats['template_fields'] += template_fields
+            self.stats['fallback_fields'] += fallback_fields
+            self.stats['template_ms'] += template_ms
+            if model_ms is None:
+                self.stats['model_calls_skipped'] += 1
+                if self.stats['model_calls']:
+                    average_model_ms = self.stats['model_ms'] / self.stats['model_calls']
+                    self.stats['latency_saved_ms'] += max(average_model_ms - template_ms, 0.0)
+            self._save_stats()
+
+    def record_model_call(self, model_ms):
+        """Track model latency, used to estimate the latency saved by template matches"""
+        with self._lock:
+            self.stats['model_calls'] += 1
+            self.stats['model_ms'] += model_ms
+            self._save_stats()
+
+    def summary(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['templates'] = len(self.templates)
+        stats['match_rate'] = round(stats['matches'] / stats['lookups'], 3) if stats['lookups'] else 0.0
+        return stats
+
+    def list_templates(self):
+        with self._lock:
+            return [{
+                'id': t['id'],
+                'name': t['name'],
+                'source_result_id': t.get('source_result_id'),
+                'created_at': t['created_at'],
+                'page_count': t['fingerprint']['page_count'],
+                'fields': sorted(t['fields']),
+            } for t in self.templates.values()]
+